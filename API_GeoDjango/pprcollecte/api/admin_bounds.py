@@ -0,0 +1,43 @@
+#  - Emprises et centres précalculés des régions, préfectures et communes
+#
+# Colonnes bbox / centre maintenues par trigger (migration 0006) : lues sans
+# charger les géométries, directement au format de la réponse JSON.
+
+from django.db import connection
+
+
+ADMIN_LEVELS = {
+    'region': {'table': 'regions', 'parent_column': None},
+    'prefecture': {'table': 'prefectures', 'parent_column': 'regions_id'},
+    'commune': {'table': 'communes_rurales', 'parent_column': 'prefectures_id'},
+}
+
+
+def fetch_admin_units(level, ids=None, parent_ids=None):
+    """
+    Unités d'un niveau administratif, triées par nom :
+    [{'id', 'nom', 'parent_id', 'bounds', 'center'}]
+    ids / parent_ids : restreindre à ces identifiants / à ces parents
+    """
+    config = ADMIN_LEVELS[level]
+    parent_column = config['parent_column'] or 'NULL::integer'
+    where = []
+    params = []
+    if ids is not None:
+        where.append('id = ANY(%s)')
+        params.append(list(ids))
+    if parent_ids is not None and config['parent_column']:
+        where.append(f"{config['parent_column']} = ANY(%s)")
+        params.append(list(parent_ids))
+
+    sql = f"SELECT id, nom, {parent_column}, bbox, centre FROM {config['table']}"
+    if where:
+        sql += f" WHERE {' AND '.join(where)}"
+    sql += " ORDER BY nom, id"
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            {'id': row[0], 'nom': row[1], 'parent_id': row[2], 'bounds': row[3], 'center': row[4]}
+            for row in cursor.fetchall()
+        ]
@@ -0,0 +1,112 @@
+#  - Table de fermeture administrative en mémoire (région/préfecture -> communes)
+#
+# Le découpage Région -> Préfecture -> Commune ne change presque jamais : il est
+# chargé une fois par processus (une requête) puis servi depuis la mémoire. La
+# version des tables (journal versions_tables_journal) est relue au plus toutes les
+# ADMIN_CLOSURE_CHECK_INTERVAL secondes ; un changement déclenche le rechargement.
+
+import threading
+import time
+
+from django.conf import settings
+from .models import CommuneRurale
+from .response_cache import collectes_cache
+from .versioning import versions_key
+
+
+HIERARCHY_TABLES = ['regions', 'prefectures', 'communes_rurales']
+
+
+class HierarchySnapshot:
+    """
+    Données dérivées du découpage administratif, gardées en mémoire par processus.
+    Les sous-classes implémentent _load() ; _on_reload() est appelé après un
+    rechargement dû à un changement de version (pas au premier chargement).
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _on_reload(self):
+        pass
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return
+            version = versions_key(HIERARCHY_TABLES)
+            if version != self._version:
+                reloaded = self._version is not None
+                self._load()
+                self._version = version
+                if reloaded:
+                    self._on_reload()
+            self._checked_at = now
+
+    def invalidate(self):
+        """Force la relecture de la version au prochain appel"""
+        with self._lock:
+            self._checked_at = 0
+
+
+class CommuneClosure(HierarchySnapshot):
+    """
+    Listes d'identifiants de communes par région et par préfecture.
+    Les listes renvoyées sont partagées : à traiter en lecture seule.
+    """
+
+    def __init__(self, check_interval):
+        super().__init__(check_interval)
+        self._by_region = {}
+        self._by_prefecture = {}
+        self._prefectures_by_region = {}
+
+    def _load(self):
+        by_region = {}
+        by_prefecture = {}
+        prefectures_by_region = {}
+        rows = CommuneRurale.objects.values_list(
+            'id', 'prefectures_id_id', 'prefectures_id__regions_id_id'
+        ).order_by('id')
+        for commune_id, prefecture_id, region_id in rows:
+            if prefecture_id is not None:
+                by_prefecture.setdefault(prefecture_id, []).append(commune_id)
+            if region_id is not None:
+                by_region.setdefault(region_id, []).append(commune_id)
+                prefectures_by_region.setdefault(region_id, set()).add(prefecture_id)
+
+        self._by_region = by_region
+        self._by_prefecture = by_prefecture
+        self._prefectures_by_region = {
+            region_id: sorted(ids) for region_id, ids in prefectures_by_region.items()
+        }
+        print(f"🗺️ Fermeture administrative chargée: {len(rows)} communes, "
+              f"{len(by_prefecture)} préfectures, {len(by_region)} régions")
+
+    def _on_reload(self):
+        # Les réponses mises en cache par région/préfecture ne sont plus exactes
+        collectes_cache.clear()
+
+    def communes_of_region(self, region_id):
+        self._ensure_fresh()
+        return self._by_region.get(int(region_id), [])
+
+    def communes_of_prefecture(self, prefecture_id):
+        self._ensure_fresh()
+        return self._by_prefecture.get(int(prefecture_id), [])
+
+    def prefectures_of_region(self, region_id):
+        self._ensure_fresh()
+        return self._prefectures_by_region.get(int(region_id), [])
+
+
+commune_closure = CommuneClosure(getattr(settings, 'ADMIN_CLOSURE_CHECK_INTERVAL', 5))
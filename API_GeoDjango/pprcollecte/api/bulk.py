@@ -0,0 +1,227 @@
+#  - Création en lot des infrastructures (synchronisation mobile)
+#
+# Un tableau JSON d'éléments est validé élément par élément (erreurs rendues
+# par position), les éléments valides sont insérés par bulk_create dans une
+# seule transaction (ou fusionnés par ON CONFLICT en mode idempotent,
+# ?upsert=1). Une erreur SQL sur le lot (contrainte, déclencheur) fait
+# reprendre l'insertion élément par élément, chacun dans son point de
+# sauvegarde, pour ne rejeter que les éléments fautifs. bulk_create n'émet pas
+# post_save : les données dérivées (géométries généralisées, cache des
+# collectes) sont mises à jour ici.
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.validators import UniqueValidator
+from .registry import upsert_fields
+from .response_cache import collectes_cache
+
+
+def bulk_max_items():
+    return getattr(settings, 'BULK_CREATE_MAX_ITEMS', 5000)
+
+
+def validate_items(serializer_class, items, context, unique_fields=()):
+    """
+    Valide chaque élément avec le sérialiseur du type.
+    unique_fields : champs dont l'unicité est garantie par ON CONFLICT (écriture
+    idempotente), leurs UniqueValidator rejetteraient sinon chaque nouvel envoi.
+    Retourne (données validées par position, erreurs par position)
+    """
+    serializer = serializer_class(context=context)
+    for name in unique_fields:
+        if name in serializer.fields:
+            field = serializer.fields[name]
+            field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+    validated = {}
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = {'non_field_errors': ['Objet JSON attendu']}
+            continue
+        try:
+            validated[index] = serializer.run_validation(item)
+        except ValidationError as e:
+            errors[index] = e.detail
+    return validated, errors
+
+
+def _unique_field_names(model, exclude=()):
+    return [
+        field.name for field in model._meta.concrete_fields
+        if field.unique and not field.primary_key and field.name not in exclude
+    ]
+
+
+def reject_batch_duplicates(model, validated, errors, exclude=()):
+    """
+    Valeurs uniques (code_piste...) présentes plusieurs fois dans le lot : les
+    UniqueValidator ne voient que la base, l'INSERT échouerait pour tout le lot.
+    La première occurrence est gardée, les suivantes sont rejetées (erreur par position).
+    """
+    for name in _unique_field_names(model, exclude):
+        seen = {}
+        for index in sorted(validated):
+            value = validated[index].get(name)
+            value = getattr(value, 'pk', value)
+            if value is None:
+                continue
+            if value in seen:
+                errors[index] = {name: [f"Valeur en double dans le lot (élément {seen[value]})"]}
+                del validated[index]
+            else:
+                seen[value] = index
+
+
+def _upsert_key(data, keys):
+    values = tuple(getattr(data.get(key), 'pk', data.get(key)) for key in keys)
+    return None if None in values else values
+
+
+def reject_incomplete_keys(validated, errors, keys):
+    """
+    Écriture idempotente : un élément sans clé complète (device_id absent...)
+    ne peut pas entrer en conflit (NULL distincts pour l'index unique) et serait
+    dupliqué à chaque envoi rejoué. Il est rejeté, avec une erreur par champ manquant.
+    """
+    for index in sorted(validated):
+        missing = [key for key in keys if _upsert_key(validated[index], [key]) is None]
+        if missing:
+            errors[index] = {key: ["Champ requis pour l'écriture idempotente (?upsert=1)"] for key in missing}
+            del validated[index]
+
+
+def insert_validated(entry, validated, upsert=False):
+    """
+    Insère les données validées {position: données} d'un type du registre.
+    upsert : INSERT ... ON CONFLICT (upsert_fields) DO UPDATE, un envoi rejoué
+    met à jour les lignes déjà reçues au lieu de les dupliquer.
+    Retourne {position: instance}. À appeler dans une transaction.
+    """
+    model = entry['model']
+    batch_size = getattr(settings, 'BULK_CREATE_BATCH_SIZE', 500)
+    if not upsert:
+        positions = list(validated)
+        instances = model.objects.bulk_create(
+            [model(**validated[index]) for index in positions], batch_size=batch_size
+        )
+        return dict(zip(positions, instances))
+
+    keys = upsert_fields(entry)
+    # Une même clé deux fois dans une instruction ON CONFLICT est refusée par
+    # PostgreSQL : la dernière occurrence est écrite, les autres y renvoient
+    last_position = {}
+    for index, data in validated.items():
+        key = _upsert_key(data, keys)
+        if key is not None:
+            last_position[key] = index
+    written_as = {}
+    for index, data in validated.items():
+        key = _upsert_key(data, keys)
+        written_as[index] = last_position[key] if key is not None else index
+
+    positions = sorted(set(written_as.values()))
+    update_fields = [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in keys
+        and field.name != entry.get('date_field', 'created_at')
+    ]
+    instances = model.objects.bulk_create(
+        [model(**validated[index]) for index in positions],
+        batch_size=batch_size,
+        update_conflicts=True, unique_fields=keys, update_fields=update_fields,
+    )
+    written = dict(zip(positions, instances))
+    return {index: written[position] for index, position in written_as.items()}
+
+
+def insert_one_by_one(entry, validated, errors, upsert=False):
+    """
+    Repli après une erreur SQL sur le lot : un point de sauvegarde par élément,
+    les éléments refusés par la base passent dans errors.
+    """
+    created = {}
+    for index in sorted(validated):
+        try:
+            with transaction.atomic():
+                created.update(insert_validated(entry, {index: validated[index]}, upsert=upsert))
+        except DatabaseError as e:
+            errors[index] = {'non_field_errors': [str(e).strip()]}
+    return created
+
+
+def _commune_attname(entry):
+    return entry['model']._meta.get_field(entry.get('commune_field', 'commune_id')).attname
+
+
+def previous_communes(entry, validated, keys):
+    """
+    Communes actuelles des lignes qu'un upsert va réécrire : si la commune change,
+    les réponses en cache de l'ancienne commune sont aussi périmées.
+    """
+    wanted = {key for key in (_upsert_key(data, keys) for data in validated.values()) if key is not None}
+    if not wanted:
+        return set()
+    # Filtre large colonne par colonne, clés exactes vérifiées ensuite
+    lookup = {f"{key}__in": {values[position] for values in wanted} for position, key in enumerate(keys)}
+    rows = entry['model'].objects.filter(**lookup).values_list(*keys, _commune_attname(entry))
+    return {row[-1] for row in rows if tuple(row[:-1]) in wanted}
+
+
+def refresh_derived_data(entry, instances, previous_commune_ids=()):
+    """Équivalent des signaux post_save pour des instances insérées en lot"""
+    if not instances:
+        return
+    type_name = entry['type']
+    commune_attname = _commune_attname(entry)
+    commune_ids = {getattr(instance, commune_attname) for instance in instances} | set(previous_commune_ids)
+    for commune_id in commune_ids:
+        collectes_cache.invalidate(type_name, commune_id)
+
+
+def local_id(item):
+    """Identifiant SQLite du mobile (sqlite_id, ou id pour les pistes et chaussées)"""
+    if not isinstance(item, dict):
+        return None
+    properties = item.get('properties') if isinstance(item.get('properties'), dict) else item
+    return properties.get('sqlite_id', properties.get('id'))
+
+
+def bulk_create(entry, items, context, upsert=False):
+    """
+    Création en lot pour un type du registre (upsert : écriture idempotente).
+    Résultat par élément, dans l'ordre reçu : {'index', 'fid'} ou {'index', 'errors'},
+    plus 'sqlite_id' quand le mobile l'a envoyé.
+    """
+    keys = upsert_fields(entry) if upsert else ()
+    validated, errors = validate_items(
+        entry.get('write_serializer') or entry['serializer'], items, context, unique_fields=keys
+    )
+    reject_incomplete_keys(validated, errors, keys)
+    # En mode idempotent, les doublons de la clé d'upsert sont fusionnés par insert_validated
+    reject_batch_duplicates(entry['model'], validated, errors, exclude=keys)
+
+    with transaction.atomic():
+        previous = previous_communes(entry, validated, keys) if upsert else set()
+        try:
+            with transaction.atomic():
+                created = insert_validated(entry, validated, upsert=upsert)
+        except DatabaseError as e:
+            print(f"⚠️ Lot {entry['type']} refusé ({e}), reprise élément par élément")
+            created = insert_one_by_one(entry, validated, errors, upsert=upsert)
+        instances = list({instance.pk: instance for instance in created.values()}.values())
+        transaction.on_commit(lambda: refresh_derived_data(entry, instances, previous))
+
+    results = []
+    for index, item in enumerate(items):
+        result = {'index': index}
+        if local_id(item) is not None:
+            result['sqlite_id'] = local_id(item)
+        if index in created:
+            result['fid'] = created[index].pk
+        else:
+            result['errors'] = errors[index]
+        results.append(result)
+    mode = 'écriture idempotente' if upsert else 'création en lot'
+    print(f"📦 {mode} {entry['type']}: {len(created)} écrits, {len(errors)} rejetés")
+    return results
@@ -0,0 +1,394 @@
+#  - Paquet hors ligne d'une commune (GeoPackage / SQLite) pour le mobile
+#
+# Un fichier par commune : toutes les couches du registre (pistes et chaussées
+# comprises) et la limite communale, lues en une transaction REPEATABLE READ
+# (instantané cohérent, une requête par couche) et écrites par executemany.
+# Colonnes = schéma SQLite du mobile (database_helper.dart,
+# piste_chaussee_db_helper.dart) : api_id, date_creation, x_point_coupure, ...
+# (MOBILE_COLUMNS), avec downloaded = 1 et synced = 0 ; la géométrie est au
+# format GeoPackage (en-tête GP + WKB), lisible par QGIS.
+#
+# Cache disque : package_info garde l'instantané PostgreSQL de la construction
+# (txid_current_snapshot()). Le paquet est à jour tant qu'aucune ligne ni aucun
+# tombstone de la commune ne porte un sync_txid invisible dans cet instantané
+# (index (commune, sync_txid) de la migration 0011) : une transaction plus
+# ancienne validée après coup est détectée, contrairement à un max(sync_txid).
+# package_info porte aussi le curseur de synchronisation (xmin de l'instantané) :
+# le mobile enchaîne avec les téléchargements différentiels (updated_since=).
+#
+# Construction hors requête : un thread par commune, verrou du processus et
+# verrou consultatif PostgreSQL (pg_try_advisory_lock) entre processus. Pendant
+# la reconstruction, le paquet précédent reste servi (cohérent avec son propre
+# curseur) ; sans paquet, la vue répond 202 + Retry-After.
+
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+from datetime import date, datetime, time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import CommuneRurale, Suppression
+from .registry import INFRASTRUCTURE_TYPES
+
+GPKG_APPLICATION_ID = 0x47504B47  # 'GPKG'
+GPKG_USER_VERSION = 10200         # GeoPackage 1.2
+
+# Espace de clés des verrous consultatifs (pg_try_advisory_lock(espace, commune))
+PACKAGE_LOCK_SPACE = GPKG_APPLICATION_ID
+
+# Champs de l'API -> colonnes du mobile, communs aux couches de points
+MOBILE_POINT_COLUMNS = {
+    'sqlite_id': 'api_id', 'created_at': 'date_creation', 'updated_at': 'date_modification',
+}
+
+# Renommages propres à chaque couche (inverses des _map*ToApi de api_service.dart)
+MOBILE_COLUMNS = {
+    'pistes': {'id': 'api_id', 'communes_rurales_id': 'commune_rurales'},
+    'chaussees': {
+        'fid': 'api_id', 'id': 'sqlite_id', 'type_chaus': 'type_chaussee',
+        'x_debut_ch': 'x_debut_chaussee', 'y_debut_ch': 'y_debut_chaussee',
+        'x_fin_ch': 'x_fin_chaussee', 'y_fin_chau': 'y_fin_chaussee',
+    },
+    'points_coupures': {
+        'cause_coup': 'causes_coupures', 'x_point_co': 'x_point_coupure', 'y_point_co': 'y_point_coupure',
+    },
+    'points_critiques': {
+        'type_point': 'type_point_critique', 'x_point_cr': 'x_point_critique', 'y_point_cr': 'y_point_critique',
+    },
+    'autres_infrastructures': {'x_autre_in': 'x_autre_infrastructure', 'y_autre_in': 'y_autre_infrastructure'},
+    'batiments_administratifs': {'x_batiment': 'x_batiment_administratif', 'y_batiment': 'y_batiment_administratif'},
+    'infrastructures_hydrauliques': {
+        'x_infrastr': 'x_infrastructure_hydraulique', 'y_infrastr': 'y_infrastructure_hydraulique',
+    },
+    'bacs': {
+        'x_debut_tr': 'x_debut_traversee_bac', 'y_debut_tr': 'y_debut_traversee_bac',
+        'x_fin_trav': 'x_fin_traversee_bac', 'y_fin_trav': 'y_fin_traversee_bac', 'nom_cours': 'nom_cours_eau',
+    },
+    'passages_submersibles': {
+        'x_debut_pa': 'x_debut_passage_submersible', 'y_debut_pa': 'y_debut_passage_submersible',
+        'x_fin_pass': 'x_fin_passage_submersible', 'y_fin_pass': 'y_fin_passage_submersible',
+        'type_mater': 'type_materiau',
+    },
+    'ponts': {'situation': 'situation_pont', 'nom_cours': 'nom_cours_eau'},
+    'dalots': {'situation': 'situation_dalot'},
+}
+
+# Colonnes d'état du mobile : donnée téléchargée, rien à renvoyer
+MOBILE_STATE_COLUMNS = [('downloaded', 'INTEGER', 1), ('synced', 'INTEGER', 0)]
+
+SQLITE_TYPES = {
+    'AutoField': 'INTEGER', 'BigAutoField': 'INTEGER', 'IntegerField': 'INTEGER',
+    'BigIntegerField': 'INTEGER', 'SmallIntegerField': 'INTEGER', 'ForeignKey': 'INTEGER',
+    'FloatField': 'REAL', 'DecimalField': 'REAL',
+}
+
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def package_dir():
+    return Path(getattr(settings, 'COMMUNE_PACKAGE_DIR', settings.BASE_DIR / 'cache' / 'packages'))
+
+
+def _commune_column(entry):
+    return entry['model']._meta.get_field(entry.get('commune_field', 'commune_id')).column
+
+
+def _attribute_fields(model):
+    return [field for field in model._meta.concrete_fields if field.name != 'geom']
+
+
+def mobile_column(entry, field_name):
+    """Nom de la colonne SQLite du mobile pour un champ de l'API"""
+    renames = MOBILE_COLUMNS.get(entry['type'], {})
+    if field_name in renames:
+        return renames[field_name]
+    if entry.get('kind') == 'point':
+        return MOBILE_POINT_COLUMNS.get(field_name, field_name)
+    return field_name
+
+
+def _sqlite_type(field):
+    internal = field.get_internal_type()
+    if internal == 'ForeignKey':
+        return 'INTEGER' if field.target_field.get_internal_type() in SQLITE_TYPES else 'TEXT'
+    return SQLITE_TYPES.get(internal, 'TEXT')
+
+
+def _sqlite_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _gpkg_geometry(wkb):
+    """Géométrie GeoPackage : en-tête 'GP', version 0, drapeaux (petit-boutiste, sans emprise), SRID"""
+    if wkb is None:
+        return None
+    return b'GP\x00\x01' + struct.pack('<i', 4326) + bytes(wkb)
+
+
+# Empreinte de la limite communale : emprise maintenue par trigger (migration 0006) et nom
+COMMUNE_HASH_SQL = (
+    f"SELECT coalesce(md5(coalesce(bbox::text, '') || coalesce(nom, '')), '') "
+    f"FROM {CommuneRurale._meta.db_table} WHERE id = %s"
+)
+
+
+def package_is_current(commune_id, snapshot, commune_hash):
+    """
+    Vrai si rien n'a changé dans la commune depuis l'instantané snapshot :
+    aucune ligne ni aucun tombstone dont le sync_txid y est invisible
+    (transaction validée après, ou encore en cours à la construction).
+    """
+    layer_changes = ' OR '.join(
+        f"EXISTS (SELECT 1 FROM {entry['model']._meta.db_table} "
+        f"WHERE {_commune_column(entry)} = %(commune)s "
+        f"AND sync_txid >= txid_snapshot_xmin(%(snapshot)s::txid_snapshot) "
+        f"AND NOT txid_visible_in_snapshot(sync_txid, %(snapshot)s::txid_snapshot))"
+        for entry in INFRASTRUCTURE_TYPES
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""SELECT {layer_changes} OR EXISTS (
+                    SELECT 1 FROM {Suppression._meta.db_table}
+                    WHERE layer = ANY(%(layers)s) AND commune_id = %(commune)s
+                    AND sync_txid >= txid_snapshot_xmin(%(snapshot)s::txid_snapshot)
+                    AND NOT txid_visible_in_snapshot(sync_txid, %(snapshot)s::txid_snapshot))""",
+            {'commune': commune_id, 'snapshot': snapshot,
+             'layers': [entry['model']._meta.db_table for entry in INFRASTRUCTURE_TYPES]},
+        )
+        changed = cursor.fetchone()[0]
+        cursor.execute(COMMUNE_HASH_SQL, [commune_id])
+        row = cursor.fetchone()
+    return not changed and row is not None and row[0] == commune_hash
+
+
+def _create_gpkg_metadata(db):
+    db.execute(f"PRAGMA application_id = {GPKG_APPLICATION_ID}")
+    db.execute(f"PRAGMA user_version = {GPKG_USER_VERSION}")
+    db.execute("""
+        CREATE TABLE gpkg_spatial_ref_sys (
+            srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL,
+            organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT
+        )
+    """)
+    db.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)", [
+        ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+        ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+        ('WGS 84 geodetic', 4326, 'EPSG', 4326,
+         'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],'
+         'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]', None),
+    ])
+    db.execute("""
+        CREATE TABLE gpkg_contents (
+            table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+            description TEXT DEFAULT '', last_change DATETIME NOT NULL,
+            min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER
+        )
+    """)
+    db.execute("""
+        CREATE TABLE gpkg_geometry_columns (
+            table_name TEXT NOT NULL PRIMARY KEY, column_name TEXT NOT NULL,
+            geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL
+        )
+    """)
+
+
+def _write_layer(db, pg_cursor, table_name, columns, select_sql, params, geometry_type, generated_at):
+    """columns : [(nom SQLite, type SQLite)] dans l'ordre du SELECT, la géométrie (WKB) en dernier"""
+    column_defs = ', '.join(f'"{name}" {sql_type}' for name, sql_type in columns)
+    db.execute(f'CREATE TABLE "{table_name}" (gpkg_fid INTEGER PRIMARY KEY AUTOINCREMENT, {column_defs}, geom BLOB)')
+    db.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, last_change, srs_id) "
+               "VALUES (?, 'features', ?, ?, 4326)", (table_name, table_name, generated_at))
+    db.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, 4326, 0, 0)",
+               (table_name, geometry_type))
+
+    column_names = ', '.join(f'"{name}"' for name, _ in columns)
+    placeholders = ', '.join('?' for _ in range(len(columns) + 1))
+    insert_sql = f'INSERT INTO "{table_name}" ({column_names}, geom) VALUES ({placeholders})'
+    pg_cursor.execute(select_sql, params)
+    count = 0
+    chunk_size = getattr(settings, 'STREAMING_CHUNK_SIZE', 2000)
+    while True:
+        rows = pg_cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        db.executemany(insert_sql, [
+            [_sqlite_value(value) for value in row[:-1]] + [_gpkg_geometry(row[-1])]
+            for row in rows
+        ])
+        count += len(rows)
+    return count
+
+
+def build_package(commune_id, path):
+    """Écrit le paquet de la commune dans path (fichier SQLite neuf) ; renvoie sa version"""
+    generated_at = timezone.now().isoformat()
+    db = sqlite3.connect(path)
+    try:
+        _create_gpkg_metadata(db)
+        with transaction.atomic(), connection.cursor() as pg_cursor:
+            # Instantané unique : couches cohérentes entre elles, avec le curseur et l'empreinte
+            pg_cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            pg_cursor.execute("SELECT txid_current_snapshot()::text, txid_snapshot_xmin(txid_current_snapshot())")
+            snapshot, sync_cursor = pg_cursor.fetchone()
+            pg_cursor.execute(COMMUNE_HASH_SQL, [commune_id])
+            commune_hash = pg_cursor.fetchone()[0]
+
+            counts = {}
+            counts['commune'] = _write_layer(
+                db, pg_cursor, 'commune',
+                [('id', 'INTEGER'), ('nom', 'TEXT'), ('prefecture_id', 'INTEGER'),
+                 ('prefecture_nom', 'TEXT'), ('region_id', 'INTEGER'), ('region_nom', 'TEXT')],
+                f"""SELECT c.id, c.nom, p.id, p.nom, r.id, r.nom, ST_AsBinary(c.geom)
+                    FROM {CommuneRurale._meta.db_table} c
+                    LEFT JOIN prefectures p ON p.id = c.prefectures_id
+                    LEFT JOIN regions r ON r.id = p.regions_id
+                    WHERE c.id = %s""",
+                [commune_id], 'MULTIPOLYGON', generated_at,
+            )
+            for entry in INFRASTRUCTURE_TYPES:
+                model = entry['model']
+                fields = _attribute_fields(model)
+                select_columns = ', '.join(
+                    [f't."{field.column}"' for field in fields] + [str(value) for _, _, value in MOBILE_STATE_COLUMNS]
+                )
+                counts[entry['type']] = _write_layer(
+                    db, pg_cursor, entry['type'],
+                    [(mobile_column(entry, field.name), _sqlite_type(field)) for field in fields]
+                    + [(name, sql_type) for name, sql_type, _ in MOBILE_STATE_COLUMNS],
+                    f"SELECT {select_columns}, ST_AsBinary(t.geom) FROM {model._meta.db_table} t "
+                    f"WHERE t.{_commune_column(entry)} = %s ORDER BY t.{model._meta.pk.column}",
+                    [commune_id], model._meta.get_field('geom').geom_type.upper(), generated_at,
+                )
+
+        version = hashlib.sha1(f"{commune_id}:{snapshot}:{commune_hash}".encode('utf-8')).hexdigest()[:16]
+        db.execute("CREATE TABLE package_info (key TEXT PRIMARY KEY, value TEXT)")
+        db.executemany("INSERT INTO package_info VALUES (?, ?)", [
+            ('commune_id', str(commune_id)),
+            ('version', version),
+            ('snapshot', snapshot),
+            ('commune_hash', commune_hash),
+            ('sync_cursor', str(sync_cursor)),
+            ('generated_at', generated_at),
+        ] + [(f"count_{layer}", str(count)) for layer, count in counts.items()])
+        db.commit()
+    finally:
+        db.close()
+    print(f"📦 Paquet commune {commune_id} construit: {sum(counts.values())} éléments")
+    return version
+
+
+def _package_info(path):
+    """Clés de package_info d'un paquet, None s'il est illisible (supprimé entre-temps)"""
+    try:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return dict(db.execute("SELECT key, value FROM package_info"))
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return None
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0
+
+
+def latest_package(commune_id):
+    """(chemin, package_info) du dernier paquet construit de la commune, ou None"""
+    candidates = sorted(package_dir().glob(f"commune_{commune_id}_*.gpkg"), key=_mtime, reverse=True)
+    for path in candidates:
+        info = _package_info(path)
+        if info and 'snapshot' in info:
+            return path, info
+    return None
+
+
+def _commune_lock(commune_id):
+    with _build_locks_guard:
+        return _build_locks.setdefault(commune_id, threading.Lock())
+
+
+def _build(commune_id):
+    """Construit le paquet sous verrou consultatif ; un seul constructeur par commune, tous processus confondus"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", [PACKAGE_LOCK_SPACE, commune_id])
+        if not cursor.fetchone()[0]:
+            return  # autre processus en cours
+    try:
+        # Un autre processus a pu terminer juste avant
+        current = latest_package(commune_id)
+        if current and package_is_current(commune_id, current[1]['snapshot'], current[1]['commune_hash']):
+            return
+
+        directory = package_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        # Écriture dans un fichier temporaire puis renommage : jamais de paquet partiel servi
+        tmp_path = directory / f"commune_{commune_id}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            version = build_package(commune_id, tmp_path)
+            path = directory / f"commune_{commune_id}_{version}.gpkg"
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        for stale in directory.glob(f"commune_{commune_id}_*.gpkg"):
+            if stale != path:
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [PACKAGE_LOCK_SPACE, commune_id])
+
+
+def _build_in_background(commune_id, lock):
+    try:
+        _build(commune_id)
+    except Exception as e:
+        print(f"❌ Paquet commune {commune_id}: {e}")
+    finally:
+        connection.close()  # connexion propre au thread
+        lock.release()
+
+
+def schedule_build(commune_id):
+    """Lance la construction dans un thread, sauf si elle est déjà en cours dans ce processus"""
+    lock = _commune_lock(commune_id)
+    if not lock.acquire(blocking=False):
+        return
+    try:
+        threading.Thread(target=_build_in_background, args=(commune_id, lock), daemon=True).start()
+    except Exception:
+        lock.release()
+        raise
+
+
+def get_package(commune_id):
+    """
+    (chemin, version) du paquet à servir, ou None pendant la première construction.
+    Un paquet périmé reste servi le temps de sa reconstruction (hors requête).
+    """
+    current = latest_package(commune_id)
+    if current:
+        path, info = current
+        if not package_is_current(commune_id, info['snapshot'], info['commune_hash']):
+            schedule_build(commune_id)
+        return path, info['version']
+    schedule_build(commune_id)
+    return None
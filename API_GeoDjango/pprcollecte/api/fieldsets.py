@@ -0,0 +1,205 @@
+#  - Champs partiels et modes de géométrie des listes GeoJSON
+#
+# ?fields=fid,nom,type : propriétés renvoyées (identifiant et géométrie toujours présents)
+# ?geometry=full|none|point|bbox|simplified :
+#   full        géométrie d'origine (défaut)
+#   none        pas de géométrie (colonne geom jamais lue)
+#   point       point intérieur (ST_PointOnSurface)
+#   bbox        emprise (ST_Envelope)
+#   simplified  ST_SimplifyPreserveTopology, tolérance du niveau de généralisation
+#               correspondant à ?zoom= (niveau intermédiaire sans zoom)
+# Les choix sont appliqués au queryset : .only() sur les colonnes demandées,
+# geom différée et remplacée par l'expression calculée dans PostGIS.
+# Dans les listes, la géométrie rendue est le texte de ST_AsGeoJSON(expr, ?precision=) :
+# décimales limitées dans PostGIS, aucun arrondi ni objet GEOS côté Python.
+
+import json
+
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import AsGeoJSON, Envelope, PointOnSurface
+from django.db.models import F, Func, Value
+from rest_framework import serializers
+from .generalization import GENERALIZATION_LEVELS, level_for_zoom, level_tolerance
+
+
+GEOMETRY_MODES = ('full', 'none', 'point', 'bbox', 'simplified')
+# Attribut portant le GeoJSON calculé dans PostGIS (géométrie ou expression du mode)
+GEOJSON_ANNOTATION = 'geometry_geojson'
+
+
+def parse_fieldset_options(params):
+    """
+    Lit fields / geometry dans les paramètres de requête.
+    Retourne ((noms ou None, mode), None) ou (None, message d'erreur).
+    """
+    names = None
+    if params.get('fields'):
+        names = [name.strip() for name in params.get('fields').split(',') if name.strip()]
+
+    mode = (params.get('geometry') or 'full').lower()
+    if mode not in GEOMETRY_MODES:
+        return None, f"geometry invalide (valeurs: {', '.join(GEOMETRY_MODES)})"
+    return (names, mode), None
+
+
+def simplify_tolerance(params):
+    levels = [level for level, _, _ in GENERALIZATION_LEVELS]
+    level = levels[len(levels) // 2]
+    if params.get('zoom'):
+        try:
+            zoom_level = level_for_zoom(int(params.get('zoom')))
+        except ValueError:
+            raise serializers.ValidationError({'detail': 'zoom invalide'})
+        # Au-delà du dernier niveau : la plus fine des tolérances
+        level = levels[-1] if zoom_level is None else zoom_level
+    return level_tolerance(level)
+
+
+def geometry_expression(mode, params):
+    if mode == 'point':
+        return PointOnSurface('geom')
+    if mode == 'bbox':
+        return Envelope('geom')
+    if mode == 'simplified':
+        return Func(
+            F('geom'), Value(simplify_tolerance(params)),
+            function='ST_SimplifyPreserveTopology', output_field=GeometryField(srid=4326)
+        )
+    return None
+
+
+class NullGeometryField(serializers.Field):
+    """Géométrie absente (?geometry=none) : l'attribut différé n'est jamais lu"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return None
+
+    def to_representation(self, value):
+        return None
+
+
+class GeoJSONTextField(serializers.Field):
+    """
+    Géométrie rendue par ST_AsGeoJSON : texte recopié tel quel dans les réponses
+    en flux (contexte raw_geometry), sinon lu par json (décimales déjà limitées)
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if value is None or self.context.get('raw_geometry'):
+            return value
+        return json.loads(value)
+
+
+def restrict_fields(serializer, fields, names, mode):
+    """Champs du sérialiseur limités à names, géométrie remplacée selon le mode"""
+    geo_field = serializer.Meta.geo_field
+    if names is not None:
+        unknown = [name for name in names if name not in fields]
+        if unknown:
+            raise serializers.ValidationError({
+                'detail': f"Champs inconnus: {', '.join(unknown)} (disponibles: {', '.join(fields)})"
+            })
+        keep = set(names) | {geo_field, serializer.Meta.model._meta.pk.name}
+        fields = {name: field for name, field in fields.items() if name in keep}
+
+    if mode == 'none':
+        fields[geo_field] = NullGeometryField()
+    elif serializer.context.get('geometry_annotated'):
+        fields[geo_field] = GeoJSONTextField(source=GEOJSON_ANNOTATION)
+    return fields
+
+
+def _select_related_paths(queryset):
+    """Chemins select_related du queryset, None si select_related() sans argument"""
+    tree = queryset.query.select_related
+    if tree is True:
+        return None
+    paths = []
+
+    def walk(node, prefix):
+        for name, children in node.items():
+            path = f"{prefix}__{name}" if prefix else name
+            if children:
+                walk(children, path)
+            else:
+                paths.append(path)
+
+    if tree:
+        walk(tree, '')
+    return paths
+
+
+def project_queryset(queryset, serializer, names, mode, params, precision):
+    """
+    Colonnes lues limitées aux champs rendus : geom différée, remplacée par son
+    GeoJSON calculé dans PostGIS à precision décimales ; .only() quand ?fields=
+    est fourni.
+    """
+    if mode != 'none':
+        expression = geometry_expression(mode, params) or F('geom')
+        queryset = queryset.annotate(**{GEOJSON_ANNOTATION: AsGeoJSON(expression, precision=precision)})
+    if names is None:
+        return queryset.defer('geom')
+
+    model = queryset.model
+    concrete = {field.name: field for field in model._meta.concrete_fields}
+    geo_field = serializer.Meta.geo_field
+    sources = set()
+    for name, field in serializer.fields.items():
+        if name == geo_field:
+            continue
+        root = field.source.split('.')[0]
+        if field.source == '*' or root not in concrete:
+            # Champ calculé sur l'objet entier : seule la géométrie peut être écartée
+            return queryset.defer('geom')
+        sources.add(root)
+
+    related_paths = _select_related_paths(queryset)
+    if related_paths is None:
+        return queryset.defer('geom')
+
+    load = [model._meta.pk.name] + sorted(sources - {model._meta.pk.name})
+    kept = [path for path in related_paths if path.split('__')[0] in sources]
+    # Clé étrangère vers un champ non clé (code_piste) : seule la colonne exposée est lue
+    for path in kept:
+        field = concrete.get(path)
+        if field is not None and field.target_field != field.related_model._meta.pk:
+            load.append(f"{path}__{field.target_field.name}")
+
+    queryset = queryset.select_related(None)
+    if kept:
+        queryset = queryset.select_related(*kept)
+    return queryset.only(*load)
+
+
+class SparseFieldsetMixin:
+    """
+    Pour les vues liste à sérialiseur GeoFeatureModelSerializer (+ CompactGeometryMixin) :
+    ?fields=, ?geometry= et ?precision= appliqués au queryset.
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method in ('GET', 'HEAD'):
+            context['geometry_annotated'] = True
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in ('GET', 'HEAD'):
+            return queryset
+        serializer = self.get_serializer()
+        options = getattr(serializer, 'fieldset_options', None)
+        if options is None:
+            return queryset
+        names, mode = options
+        precision, _ = serializer.geometry_options
+        return project_queryset(queryset, serializer, names, mode, self.request.query_params, precision)
@@ -0,0 +1,72 @@
+#  - Géométries linéaires généralisées à plusieurs résolutions
+#
+# Pistes, bacs et passages submersibles sont simplifiés une fois pour toutes
+# (ST_SimplifyPreserveTopology) à chaque niveau et stockés dans
+# geometries_generalisees. /api/collectes/ lit le niveau adapté au zoom au
+# lieu de simplifier chaque géométrie à chaque requête.
+# Maintenance par trigger PostgreSQL (migration 0013) : toute écriture, API,
+# QGIS ou SQL, recalcule les niveaux de l'élément. rebuild_generalized_geometries
+# (commande build_generalized_geometries) reconstruit une couche entière.
+
+from django.db import connection, transaction
+from .models import Piste, Bacs, PassagesSubmersibles, GeometriesGeneralisees
+
+
+# (niveau, zoom maximal servi, tolérance en degrés)
+# Tolérances reprises par le trigger de la migration 0013 : le migrer aussi en cas de changement
+GENERALIZATION_LEVELS = [
+    (0, 7, 0.01),
+    (1, 10, 0.001),
+    (2, 13, 0.0001),
+]
+
+# Couches généralisées : type -> modèle
+GENERALIZED_MODELS = {
+    'pistes': Piste,
+    'bacs': Bacs,
+    'passages_submersibles': PassagesSubmersibles,
+}
+
+
+def level_for_zoom(zoom):
+    """Niveau à servir pour un zoom donné, None = géométrie d'origine"""
+    for level, max_zoom, _ in GENERALIZATION_LEVELS:
+        if zoom <= max_zoom:
+            return level
+    return None
+
+
+def level_tolerance(level):
+    for lvl, _, tolerance in GENERALIZATION_LEVELS:
+        if lvl == level:
+            return tolerance
+    return None
+
+
+def _levels_values_sql():
+    return ', '.join(f"({level}, {float(tolerance)})" for level, _, tolerance in GENERALIZATION_LEVELS)
+
+
+def _refresh_sql(layer_type, where):
+    model = GENERALIZED_MODELS[layer_type]
+    table = model._meta.db_table
+    pk_column = model._meta.pk.column
+    return f"""
+        INSERT INTO {GeometriesGeneralisees._meta.db_table} (layer, feature_id, level, geom)
+        SELECT %s, t.{pk_column}, l.level, ST_SimplifyPreserveTopology(t.geom, l.tolerance)
+        FROM {table} t
+        CROSS JOIN (VALUES {_levels_values_sql()}) AS l(level, tolerance)
+        WHERE t.geom IS NOT NULL {where}
+        ON CONFLICT (layer, feature_id, level) DO UPDATE SET geom = EXCLUDED.geom
+    """
+
+
+def rebuild_generalized_geometries(layer_type):
+    """Reconstruit tous les niveaux d'une couche en une requête ensembliste"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {GeometriesGeneralisees._meta.db_table} WHERE layer = %s",
+            [layer_type]
+        )
+        cursor.execute(_refresh_sql(layer_type, ''), [layer_type])
+        return cursor.rowcount
@@ -0,0 +1,261 @@
+#  - Encodage Geobuf (GeoJSON compact en protobuf)
+#
+# Format de Mapbox (https://github.com/mapbox/geobuf, schéma geobuf.proto) :
+# coordonnées quantifiées (10^precision) et codées en delta, clés de
+# propriétés mutualisées. Encodeur pur Python, sans dépendance protobuf.
+# Les clés hors 'features' d'une FeatureCollection (total, next, ...) sont
+# conservées en custom_properties. Les géométries peuvent aussi être lues en WKB
+# (read_wkb), telles que renvoyées par ST_AsBinary, sans passer par du GeoJSON.
+
+import json
+import struct
+
+
+GEOMETRY_TYPES = {
+    'Point': 0, 'MultiPoint': 1, 'LineString': 2, 'MultiLineString': 3,
+    'Polygon': 4, 'MultiPolygon': 5, 'GeometryCollection': 6,
+}
+
+CONTENT_TYPE = 'application/x-protobuf'
+
+# Types de fils protobuf
+VARINT = 0
+FIXED64 = 1
+BYTES = 2
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _tag(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _message(field, payload):
+    return _tag(field, BYTES) + _varint(len(payload)) + payload
+
+
+def _packed_varints(field, values):
+    return _message(field, b''.join(_varint(v) for v in values))
+
+
+def _packed_svarints(field, values):
+    return _message(field, b''.join(_varint(_zigzag(v)) for v in values))
+
+
+WKB_TYPES = {1: 'Point', 2: 'LineString', 3: 'Polygon', 4: 'MultiPoint',
+             5: 'MultiLineString', 6: 'MultiPolygon', 7: 'GeometryCollection'}
+
+
+def _read_wkb(data, offset):
+    """Géométrie WKB 2D à offset : (dict géométrie GeoJSON, offset suivant)"""
+    order = '<' if data[offset] == 1 else '>'
+    (wkb_type,) = struct.unpack_from(order + 'I', data, offset + 1)
+    offset += 5
+    geom_type = WKB_TYPES[wkb_type]
+
+    def points(offset):
+        (count,) = struct.unpack_from(order + 'I', data, offset)
+        offset += 4
+        values = struct.unpack_from(f"{order}{2 * count}d", data, offset)
+        return [list(values[i:i + 2]) for i in range(0, 2 * count, 2)], offset + 16 * count
+
+    def rings(offset):
+        (count,) = struct.unpack_from(order + 'I', data, offset)
+        offset += 4
+        result = []
+        for _ in range(count):
+            ring, offset = points(offset)
+            result.append(ring)
+        return result, offset
+
+    if geom_type == 'Point':
+        return {'type': geom_type, 'coordinates': list(struct.unpack_from(order + '2d', data, offset))}, offset + 16
+    if geom_type == 'LineString':
+        coordinates, offset = points(offset)
+        return {'type': geom_type, 'coordinates': coordinates}, offset
+    if geom_type == 'Polygon':
+        coordinates, offset = rings(offset)
+        return {'type': geom_type, 'coordinates': coordinates}, offset
+
+    (count,) = struct.unpack_from(order + 'I', data, offset)
+    offset += 4
+    members = []
+    for _ in range(count):
+        member, offset = _read_wkb(data, offset)
+        members.append(member)
+    if geom_type == 'GeometryCollection':
+        return {'type': geom_type, 'geometries': members}, offset
+    return {'type': geom_type, 'coordinates': [member['coordinates'] for member in members]}, offset
+
+
+def read_wkb(data):
+    """WKB 2D (ST_AsBinary(ST_Force2D(geom))) -> géométrie GeoJSON (dict)"""
+    return _read_wkb(bytes(data), 0)[0]
+
+
+class GeobufEncoder:
+
+    def __init__(self, precision=6, dimensions=2):
+        self.precision = precision
+        self.dimensions = dimensions
+        self.factor = 10 ** precision
+        self.keys = {}
+
+    def _key_index(self, key):
+        if key not in self.keys:
+            self.keys[key] = len(self.keys)
+        return self.keys[key]
+
+    # -- valeurs et propriétés
+
+    def _value(self, value):
+        if isinstance(value, bool):
+            return _tag(5, VARINT) + _varint(int(value))
+        if isinstance(value, int):
+            if value >= 0:
+                return _tag(3, VARINT) + _varint(value)
+            return _tag(4, VARINT) + _varint(-value)
+        if isinstance(value, float):
+            if value.is_integer() and abs(value) < 2 ** 63:
+                return self._value(int(value))
+            return _tag(2, FIXED64) + struct.pack('<d', value)
+        if isinstance(value, str):
+            return _message(1, value.encode('utf-8'))
+        # null, objets et listes : valeur JSON
+        return _message(6, json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+
+    def _properties(self, properties, field):
+        """Valeurs (champ 13) + paires (index clé, index valeur) dans le champ 14 ou 15"""
+        if not properties:
+            return b''
+        out = bytearray()
+        indexes = []
+        for value_index, (key, value) in enumerate(properties.items()):
+            out += _message(13, self._value(value))
+            indexes += [self._key_index(key), value_index]
+        out += _packed_varints(field, indexes)
+        return bytes(out)
+
+    # -- géométries
+
+    def _round(self, coordinate):
+        return int(round(coordinate * self.factor))
+
+    def _point(self, point):
+        return [self._round(c) for c in point[:self.dimensions]]
+
+    def _line(self, line, closed=False):
+        """Coordonnées en delta, remises à zéro pour chaque ligne"""
+        coords = []
+        sums = [0] * self.dimensions
+        points = line[:-1] if closed else line
+        for point in points:
+            for d in range(self.dimensions):
+                delta = self._round(point[d]) - sums[d]
+                coords.append(delta)
+                sums[d] += delta
+        return coords
+
+    def _geometry(self, geometry):
+        geom_type = geometry['type']
+        out = _tag(1, VARINT) + _varint(GEOMETRY_TYPES[geom_type])
+
+        if geom_type == 'GeometryCollection':
+            for member in geometry.get('geometries', []):
+                out += _message(4, self._geometry(member))
+            return out
+
+        coordinates = geometry['coordinates']
+        lengths = None
+        if geom_type == 'Point':
+            coords = self._point(coordinates)
+        elif geom_type in ('MultiPoint', 'LineString'):
+            coords = self._line(coordinates)
+        elif geom_type in ('MultiLineString', 'Polygon'):
+            closed = geom_type == 'Polygon'
+            if len(coordinates) != 1:
+                lengths = [len(line) - (1 if closed else 0) for line in coordinates]
+            coords = [c for line in coordinates for c in self._line(line, closed)]
+        else:  # MultiPolygon
+            lengths = [len(coordinates)]
+            coords = []
+            for polygon in coordinates:
+                lengths.append(len(polygon))
+                for ring in polygon:
+                    lengths.append(len(ring) - 1)
+                    coords += self._line(ring, closed=True)
+
+        if lengths:
+            out += _packed_varints(2, lengths)
+        if coords:
+            out += _packed_svarints(3, coords)
+        return out
+
+    # -- features
+
+    def _feature(self, feature):
+        out = bytearray()
+        if feature.get('geometry'):
+            out += _message(1, self._geometry(feature['geometry']))
+
+        feature_id = feature.get('id')
+        if isinstance(feature_id, int) and not isinstance(feature_id, bool):
+            out += _tag(12, VARINT) + _varint(_zigzag(feature_id))
+        elif feature_id is not None:
+            out += _message(11, str(feature_id).encode('utf-8'))
+
+        out += self._properties(feature.get('properties'), 14)
+        extra = {k: v for k, v in feature.items() if k not in ('type', 'id', 'geometry', 'properties')}
+        out += self._properties(extra, 15)
+        return bytes(out)
+
+    def encode(self, features, custom_properties=None):
+        """
+        Encode une FeatureCollection : itérable de features (dict GeoJSON), consommé
+        au fil de l'encodage, + clés additionnelles (dict, ou fonction appelée une
+        fois les features encodées, pour les totaux)
+        """
+        collection = bytearray()
+        for feature in features:
+            collection += _message(1, self._feature(feature))
+        if callable(custom_properties):
+            custom_properties = custom_properties()
+        collection += self._properties(custom_properties, 15)
+
+        out = bytearray()
+        for key in self.keys:  # dict : ordre d'insertion = index
+            out += _message(1, key.encode('utf-8'))
+        # Toujours explicites : les décodeurs n'appliquent pas tous les valeurs par défaut du schéma
+        out += _tag(2, VARINT) + _varint(self.dimensions)
+        out += _tag(3, VARINT) + _varint(self.precision)
+        out += _message(4, bytes(collection))
+        return bytes(out)
+
+
+def encode_geojson(data, precision=6):
+    """
+    Encode une réponse GeoJSON (FeatureCollection, Feature ou tout autre dict,
+    transmis en custom_properties d'une collection vide).
+    """
+    encoder = GeobufEncoder(precision=precision)
+    if isinstance(data, list):
+        return encoder.encode(data)
+    if data.get('type') == 'Feature':
+        return encoder.encode([data])
+    features = data.get('features', []) if data.get('type') == 'FeatureCollection' else []
+    extra = {k: v for k, v in data.items() if k not in ('type', 'features')}
+    return encoder.encode(features, extra)
@@ -1,177 +1,452 @@
 # api/geographic_api.py
+import json
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import Distance
-from .models import Region, Prefecture, CommuneRurale
-from .serializers import RegionSerializer, PrefectureSerializer, CommuneRuraleSerializer
+from .versioning import ConditionalGetMixin, versions_key
+from .admin_bounds import fetch_admin_units
+from .admin_closure import HIERARCHY_TABLES, commune_closure
+from .response_cache import collectes_cache
+from .spatial_index import commune_locator
+from .spatial_sql import COLLECTES_LAYERS, collectes_version_tables, count_features_by_commune
+
+# Hiérarchie assemblée, encodée une fois par version des tables administratives
+_hierarchy_payload = {'version': None, 'body': None}
+_hierarchy_lock = threading.Lock()
 
-class GeographyHierarchyAPIView(APIView):
+
+@method_decorator(gzip_page, name='dispatch')
+class GeographyHierarchyAPIView(ConditionalGetMixin, APIView):
     """
     API pour récupérer la hiérarchie géographique complète
-    RÉgion > Préfecture > Commune avec données géométriques
+    RÉgion > Préfecture > Commune avec emprises et centres précalculés
     """
+    version_tables = HIERARCHY_TABLES
     
     def get(self, request):
         try:
-            print("🌍 [Geographic API] Chargement hiérarchie complète...")
-            
-            # Récupérer toute la hiérarchie avec select_related pour optimiser
-            regions = Region.objects.prefetch_related(
-                'prefecture_set__communerurale_set'
-            ).order_by('nom')
+            version = versions_key(self.version_tables)
+            cache_status = 'HIT'
+            with _hierarchy_lock:
+                body = _hierarchy_payload['body'] if _hierarchy_payload['version'] == version else None
             
-            hierarchy_data = []
-            total_prefectures = 0
-            total_communes = 0
+            if body is None:
+                cache_status = 'MISS'
+                body = self._build_payload(version)
+                with _hierarchy_lock:
+                    _hierarchy_payload.update(version=version, body=body)
             
-            for region in regions:
-                prefectures_data = []
-                
-                for prefecture in region.prefecture_set.all().order_by('nom'):
-                    communes_data = []
-                    total_prefectures += 1
-                    
-                    for commune in prefecture.communerurale_set.all().order_by('nom'):
-                        communes_data.append({
-                            'id': commune.id,
-                            'nom': commune.nom,
-                            'bounds': self._get_geometry_bounds(commune.geom) if commune.geom else None,
-                            'center': self._get_geometry_center(commune.geom) if commune.geom else None
-                        })
-                        total_communes += 1
-                    
-                    prefectures_data.append({
-                        'id': prefecture.id,
-                        'nom': prefecture.nom,
-                        'region_id': region.id,
-                        'bounds': self._get_geometry_bounds(prefecture.geom) if prefecture.geom else None,
-                        'center': self._get_geometry_center(prefecture.geom) if prefecture.geom else None,
-                        'communes': communes_data
-                    })
-                
-                hierarchy_data.append({
-                    'id': region.id,
-                    'nom': region.nom,
-                    'bounds': self._get_geometry_bounds(region.geom) if region.geom else None,
-                    'center': self._get_geometry_center(region.geom) if region.geom else None,
-                    'prefectures': prefectures_data
-                })
-            
-            print(f"✅ Hiérarchie chargée: {len(hierarchy_data)} régions, {total_prefectures} préfectures, {total_communes} communes")
+            response = HttpResponse(body, content_type='application/json')
+            # Contenu quasi statique : mis en cache longtemps, revalidé par ETag
+            response['Cache-Control'] = f"public, max-age={settings.GEOGRAPHY_HIERARCHY_MAX_AGE}"
+            response['X-Cache'] = cache_status
+            return response
             
+        except Exception as e:
+            print(f"❌ Erreur chargement hiérarchie: {e}")
             return Response({
-                'success': True,
-                'hierarchy': hierarchy_data,
-                'total_regions': len(hierarchy_data),
-                'total_prefectures': total_prefectures,
-                'total_communes': total_communes
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def _build_payload(self, version):
+        """Trois requêtes (une par niveau), sans géométrie ; regroupement en mémoire"""
+        print("🌍 [Geographic API] Chargement hiérarchie complète...")
+        
+        communes_by_prefecture = {}
+        communes = fetch_admin_units('commune')
+        for commune in communes:
+            communes_by_prefecture.setdefault(commune['parent_id'], []).append({
+                'id': commune['id'],
+                'nom': commune['nom'],
+                'bounds': commune['bounds'],
+                'center': commune['center']
             })
+        
+        prefectures_by_region = {}
+        prefectures = fetch_admin_units('prefecture')
+        for prefecture in prefectures:
+            prefectures_by_region.setdefault(prefecture['parent_id'], []).append({
+                'id': prefecture['id'],
+                'nom': prefecture['nom'],
+                'region_id': prefecture['parent_id'],
+                'bounds': prefecture['bounds'],
+                'center': prefecture['center'],
+                'communes': communes_by_prefecture.get(prefecture['id'], [])
+            })
+        
+        hierarchy_data = [
+            {
+                'id': region['id'],
+                'nom': region['nom'],
+                'bounds': region['bounds'],
+                'center': region['center'],
+                'prefectures': prefectures_by_region.get(region['id'], [])
+            }
+            for region in fetch_admin_units('region')
+        ]
+        
+        total_prefectures = sum(len(region['prefectures']) for region in hierarchy_data)
+        total_communes = sum(
+            len(prefecture['communes'])
+            for region in hierarchy_data for prefecture in region['prefectures']
+        )
+        print(f"✅ Hiérarchie chargée: {len(hierarchy_data)} régions, {total_prefectures} préfectures, {total_communes} communes")
+        
+        return json.dumps({
+            'success': True,
+            'hierarchy': hierarchy_data,
+            'total_regions': len(hierarchy_data),
+            'total_prefectures': total_prefectures,
+            'total_communes': total_communes,
+            'version': version
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# Niveau des enfants selon le type du noeud parent (None = racine)
+CHILD_LEVELS = {None: 'region', 'region': 'prefecture', 'prefecture': 'commune'}
+
+
+@method_decorator(gzip_page, name='dispatch')
+class GeographyNodesAPIView(ConditionalGetMixin, APIView):
+    """
+    Variante à la demande de la hiérarchie : un seul niveau par réponse
+    /api/geography/nodes/                                        -> régions
+    /api/geography/nodes/?parent_type=region&parent_id=<id>      -> préfectures de la région
+    /api/geography/nodes/?parent_type=prefecture&parent_id=<id>  -> communes de la préfecture
+    Chaque noeud : emprise, centre, nombre d'enfants et nombre d'infrastructures
+    """
+    
+    def get_version_tables(self):
+        return sorted(set(HIERARCHY_TABLES + collectes_version_tables()))
+    
+    def get(self, request):
+        parent_type = request.GET.get('parent_type') or None
+        parent_id = request.GET.get('parent_id')
+        
+        if parent_type not in CHILD_LEVELS:
+            return Response({
+                'success': False,
+                'error': 'parent_type invalide. Utilisez: region, prefecture'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if parent_type:
+            try:
+                parent_id = int(parent_id)
+            except (ValueError, TypeError):
+                return Response({
+                    'success': False,
+                    'error': 'parent_id requis (entier)'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            parent_id = None
+        
+        try:
+            cache_key = ('geography_nodes', parent_type, parent_id, versions_key(self.get_version_tables()))
+            body = collectes_cache.get(cache_key)
+            if body is not None:
+                return self._response(body, 'HIT')
+            
+            parent = None
+            if parent_type:
+                found = fetch_admin_units(parent_type, ids=[parent_id])
+                if not found:
+                    return Response({
+                        'success': False,
+                        'error': f"{parent_type} {parent_id} introuvable"
+                    }, status=status.HTTP_404_NOT_FOUND)
+                parent = found[0]
+            
+            body, scope_commune_ids = self._build_payload(parent_type, parent)
+            collectes_cache.set(cache_key, body, [l['type'] for l in COLLECTES_LAYERS], scope_commune_ids)
+            return self._response(body, 'MISS')
             
         except Exception as e:
-            print(f"❌ Erreur chargement hiérarchie: {e}")
+            print(f"❌ Erreur noeuds hiérarchie: {e}")
             return Response({
                 'success': False,
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    def _get_geometry_bounds(self, geometry):
-        """Calculer les bounds [minLng, minLat, maxLng, maxLat] pour zoom automatique"""
-        if not geometry:
-            return None
+    def _response(self, body, cache_status):
+        response = HttpResponse(body, content_type='application/json')
+        response['Cache-Control'] = f"public, max-age={settings.GEOGRAPHY_NODES_MAX_AGE}"
+        response['X-Cache'] = cache_status
+        return response
+    
+    def _child_communes(self, level, node_id):
+        """(communes couvertes par le noeud, nombre d'enfants)"""
+        if level == 'region':
+            return commune_closure.communes_of_region(node_id), len(commune_closure.prefectures_of_region(node_id))
+        if level == 'prefecture':
+            communes = commune_closure.communes_of_prefecture(node_id)
+            return communes, len(communes)
+        return [node_id], 0
+    
+    def _build_payload(self, parent_type, parent):
+        """Retourne (octets JSON, communes couvertes - None = toutes)"""
+        level = CHILD_LEVELS[parent_type]
+        parent_ids = [parent['id']] if parent else None
+        children = fetch_admin_units(level, parent_ids=parent_ids)
         
-        try:
-            extent = geometry.extent  # [minLng, minLat, maxLng, maxLat]
-            return extent
-        except:
-            return None
+        # Comptage limité aux communes du parent : lu sur les index commune des couches
+        scope_commune_ids = None
+        if parent_type:
+            scope_commune_ids, _ = self._child_communes(parent_type, parent['id'])
+        counts = count_features_by_commune(COLLECTES_LAYERS, scope_commune_ids)
+        
+        nodes = []
+        for child in children:
+            commune_ids, child_count = self._child_communes(level, child['id'])
+            nodes.append({
+                'id': child['id'],
+                'nom': child['nom'],
+                'type': level,
+                'bounds': child['bounds'],
+                'center': child['center'],
+                'child_count': child_count,
+                'feature_count': sum(counts.get(commune_id, 0) for commune_id in commune_ids)
+            })
+        
+        payload = {
+            'success': True,
+            'parent': {
+                'id': parent['id'],
+                'nom': parent['nom'],
+                'type': parent_type,
+                'bounds': parent['bounds'],
+                'center': parent['center']
+            } if parent else None,
+            'level': level,
+            'nodes': nodes,
+            'total': len(nodes)
+        }
+        print(f"🌍 [Geographic API] {len(nodes)} noeuds '{level}' (parent: {parent_type} {parent['id'] if parent else '-'})")
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return body, scope_commune_ids
+
+
+LOCATION_FIELDS = ('commune_id', 'commune_nom', 'prefecture_id', 'prefecture_nom', 'region_id', 'region_nom')
+
+
+def _parse_locate_point(item):
+    """[lng, lat] ou {'id', 'lng'/'x', 'lat'/'y'} -> (id, lng, lat)"""
+    if isinstance(item, dict):
+        point_id = item.get('id')
+        lng = item.get('lng', item.get('x'))
+        lat = item.get('lat', item.get('y'))
+    elif isinstance(item, (list, tuple)) and len(item) >= 2:
+        point_id, lng, lat = None, item[0], item[1]
+    else:
+        raise ValueError('format attendu: [lng, lat] ou {"lng", "lat"}')
+    lng, lat = float(lng), float(lat)
+    if not (math.isfinite(lng) and math.isfinite(lat) and -180 <= lng <= 180 and -90 <= lat <= 90):
+        raise ValueError('coordonnées hors des limites WGS84')
+    return point_id, lng, lat
+
+
+class LocatePointsAPIView(APIView):
+    """
+    Géocodage inverse par lot : commune / préfecture / région de chaque point
+    POST /api/geography/locate/  {"points": [[lng, lat], {"id": "a1", "lng": .., "lat": ..}, ...]}
+    GET  /api/geography/locate/?points=lng,lat;lng,lat
+    Réponse dans l'ordre des points ; champs à null hors de toute commune.
+    """
     
-    def _get_geometry_center(self, geometry):
-        """Calculer le centre [lng, lat] pour zoom automatique"""
-        if not geometry:
-            return None
+    def get(self, request):
+        raw = request.GET.get('points', '')
+        points = [pair.split(',') for pair in raw.split(';') if pair.strip()]
+        return self._locate(points)
+    
+    def post(self, request):
+        points = request.data.get('points') if isinstance(request.data, dict) else request.data
+        return self._locate(points)
+    
+    def _locate(self, points):
+        if not isinstance(points, list) or not points:
+            return Response({
+                'success': False,
+                'error': 'Liste de points requise (points)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        max_points = settings.LOCATE_MAX_POINTS
+        if len(points) > max_points:
+            return Response({
+                'success': False,
+                'error': f"Trop de points ({len(points)}), maximum {max_points} par appel"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        parsed = []
+        for index, item in enumerate(points):
+            try:
+                parsed.append(_parse_locate_point(item))
+            except (ValueError, TypeError) as e:
+                return Response({
+                    'success': False,
+                    'error': f"Point {index} invalide: {e}"
+                }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            centroid = geometry.centroid
-            return [centroid.x, centroid.y]
-        except:
-            return None
+            start_time = time.time()
+            locations = commune_locator.locate_many([(lng, lat) for _, lng, lat in parsed])
+        except Exception as e:
+            print(f"❌ Erreur localisation: {e}")
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        results = []
+        for index, ((point_id, lng, lat), location) in enumerate(zip(parsed, locations)):
+            result = {'index': index, 'lng': lng, 'lat': lat, 'found': location is not None}
+            if point_id is not None:
+                result['id'] = point_id
+            result.update(location or dict.fromkeys(LOCATION_FIELDS))
+            results.append(result)
+        
+        located = sum(1 for location in locations if location is not None)
+        print(f"🧭 {located}/{len(results)} points localisés en {time.time() - start_time:.3f}s")
+        return Response({
+            'success': True,
+            'results': results,
+            'total': len(results),
+            'located': located
+        })
 
 
-class ZoomToLocationAPIView(APIView):
+class ZoomToLocationAPIView(ConditionalGetMixin, APIView):
     """
-    API pour obtenir les données de zoom pour une localisation spécifique
+    API pour obtenir les données de zoom pour une ou plusieurs localisations
+    ?type=commune&id=12                      -> une localisation
+    ?locations=region:3,commune:12,commune:8 -> plusieurs, plus l'emprise combinée
+    Réponses lues dans les colonnes bbox / centre précalculées (sans géométrie)
     """
     
+    LEVELS = ('region', 'prefecture', 'commune')
+    version_tables = HIERARCHY_TABLES
+    
     def get(self, request):
+        if request.GET.get('locations'):
+            return self._get_many(request.GET.get('locations'))
+        
         location_type = request.GET.get('type')  # 'region', 'prefecture', 'commune'
         location_id = request.GET.get('id')
         
         if not location_type or not location_id:
             return Response({
                 'success': False,
-                'error': 'Paramètres type et id requis'
+                'error': 'Paramètres type et id requis (ou locations=type:id,...)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if location_type not in self.LEVELS:
+            return Response({
+                'success': False,
+                'error': 'Type invalide. Utilisez: region, prefecture, commune'
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
             location_id = int(location_id)
-            
-            if location_type == 'region':
-                location = Region.objects.get(id=location_id)
-            elif location_type == 'prefecture':
-                location = Prefecture.objects.get(id=location_id)
-            elif location_type == 'commune':
-                location = CommuneRurale.objects.get(id=location_id)
-            else:
-                return Response({
-                    'success': False,
-                    'error': 'Type invalide. Utilisez: region, prefecture, commune'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            bounds = self._get_geometry_bounds(location.geom) if location.geom else None
-            center = self._get_geometry_center(location.geom) if location.geom else None
-            
-            return Response({
-                'success': True,
-                'location': {
-                    'id': location.id,
-                    'nom': location.nom,
-                    'type': location_type,
-                    'bounds': bounds,
-                    'center': center
-                }
-            })
-            
         except (ValueError, TypeError):
             return Response({
                 'success': False,
                 'error': 'ID invalide'
             }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            found = fetch_admin_units(location_type, ids=[location_id])
         except Exception as e:
             return Response({
                 'success': False,
                 'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        if not found:
+            return Response({
+                'success': False,
+                'error': f"{location_type} {location_id} introuvable"
             }, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'success': True,
+            'location': self._location(location_type, found[0])
+        })
     
-    def _get_geometry_bounds(self, geometry):
-        """Calculer les bounds pour zoom automatique"""
-        if not geometry:
-            return None
+    def _get_many(self, value):
+        """Une requête par type demandé, quel que soit le nombre de localisations"""
+        requested = []
+        for item in value.split(','):
+            if not item.strip():
+                continue
+            location_type, _, location_id = item.strip().partition(':')
+            if location_type not in self.LEVELS:
+                return Response({
+                    'success': False,
+                    'error': f"Type invalide dans '{item}'. Utilisez: region, prefecture, commune"
+                }, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                requested.append((location_type, int(location_id)))
+            except ValueError:
+                return Response({
+                    'success': False,
+                    'error': f"ID invalide dans '{item}'"
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        ids_by_type = {}
+        for location_type, location_id in requested:
+            ids_by_type.setdefault(location_type, set()).add(location_id)
         
         try:
-            extent = geometry.extent  # [minLng, minLat, maxLng, maxLat]
-            return extent
-        except:
-            return None
+            units = {
+                (location_type, unit['id']): unit
+                for location_type, ids in ids_by_type.items()
+                for unit in fetch_admin_units(location_type, ids=ids)
+            }
+        except Exception as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        locations = []
+        not_found = []
+        for key in dict.fromkeys(requested):  # ordre de la requête, sans doublon
+            if key in units:
+                locations.append(self._location(key[0], units[key]))
+            else:
+                not_found.append(f"{key[0]}:{key[1]}")
+        
+        bounds = self._combined_bounds([location['bounds'] for location in locations])
+        return Response({
+            'success': bool(locations),
+            'locations': locations,
+            'not_found': not_found,
+            'bounds': bounds,
+            'center': [(bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2] if bounds else None
+        }, status=status.HTTP_200_OK if locations else status.HTTP_404_NOT_FOUND)
     
-    def _get_geometry_center(self, geometry):
-        """Calculer le centre pour zoom automatique"""
-        if not geometry:
+    def _location(self, location_type, unit):
+        return {
+            'id': unit['id'],
+            'nom': unit['nom'],
+            'type': location_type,
+            'bounds': unit['bounds'],
+            'center': unit['center']
+        }
+    
+    def _combined_bounds(self, all_bounds):
+        """Emprise [minLng, minLat, maxLng, maxLat] englobant toutes les emprises"""
+        all_bounds = [bounds for bounds in all_bounds if bounds]
+        if not all_bounds:
             return None
-        
-        try:
-            centroid = geometry.centroid
-            return [centroid.x, centroid.y]
-        except:
-            return Nones
\ No newline at end of file
+        return [
+            min(b[0] for b in all_bounds), min(b[1] for b in all_bounds),
+            max(b[2] for b in all_bounds), max(b[3] for b in all_bounds),
+        ]
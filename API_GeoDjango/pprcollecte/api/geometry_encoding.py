@@ -0,0 +1,164 @@
+#  - Précision des coordonnées et encodage polyline des géométries linéaires
+#
+# ?precision=n         : nombre de décimales des coordonnées (défaut GEOJSON_COORD_PRECISION)
+# ?geometry_encoding=polyline : les linéaires sont renvoyés au format Encoded
+#                        Polyline (Google, ordre lat/lng) dans la clé 'polyline'
+#                        de la feature ; 'geometry' vaut alors null.
+# /api/collectes/ applique ces options dans PostGIS (ST_AsGeoJSON(geom, n),
+# ST_AsEncodedPolyline) ; les vues liste lisent ST_AsGeoJSON(geom, n) (fieldsets),
+# les autres réponses sont arrondies au sérialiseur.
+
+import json
+
+from django.conf import settings
+from rest_framework import serializers
+from .fieldsets import parse_fieldset_options, restrict_fields
+
+
+MAX_PRECISION = 15
+# Au-delà, les entiers de ST_AsEncodedPolyline débordent (32 bits)
+MAX_POLYLINE_PRECISION = 7
+GEOMETRY_ENCODINGS = ('geojson', 'polyline')
+POLYLINE_TYPES = ('LineString', 'MultiLineString')
+
+
+def default_precision():
+    return getattr(settings, 'GEOJSON_COORD_PRECISION', 6)
+
+
+def parse_geometry_options(params):
+    """
+    Lit precision / geometry_encoding dans les paramètres de requête.
+    Retourne ((precision, encoding), None) ou (None, message d'erreur).
+    """
+    precision = default_precision()
+    if params.get('precision'):
+        try:
+            precision = int(params.get('precision'))
+        except ValueError:
+            return None, 'precision invalide'
+        if not 0 <= precision <= MAX_PRECISION:
+            return None, f'precision hors limites (0-{MAX_PRECISION})'
+
+    encoding = (params.get('geometry_encoding') or 'geojson').lower()
+    if encoding not in GEOMETRY_ENCODINGS:
+        return None, f"geometry_encoding invalide (valeurs: {', '.join(GEOMETRY_ENCODINGS)})"
+
+    return (precision, encoding), None
+
+
+def round_coordinates(coordinates, precision):
+    """Arrondit récursivement un tableau de coordonnées GeoJSON"""
+    if coordinates and isinstance(coordinates[0], (list, tuple)):
+        return [round_coordinates(c, precision) for c in coordinates]
+    return [round(c, precision) for c in coordinates]
+
+
+def round_geometry(geometry, precision):
+    if geometry['type'] == 'GeometryCollection':
+        return {
+            'type': 'GeometryCollection',
+            'geometries': [round_geometry(g, precision) for g in geometry['geometries']],
+        }
+    return {'type': geometry['type'], 'coordinates': round_coordinates(geometry['coordinates'], precision)}
+
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode_polyline(points, precision=5):
+    """Encoded Polyline d'une suite de points (x, y) : même sortie que ST_AsEncodedPolyline"""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lng = 0
+    for point in points:
+        lat = int(round(point[1] * factor))
+        lng = int(round(point[0] * factor))
+        out.append(_encode_value(lat - prev_lat))
+        out.append(_encode_value(lng - prev_lng))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(out)
+
+
+def polyline_precision(precision):
+    return min(precision, MAX_POLYLINE_PRECISION)
+
+
+def geometry_polyline(geometry, precision):
+    """{'precision', 'lines'} pour une géométrie linéaire GeoJSON, None sinon"""
+    if not geometry or geometry['type'] not in POLYLINE_TYPES:
+        return None
+    precision = polyline_precision(precision)
+    lines = [geometry['coordinates']] if geometry['type'] == 'LineString' else geometry['coordinates']
+    return {'precision': precision, 'lines': [encode_polyline(line, precision) for line in lines]}
+
+
+class CompactGeometryMixin:
+    """
+    Pour les GeoFeatureModelSerializer : coordonnées limitées à ?precision=
+    et, si polyline_encoding est actif, linéaires en Encoded Polyline.
+    En lecture, ?fields= et ?geometry= restreignent les champs rendus (voir fieldsets).
+    """
+
+    polyline_encoding = False
+
+    @property
+    def geometry_options(self):
+        if not hasattr(self, '_geometry_options'):
+            request = self.context.get('request')
+            if request is None:
+                self._geometry_options = (default_precision(), 'geojson')
+            else:
+                options, error = parse_geometry_options(request.query_params)
+                if error:
+                    raise serializers.ValidationError({'detail': error})
+                self._geometry_options = options
+        return self._geometry_options
+
+    @property
+    def fieldset_options(self):
+        """(noms ou None, mode de géométrie) en lecture, None en écriture ou hors requête"""
+        if not hasattr(self, '_fieldset_options'):
+            request = self.context.get('request')
+            if request is None or request.method not in ('GET', 'HEAD'):
+                self._fieldset_options = None
+            else:
+                options, error = parse_fieldset_options(request.query_params)
+                if error:
+                    raise serializers.ValidationError({'detail': error})
+                self._fieldset_options = options
+        return self._fieldset_options
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset_options is None:
+            return fields
+        names, mode = self.fieldset_options
+        return restrict_fields(self, fields, names, mode)
+
+    def to_representation(self, instance):
+        feature = super().to_representation(instance)
+        geometry = feature.get('geometry')
+        if not geometry:
+            return feature
+
+        precision, encoding = self.geometry_options
+        if encoding == 'polyline' and self.polyline_encoding:
+            parsed = json.loads(geometry) if isinstance(geometry, str) else geometry
+            polyline = geometry_polyline(parsed, precision)
+            if polyline is not None:
+                feature['geometry'] = None
+                feature['polyline'] = polyline
+                return feature
+
+        # Listes : décimales déjà limitées par ST_AsGeoJSON (voir fieldsets)
+        if not self.context.get('geometry_annotated'):
+            feature['geometry'] = round_geometry(geometry, precision)
+        return feature
@@ -0,0 +1,82 @@
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand, CommandError
+from api.registry import INFRASTRUCTURE_TYPES
+
+
+# (type, modèle, champ commune) des tables dont la commune se déduit de la géométrie
+COMMUNE_ASSIGNED_TABLES = [
+    (entry['type'], entry['model'], entry.get('commune_field', 'commune_id'))
+    for entry in INFRASTRUCTURE_TYPES
+]
+
+
+class Command(BaseCommand):
+    help = ("Renseigne la commune des infrastructures à partir de leur géométrie "
+            "(ST_Contains sur communes_rurales), par lots d'identifiants")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'layers', nargs='*',
+            help=f"Tables à traiter (toutes par défaut) : {', '.join(name for name, _, _ in COMMUNE_ASSIGNED_TABLES)}"
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help="Nombre d'identifiants par UPDATE (défaut 5000)"
+        )
+        parser.add_argument(
+            '--only-missing', action='store_true',
+            help="Ne traiter que les lignes sans commune"
+        )
+
+    def handle(self, *args, **options):
+        selected = options['layers']
+        # Pas de choices= : argparse rejette la liste vide (nargs='*') sous Python 3.11+
+        unknown = sorted(set(selected) - {name for name, _, _ in COMMUNE_ASSIGNED_TABLES})
+        if unknown:
+            raise CommandError(f"Tables inconnues: {', '.join(unknown)}")
+        chunk_size = options['chunk_size']
+        total_updated = 0
+
+        for name, model, commune_field in COMMUNE_ASSIGNED_TABLES:
+            if selected and name not in selected:
+                continue
+            total_updated += self._assign_table(name, model, commune_field, chunk_size, options['only_missing'])
+
+        self.stdout.write(self.style.SUCCESS(f"Attribution terminée : {total_updated} lignes mises à jour"))
+
+    def _assign_table(self, name, model, commune_field, chunk_size, only_missing):
+        table = model._meta.db_table
+        pk_column = model._meta.pk.column
+        commune_column = model._meta.get_field(commune_field).column
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT min({pk_column}), max({pk_column}), count(*) FROM {table}")
+            min_id, max_id, row_count = cursor.fetchone()
+        if not row_count:
+            self.stdout.write(f"{name}: table vide")
+            return 0
+
+        # Point intérieur : un linéaire à cheval sur deux communes reçoit une seule commune
+        condition = f"t.{commune_column} IS NULL" if only_missing else f"t.{commune_column} IS DISTINCT FROM c.id"
+        sql = f"""
+            UPDATE {table} t SET {commune_column} = c.id
+            FROM communes_rurales c
+            WHERE t.{pk_column} >= %s AND t.{pk_column} < %s
+              AND t.geom IS NOT NULL AND NOT ST_IsEmpty(t.geom)
+              AND c.geom && t.geom
+              AND ST_Contains(c.geom, ST_PointOnSurface(t.geom))
+              AND {condition}
+        """
+
+        updated = 0
+        for start in range(min_id, max_id + 1, chunk_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [start, start + chunk_size])
+                updated += cursor.rowcount
+            processed = min(start + chunk_size, max_id + 1) - min_id
+            span = max_id + 1 - min_id
+            self.stdout.write(f"  {name}: {processed * 100 // span}% - {updated} lignes mises à jour", ending='\r')
+            self.stdout.flush()
+
+        self.stdout.write(f"{name}: {updated} / {row_count} lignes mises à jour" + ' ' * 20)
+        return updated
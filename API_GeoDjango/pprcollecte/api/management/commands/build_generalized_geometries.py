@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.generalization import GENERALIZED_MODELS, rebuild_generalized_geometries
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les géométries généralisées (pistes, bacs, passages submersibles)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'layers', nargs='*',
+            help=f"Couches à reconstruire (toutes par défaut) : {', '.join(GENERALIZED_MODELS)}"
+        )
+
+    def handle(self, *args, **options):
+        # Pas de choices= : argparse rejette la liste vide (nargs='*') sous Python 3.11+
+        unknown = sorted(set(options['layers']) - set(GENERALIZED_MODELS))
+        if unknown:
+            raise CommandError(f"Couches inconnues: {', '.join(unknown)}")
+        for layer_type in options['layers'] or GENERALIZED_MODELS:
+            count = rebuild_generalized_geometries(layer_type)
+            self.stdout.write(f"{layer_type}: {count} géométries généralisées")
+        self.stdout.write(self.style.SUCCESS("Généralisation terminée"))
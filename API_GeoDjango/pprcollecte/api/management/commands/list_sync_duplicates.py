@@ -0,0 +1,60 @@
+from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from api.registry import INFRASTRUCTURE_TYPES, upsert_fields
+
+
+# Types dont la clé d'envoi repose sur l'id SQLite du mobile (pas les pistes : code_piste)
+SYNC_KEY_TYPES = [entry for entry in INFRASTRUCTURE_TYPES if 'device_id' in upsert_fields(entry)]
+
+
+class Command(BaseCommand):
+    help = ("Liste les doublons (login_id, id SQLite) laissés par des synchronisations "
+            "rejouées, pour nettoyage manuel. Aucune ligne n'est modifiée.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'layers', nargs='*',
+            help=f"Tables à examiner (toutes par défaut) : {', '.join(entry['type'] for entry in SYNC_KEY_TYPES)}"
+        )
+
+    def handle(self, *args, **options):
+        selected = options['layers']
+        unknown = sorted(set(selected) - {entry['type'] for entry in SYNC_KEY_TYPES})
+        if unknown:
+            raise CommandError(f"Tables inconnues: {', '.join(unknown)}")
+
+        total_groups = 0
+        for entry in SYNC_KEY_TYPES:
+            if selected and entry['type'] not in selected:
+                continue
+            total_groups += self._list_table(entry)
+
+        if total_groups:
+            self.stdout.write(self.style.WARNING(f"{total_groups} groupes de doublons à examiner"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Aucun doublon"))
+
+    def _list_table(self, entry):
+        model = entry['model']
+        table = model._meta.db_table
+        pk_column = model._meta.pk.column
+        # Même envoi reçu plusieurs fois : même utilisateur, même installation (ou inconnue), même id SQLite
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT login_id, device_id, id, array_agg({pk_column} ORDER BY {pk_column})
+                FROM {table}
+                WHERE id IS NOT NULL
+                GROUP BY login_id, device_id, id
+                HAVING count(*) > 1
+                ORDER BY login_id, device_id, id
+            """)
+            groups = cursor.fetchall()
+
+        for login_id, device_id, sqlite_id, pks in groups:
+            self.stdout.write(
+                f"{entry['type']}: login_id={login_id} device_id={device_id or '-'} id={sqlite_id} "
+                f"-> {pk_column} {', '.join(str(pk) for pk in pks)}"
+            )
+        if groups:
+            self.stdout.write(f"{entry['type']}: {len(groups)} groupes")
+        return len(groups)
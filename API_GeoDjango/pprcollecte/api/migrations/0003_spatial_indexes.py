@@ -0,0 +1,53 @@
+# Index GiST sur les géométries et index sur les colonnes commune des couches
+# servies par /api/collectes/ (filtres bbox "geom && ST_MakeEnvelope" et commune).
+# Les tables ne sont pas gérées par Django : on ne crée l'index que si la table existe.
+
+from django.db import migrations
+
+
+LAYER_TABLES = [
+    ('services_santes', 'commune_id'),
+    ('ponts', 'commune_id'),
+    ('buses', 'commune_id'),
+    ('dalots', 'commune_id'),
+    ('ecoles', 'commune_id'),
+    ('marches', 'commune_id'),
+    ('batiments_administratifs', 'commune_id'),
+    ('infrastructures_hydrauliques', 'commune_id'),
+    ('localites', 'commune_id'),
+    ('autres_infrastructures', 'commune_id'),
+    ('bacs', 'commune_id'),
+    ('passages_submersibles', 'commune_id'),
+    ('pistes', 'communes_rurales_id'),
+]
+
+
+def _create_sql(table, commune_column):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS {table}_geom_gist ON {table} USING GIST (geom);
+                CREATE INDEX IF NOT EXISTS {table}_{commune_column}_idx ON {table} ({commune_column});
+            END IF;
+        END $$;
+    """
+
+
+def _drop_sql(table, commune_column):
+    return f"""
+        DROP INDEX IF EXISTS {table}_geom_gist;
+        DROP INDEX IF EXISTS {table}_{commune_column}_idx;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_autresinfrastructures_bacs_batimentsadministratifs_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(_create_sql(table, column), _drop_sql(table, column))
+        for table, column in LAYER_TABLES
+    ]
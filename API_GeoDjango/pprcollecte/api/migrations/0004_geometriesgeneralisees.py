@@ -0,0 +1,27 @@
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_spatial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeometriesGeneralisees',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layer', models.CharField(max_length=50)),
+                ('feature_id', models.BigIntegerField()),
+                ('level', models.SmallIntegerField()),
+                ('geom', django.contrib.gis.db.models.fields.GeometryField(blank=True, null=True, srid=4326)),
+            ],
+            options={
+                'db_table': 'geometries_generalisees',
+                'managed': True,
+                'constraints': [models.UniqueConstraint(fields=('layer', 'feature_id', 'level'), name='geometries_generalisees_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Versions de tables maintenues par trigger : toute écriture (API, QGIS, SQL)
+# incrémente la version de la table modifiée.
+
+from django.db import migrations, models
+
+
+VERSIONED_TABLES = [
+    'login', 'regions', 'prefectures', 'communes_rurales', 'pistes', 'chaussees',
+    'points_coupures', 'points_critiques', 'services_santes', 'autres_infrastructures',
+    'bacs', 'batiments_administratifs', 'buses', 'dalots', 'ecoles',
+    'infrastructures_hydrauliques', 'localites', 'marches', 'passages_submersibles',
+    'ponts', 'geometries_generalisees',
+]
+
+CREATE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION api_bump_table_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO versions_tables (table_name, version, updated_at)
+        VALUES (TG_TABLE_NAME, 1, now())
+        ON CONFLICT (table_name)
+        DO UPDATE SET version = versions_tables.version + 1, updated_at = now();
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def _create_trigger_sql(table):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS {table}_version ON {table};
+                CREATE TRIGGER {table}_version
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                    FOR EACH STATEMENT EXECUTE PROCEDURE api_bump_table_version();
+                INSERT INTO versions_tables (table_name, version, updated_at)
+                VALUES ('{table}', 1, now())
+                ON CONFLICT (table_name) DO NOTHING;
+            END IF;
+        END $$;
+    """
+
+
+def _drop_trigger_sql(table):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS {table}_version ON {table};
+            END IF;
+        END $$;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_geometriesgeneralisees'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionsTables',
+            fields=[
+                ('table_name', models.CharField(max_length=80, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'versions_tables',
+                'managed': True,
+            },
+        ),
+        migrations.RunSQL(CREATE_FUNCTION, "DROP FUNCTION IF EXISTS api_bump_table_version() CASCADE;"),
+    ] + [
+        migrations.RunSQL(_create_trigger_sql(table), _drop_trigger_sql(table))
+        for table in VERSIONED_TABLES
+    ]
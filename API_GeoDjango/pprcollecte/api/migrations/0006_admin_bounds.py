@@ -0,0 +1,75 @@
+# Emprise et point intérieur précalculés des limites administratives.
+# Colonnes remplies par trigger à chaque modification de geom (API, QGIS, SQL) :
+# la hiérarchie géographique n'a plus à charger les MultiPolygon.
+#   bbox   double precision[4] : [minLng, minLat, maxLng, maxLat]
+#   centre double precision[2] : [lng, lat] (ST_PointOnSurface, toujours dans le polygone)
+
+from django.db import migrations
+
+
+ADMIN_TABLES = ['regions', 'prefectures', 'communes_rurales']
+
+CREATE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION api_admin_bounds() RETURNS trigger AS $$
+    DECLARE
+        inner_point geometry;
+    BEGIN
+        IF NEW.geom IS NULL OR ST_IsEmpty(NEW.geom) THEN
+            NEW.bbox := NULL;
+            NEW.centre := NULL;
+        ELSE
+            inner_point := ST_PointOnSurface(NEW.geom);
+            NEW.bbox := ARRAY[ST_XMin(NEW.geom), ST_YMin(NEW.geom), ST_XMax(NEW.geom), ST_YMax(NEW.geom)];
+            NEW.centre := ARRAY[ST_X(inner_point), ST_Y(inner_point)];
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def _create_sql(table):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                ALTER TABLE {table} ADD COLUMN IF NOT EXISTS bbox double precision[];
+                ALTER TABLE {table} ADD COLUMN IF NOT EXISTS centre double precision[];
+                DROP TRIGGER IF EXISTS {table}_bounds ON {table};
+                CREATE TRIGGER {table}_bounds
+                    BEFORE INSERT OR UPDATE OF geom ON {table}
+                    FOR EACH ROW EXECUTE PROCEDURE api_admin_bounds();
+                UPDATE {table} SET
+                    bbox = ARRAY[ST_XMin(geom), ST_YMin(geom), ST_XMax(geom), ST_YMax(geom)],
+                    centre = ARRAY[ST_X(ST_PointOnSurface(geom)), ST_Y(ST_PointOnSurface(geom))]
+                WHERE geom IS NOT NULL AND NOT ST_IsEmpty(geom);
+            END IF;
+        END $$;
+    """
+
+
+def _drop_sql(table):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS {table}_bounds ON {table};
+                ALTER TABLE {table} DROP COLUMN IF EXISTS bbox;
+                ALTER TABLE {table} DROP COLUMN IF EXISTS centre;
+            END IF;
+        END $$;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_versionstables'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_FUNCTION, "DROP FUNCTION IF EXISTS api_admin_bounds() CASCADE;"),
+    ] + [
+        migrations.RunSQL(_create_sql(table), _drop_sql(table))
+        for table in ADMIN_TABLES
+    ]
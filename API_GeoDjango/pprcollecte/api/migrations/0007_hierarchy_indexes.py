@@ -0,0 +1,38 @@
+# Index parent + nom : l'expansion d'un noeud de la hiérarchie
+# (/api/geography/nodes/?parent_type=...&parent_id=...) lit les enfants triés
+# par nom directement dans l'index.
+
+from django.db import migrations
+
+
+PARENT_INDEXES = [
+    ('prefectures', 'regions_id'),
+    ('communes_rurales', 'prefectures_id'),
+]
+
+
+def _create_sql(table, parent_column):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS {table}_{parent_column}_nom_idx ON {table} ({parent_column}, nom);
+            END IF;
+        END $$;
+    """
+
+
+def _drop_sql(table, parent_column):
+    return f"DROP INDEX IF EXISTS {table}_{parent_column}_nom_idx;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_admin_bounds'),
+    ]
+
+    operations = [
+        migrations.RunSQL(_create_sql(table, column), _drop_sql(table, column))
+        for table, column in PARENT_INDEXES
+    ]
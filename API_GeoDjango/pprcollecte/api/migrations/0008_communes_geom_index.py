@@ -0,0 +1,25 @@
+# Index GiST sur les limites communales : attribution des communes par
+# ST_Contains (commande assign_communes) sans parcours complet de communes_rurales.
+
+from django.db import migrations
+
+
+CREATE_SQL = """
+    DO $$
+    BEGIN
+        IF to_regclass('communes_rurales') IS NOT NULL THEN
+            CREATE INDEX IF NOT EXISTS communes_rurales_geom_gist ON communes_rurales USING GIST (geom);
+        END IF;
+    END $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_hierarchy_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, "DROP INDEX IF EXISTS communes_rurales_geom_gist;"),
+    ]
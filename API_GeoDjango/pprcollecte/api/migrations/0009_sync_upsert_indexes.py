@@ -0,0 +1,55 @@
+# Index uniques (login_id, device_id, id SQLite du mobile) : cible des
+# INSERT ... ON CONFLICT de l'écriture idempotente (?upsert=1).
+# L'id SQLite n'est unique que sur une installation : device_id (identifiant
+# d'installation envoyé par le mobile) complète la clé. Les lignes existantes
+# gardent device_id NULL, donc distinctes pour l'index : aucune ligne n'est
+# supprimée ni fusionnée. Les doublons déjà présents se listent avec
+# "manage.py list_sync_duplicates" pour un nettoyage manuel.
+# Les pistes s'appuient sur la contrainte unique existante de code_piste.
+
+from django.db import migrations
+
+
+SYNC_TABLES = [
+    'chaussees', 'points_coupures', 'points_critiques',
+    'services_santes', 'autres_infrastructures', 'bacs', 'batiments_administratifs',
+    'buses', 'dalots', 'ecoles', 'infrastructures_hydrauliques', 'localites',
+    'marches', 'passages_submersibles', 'ponts',
+]
+
+
+def _create_sql(table):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                ALTER TABLE {table} ADD COLUMN IF NOT EXISTS device_id varchar(64);
+                CREATE UNIQUE INDEX IF NOT EXISTS {table}_login_device_sqlite_uniq
+                    ON {table} (login_id, device_id, id);
+            END IF;
+        END $$;
+    """
+
+
+def _drop_sql(table):
+    return f"""
+        DROP INDEX IF EXISTS {table}_login_device_sqlite_uniq;
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                ALTER TABLE {table} DROP COLUMN IF EXISTS device_id;
+            END IF;
+        END $$;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_communes_geom_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(_create_sql(table), _drop_sql(table))
+        for table in SYNC_TABLES
+    ]
@@ -0,0 +1,135 @@
+# Téléchargement différentiel (updated_since=<curseur>) :
+#   sync_txid   identifiant de la dernière transaction ayant écrit la ligne
+#               (txid_current(), par trigger), indexé
+#   suppressions journal des lignes supprimées (tombstones), même curseur ;
+#               une ligne qui change de commune laisse aussi un tombstone pour
+#               l'ancienne commune (clients filtrés par commune_id)
+# Le curseur rendu au client est le xmin de l'instantané courant : toute
+# transaction plus ancienne est validée, aucune écriture en cours n'est perdue.
+
+from django.db import migrations, models
+
+
+# (table, clé primaire, colonne commune, colonne id SQLite du mobile)
+SYNC_TABLES = [
+    ('pistes', 'id', 'communes_rurales_id', None),
+    ('chaussees', 'fid', 'communes_rurales_id', 'id'),
+    ('points_coupures', 'fid', 'commune_id', 'id'),
+    ('points_critiques', 'fid', 'commune_id', 'id'),
+    ('services_santes', 'fid', 'commune_id', 'id'),
+    ('autres_infrastructures', 'fid', 'commune_id', 'id'),
+    ('bacs', 'fid', 'commune_id', 'id'),
+    ('batiments_administratifs', 'fid', 'commune_id', 'id'),
+    ('buses', 'fid', 'commune_id', 'id'),
+    ('dalots', 'fid', 'commune_id', 'id'),
+    ('ecoles', 'fid', 'commune_id', 'id'),
+    ('infrastructures_hydrauliques', 'fid', 'commune_id', 'id'),
+    ('localites', 'fid', 'commune_id', 'id'),
+    ('marches', 'fid', 'commune_id', 'id'),
+    ('passages_submersibles', 'fid', 'commune_id', 'id'),
+    ('ponts', 'fid', 'commune_id', 'id'),
+]
+
+CREATE_FUNCTIONS = """
+    CREATE OR REPLACE FUNCTION api_stamp_sync_txid() RETURNS trigger AS $$
+    BEGIN
+        NEW.sync_txid := txid_current();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Arguments : colonne clé primaire, colonne commune, colonne id SQLite ('' si aucune)
+    CREATE OR REPLACE FUNCTION api_record_tombstone() RETURNS trigger AS $$
+    DECLARE
+        old_row jsonb := to_jsonb(OLD);
+    BEGIN
+        INSERT INTO suppressions (layer, feature_id, sqlite_id, login_id, commune_id, sync_txid, deleted_at)
+        VALUES (
+            TG_TABLE_NAME,
+            (old_row ->> TG_ARGV[0])::bigint,
+            CASE WHEN TG_ARGV[2] = '' THEN NULL ELSE (old_row ->> TG_ARGV[2])::bigint END,
+            (old_row ->> 'login_id')::integer,
+            (old_row ->> TG_ARGV[1])::integer,
+            txid_current(),
+            now()
+        );
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTIONS = """
+    DROP FUNCTION IF EXISTS api_stamp_sync_txid() CASCADE;
+    DROP FUNCTION IF EXISTS api_record_tombstone() CASCADE;
+"""
+
+
+def _create_sql(table, pk_column, commune_column, sqlite_column):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                ALTER TABLE {table} ADD COLUMN IF NOT EXISTS sync_txid bigint NOT NULL DEFAULT 0;
+                CREATE INDEX IF NOT EXISTS {table}_sync_txid_idx ON {table} (sync_txid);
+                DROP TRIGGER IF EXISTS {table}_sync_txid ON {table};
+                CREATE TRIGGER {table}_sync_txid
+                    BEFORE INSERT OR UPDATE ON {table}
+                    FOR EACH ROW EXECUTE PROCEDURE api_stamp_sync_txid();
+                DROP TRIGGER IF EXISTS {table}_tombstone ON {table};
+                CREATE TRIGGER {table}_tombstone
+                    AFTER DELETE ON {table}
+                    FOR EACH ROW EXECUTE PROCEDURE api_record_tombstone('{pk_column}', '{commune_column}', '{sqlite_column or ''}');
+                DROP TRIGGER IF EXISTS {table}_commune_tombstone ON {table};
+                CREATE TRIGGER {table}_commune_tombstone
+                    AFTER UPDATE OF {commune_column} ON {table}
+                    FOR EACH ROW WHEN (OLD.{commune_column} IS DISTINCT FROM NEW.{commune_column})
+                    EXECUTE PROCEDURE api_record_tombstone('{pk_column}', '{commune_column}', '{sqlite_column or ''}');
+            END IF;
+        END $$;
+    """
+
+
+def _drop_sql(table):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS {table}_sync_txid ON {table};
+                DROP TRIGGER IF EXISTS {table}_tombstone ON {table};
+                DROP TRIGGER IF EXISTS {table}_commune_tombstone ON {table};
+                ALTER TABLE {table} DROP COLUMN IF EXISTS sync_txid;
+            END IF;
+        END $$;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_sync_upsert_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Suppression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layer', models.CharField(max_length=50)),
+                ('feature_id', models.BigIntegerField()),
+                ('sqlite_id', models.BigIntegerField(blank=True, null=True)),
+                ('login_id', models.IntegerField(blank=True, null=True)),
+                ('commune_id', models.IntegerField(blank=True, null=True)),
+                ('sync_txid', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'suppressions',
+                'managed': True,
+                'indexes': [models.Index(fields=['layer', 'sync_txid'], name='suppressions_layer_txid_idx')],
+            },
+        ),
+        migrations.RunSQL(CREATE_FUNCTIONS, DROP_FUNCTIONS),
+    ] + [
+        migrations.RunSQL(_create_sql(*table), _drop_sql(table[0]))
+        for table in SYNC_TABLES
+    ]
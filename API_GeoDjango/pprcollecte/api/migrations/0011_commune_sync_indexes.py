@@ -0,0 +1,48 @@
+# Index (commune, sync_txid) des couches synchronisées : fraîcheur des paquets
+# hors ligne par commune (sync_txid récents) et téléchargements différentiels
+# filtrés par commune, sans parcours de table.
+
+from django.db import migrations
+
+
+COMMUNE_TABLES = [
+    ('pistes', 'communes_rurales_id'),
+    ('chaussees', 'communes_rurales_id'),
+    ('points_coupures', 'commune_id'),
+    ('points_critiques', 'commune_id'),
+    ('services_santes', 'commune_id'),
+    ('autres_infrastructures', 'commune_id'),
+    ('bacs', 'commune_id'),
+    ('batiments_administratifs', 'commune_id'),
+    ('buses', 'commune_id'),
+    ('dalots', 'commune_id'),
+    ('ecoles', 'commune_id'),
+    ('infrastructures_hydrauliques', 'commune_id'),
+    ('localites', 'commune_id'),
+    ('marches', 'commune_id'),
+    ('passages_submersibles', 'commune_id'),
+    ('ponts', 'commune_id'),
+]
+
+
+def _create_sql(table, commune_column):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS {table}_commune_sync_idx ON {table} ({commune_column}, sync_txid);
+            END IF;
+        END $$;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_sync_changes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(_create_sql(table, commune_column), f"DROP INDEX IF EXISTS {table}_commune_sync_idx;")
+        for table, commune_column in COMMUNE_TABLES
+    ]
@@ -0,0 +1,71 @@
+# Versions de tables sans ligne partagée : le trigger de 0005 mettait à jour
+# la ligne versions_tables de la table écrite, verrou gardé jusqu'au COMMIT,
+# ce qui sérialisait les transactions concurrentes sur une même couche
+# (synchronisations mobiles, éditions QGIS).
+# Le trigger insère désormais une ligne (table, txid_current()) dans un journal :
+# deux transactions n'écrivent jamais la même clé. Version = somme des poids,
+# visible à la validation seulement ; le compactage (versioning.py) regroupe
+# les lignes des transactions terminées sans changer la somme.
+# Les versions atteintes sont reprises comme poids initial : pas de retour en
+# arrière des clés de cache ni des ETag.
+
+from django.db import migrations, models
+
+
+CREATE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION api_bump_table_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO versions_tables_journal (table_name, txid, weight, updated_at)
+        VALUES (TG_TABLE_NAME, txid_current(), 1, now())
+        ON CONFLICT (table_name, txid) DO NOTHING;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    INSERT INTO versions_tables_journal (table_name, txid, weight, updated_at)
+    SELECT table_name, txid_current(), version, updated_at FROM versions_tables;
+"""
+
+# Retour arrière : fonction de 0005, versions reconstituées depuis le journal
+RESTORE_FUNCTION = """
+    INSERT INTO versions_tables (table_name, version, updated_at)
+    SELECT table_name, sum(weight), max(updated_at) FROM versions_tables_journal GROUP BY table_name
+    ON CONFLICT (table_name) DO UPDATE SET version = EXCLUDED.version, updated_at = EXCLUDED.updated_at;
+
+    CREATE OR REPLACE FUNCTION api_bump_table_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO versions_tables (table_name, version, updated_at)
+        VALUES (TG_TABLE_NAME, 1, now())
+        ON CONFLICT (table_name)
+        DO UPDATE SET version = versions_tables.version + 1, updated_at = now();
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_commune_sync_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalVersions',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=80)),
+                ('txid', models.BigIntegerField()),
+                ('weight', models.BigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'versions_tables_journal',
+                'managed': True,
+                'constraints': [models.UniqueConstraint(fields=('table_name', 'txid'), name='versions_tables_journal_uniq')],
+            },
+        ),
+        migrations.RunSQL(CREATE_FUNCTION, RESTORE_FUNCTION),
+        migrations.DeleteModel(name='VersionsTables'),
+    ]
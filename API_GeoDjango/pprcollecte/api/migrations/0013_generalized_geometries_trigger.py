@@ -0,0 +1,94 @@
+# Géométries généralisées maintenues par trigger : les signaux Django ne voyaient
+# que les écritures de l'API, une géométrie modifiée depuis QGIS ou en SQL gardait
+# ses copies simplifiées périmées. Le trigger recalcule les niveaux à chaque
+# INSERT, modification de geom ou DELETE, quel que soit l'auteur de l'écriture.
+# Les niveaux (niveau, tolérance) reprennent api.generalization.GENERALIZATION_LEVELS :
+# une nouvelle migration est nécessaire s'ils changent.
+# Les copies existantes sont recalculées une fois (corrige celles déjà périmées).
+
+from django.db import migrations
+
+
+# (table = nom de couche, clé primaire)
+GENERALIZED_TABLES = [
+    ('pistes', 'id'),
+    ('bacs', 'fid'),
+    ('passages_submersibles', 'fid'),
+]
+
+LEVELS_VALUES = "(0, 0.01), (1, 0.001), (2, 0.0001)"
+
+CREATE_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION api_refresh_generalized() RETURNS trigger AS $$
+    DECLARE
+        feature bigint;
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            EXECUTE format('SELECT ($1).%I', TG_ARGV[0]) INTO feature USING OLD;
+            DELETE FROM geometries_generalisees WHERE layer = TG_TABLE_NAME AND feature_id = feature;
+        END IF;
+        IF TG_OP <> 'DELETE' AND NEW.geom IS NOT NULL THEN
+            EXECUTE format('SELECT ($1).%I', TG_ARGV[0]) INTO feature USING NEW;
+            INSERT INTO geometries_generalisees (layer, feature_id, level, geom)
+            SELECT TG_TABLE_NAME, feature, l.level, ST_SimplifyPreserveTopology(NEW.geom, l.tolerance)
+            FROM (VALUES {LEVELS_VALUES}) AS l(level, tolerance)
+            ON CONFLICT (layer, feature_id, level) DO UPDATE SET geom = EXCLUDED.geom;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTION = "DROP FUNCTION IF EXISTS api_refresh_generalized() CASCADE;"
+
+
+def _create_sql(table, pk_column):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS {table}_generalized_write ON {table};
+                CREATE TRIGGER {table}_generalized_write
+                    AFTER INSERT OR DELETE ON {table}
+                    FOR EACH ROW EXECUTE PROCEDURE api_refresh_generalized('{pk_column}');
+                DROP TRIGGER IF EXISTS {table}_generalized_geom ON {table};
+                CREATE TRIGGER {table}_generalized_geom
+                    AFTER UPDATE OF geom ON {table}
+                    FOR EACH ROW WHEN (OLD.geom IS DISTINCT FROM NEW.geom)
+                    EXECUTE PROCEDURE api_refresh_generalized('{pk_column}');
+
+                DELETE FROM geometries_generalisees WHERE layer = '{table}';
+                INSERT INTO geometries_generalisees (layer, feature_id, level, geom)
+                SELECT '{table}', t.{pk_column}, l.level, ST_SimplifyPreserveTopology(t.geom, l.tolerance)
+                FROM {table} t
+                CROSS JOIN (VALUES {LEVELS_VALUES}) AS l(level, tolerance)
+                WHERE t.geom IS NOT NULL;
+            END IF;
+        END $$;
+    """
+
+
+def _drop_sql(table):
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS {table}_generalized_write ON {table};
+                DROP TRIGGER IF EXISTS {table}_generalized_geom ON {table};
+            END IF;
+        END $$;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_versions_journal'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_FUNCTION, DROP_FUNCTION),
+    ] + [
+        migrations.RunSQL(_create_sql(*table), _drop_sql(table[0]))
+        for table in GENERALIZED_TABLES
+    ]
@@ -157,6 +157,7 @@ class Chaussees(models.Model):
     fid = models.BigAutoField(primary_key=True, db_column='fid')
     geom = models.MultiLineStringField(srid=4326, null=True, blank=True)
     id = models.BigIntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
 
     x_debut_ch = models.FloatField(null=True, blank=True)
     y_fin_chau = models.FloatField(null=True, blank=True)
@@ -209,6 +210,7 @@ class PointsCoupures(models.Model):
     fid = models.BigAutoField(primary_key=True, db_column='fid')
     geom = models.PointField(srid=4326, null=True, blank=True)
     sqlite_id = models.BigIntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
 
     cause_coup = models.CharField(max_length=50, null=True, blank=True)
     x_point_co = models.FloatField(null=True, blank=True)
@@ -252,6 +254,7 @@ class PointsCritiques(models.Model):
     fid = models.BigAutoField(primary_key=True, db_column='fid')
     geom = models.PointField(srid=4326, null=True, blank=True)
     sqlite_id = models.BigIntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
 
     type_point = models.CharField(max_length=50, null=True, blank=True)
     x_point_cr = models.FloatField(null=True, blank=True)
@@ -295,6 +298,7 @@ class ServicesSantes(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_sante = models.FloatField(null=True, blank=True)
     y_sante = models.FloatField(null=True, blank=True)
     nom = models.CharField(max_length=254, null=True, blank=True)
@@ -342,6 +346,7 @@ class AutresInfrastructures(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_autre_in = models.FloatField(null=True, blank=True)
     y_autre_in = models.FloatField(null=True, blank=True)
     type = models.CharField(max_length=254, null=True, blank=True)
@@ -388,6 +393,7 @@ class Bacs(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.GeometryField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_debut_tr = models.FloatField(null=True, blank=True)
     y_debut_tr = models.FloatField(null=True, blank=True)
     x_fin_trav = models.FloatField(null=True, blank=True)
@@ -437,6 +443,7 @@ class BatimentsAdministratifs(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_batiment = models.FloatField(null=True, blank=True)
     y_batiment = models.FloatField(null=True, blank=True)
     nom = models.CharField(max_length=254, null=True, blank=True)
@@ -484,6 +491,7 @@ class Buses(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_buse = models.FloatField(null=True, blank=True)
     y_buse = models.FloatField(null=True, blank=True)
     created_at = models.CharField(max_length=24, null=True, blank=True)
@@ -528,6 +536,7 @@ class Dalots(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_dalot = models.FloatField(null=True, blank=True)
     y_dalot = models.FloatField(null=True, blank=True)
     situation = models.CharField(max_length=254, null=True, blank=True, db_column='situation_')
@@ -573,6 +582,7 @@ class Ecoles(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_ecole = models.FloatField(null=True, blank=True)
     y_ecole = models.FloatField(null=True, blank=True)
     nom = models.CharField(max_length=254, null=True, blank=True)
@@ -620,6 +630,7 @@ class InfrastructuresHydrauliques(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_infrastr = models.FloatField(null=True, blank=True)
     y_infrastr = models.FloatField(null=True, blank=True)
     nom = models.CharField(max_length=254, null=True, blank=True)
@@ -667,6 +678,7 @@ class Localites(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_localite = models.FloatField(null=True, blank=True)
     y_localite = models.FloatField(null=True, blank=True)
     nom = models.CharField(max_length=254, null=True, blank=True)
@@ -713,6 +725,7 @@ class Marches(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_marche = models.FloatField(null=True, blank=True)
     y_marche = models.FloatField(null=True, blank=True)
     nom = models.CharField(max_length=254, null=True, blank=True)
@@ -759,6 +772,7 @@ class PassagesSubmersibles(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.LineStringField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_debut_pa = models.FloatField(null=True, blank=True)
     y_debut_pa = models.FloatField(null=True, blank=True)
     x_fin_pass = models.FloatField(null=True, blank=True)
@@ -808,6 +822,7 @@ class Ponts(models.Model):
     fid = models.BigAutoField(primary_key=True)
     geom = models.PointField(srid=4326)
     sqlite_id = models.IntegerField(null=True, blank=True, db_column='id')
+    device_id = models.CharField(max_length=64, null=True, blank=True)
     x_pont = models.FloatField(null=True, blank=True)
     y_pont = models.FloatField(null=True, blank=True)
     situation = models.CharField(max_length=254, null=True, blank=True, db_column='situation_')
@@ -848,4 +863,77 @@ class Ponts(models.Model):
         managed = False
 
     def __str__(self):
-        return f"Pont {self.fid} - {self.nom_cours or ''}"
\ No newline at end of file
+        return f"Pont {self.fid} - {self.nom_cours or ''}"
+
+class GeometriesGeneralisees(models.Model):
+    """
+    Copies simplifiées (ST_SimplifyPreserveTopology) des géométries linéaires,
+    une par niveau de résolution. Alimentée par trigger (migration 0013), voir api.generalization.
+    """
+    layer = models.CharField(max_length=50)
+    feature_id = models.BigIntegerField()
+    level = models.SmallIntegerField()
+    geom = models.GeometryField(srid=4326, null=True, blank=True)
+
+    class Meta:
+        db_table = 'geometries_generalisees'
+        managed = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=['layer', 'feature_id', 'level'],
+                name='geometries_generalisees_uniq'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.layer} {self.feature_id} (niveau {self.level})"
+
+
+class JournalVersions(models.Model):
+    """
+    Journal des écritures par table, alimenté par trigger (FOR EACH STATEMENT,
+    migration 0012) : une ligne par (table, transaction), en insertion seule.
+    Version d'une table = somme des poids de ses lignes ; elle augmente à la
+    validation de chaque transaction d'écriture, sans ligne partagée à verrouiller.
+    Sert aux ETag / Last-Modified et aux clés de cache.
+    """
+    table_name = models.CharField(max_length=80)
+    txid = models.BigIntegerField()
+    # Nombre de transactions représentées (> 1 après compactage)
+    weight = models.BigIntegerField(default=1)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'versions_tables_journal'
+        managed = True
+        constraints = [
+            models.UniqueConstraint(fields=['table_name', 'txid'], name='versions_tables_journal_uniq')
+        ]
+
+    def __str__(self):
+        return f"{self.table_name} txid {self.txid}"
+
+
+class Suppression(models.Model):
+    """
+    Journal des suppressions (tombstones) des couches synchronisées, alimenté
+    par trigger (migration 0010). sync_txid sert de curseur aux téléchargements
+    différentiels, comme la colonne du même nom sur les tables de collectes.
+    """
+    layer = models.CharField(max_length=50)
+    feature_id = models.BigIntegerField()
+    sqlite_id = models.BigIntegerField(null=True, blank=True)
+    login_id = models.IntegerField(null=True, blank=True)
+    commune_id = models.IntegerField(null=True, blank=True)
+    sync_txid = models.BigIntegerField()
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'suppressions'
+        managed = True
+        indexes = [
+            models.Index(fields=['layer', 'sync_txid'], name='suppressions_layer_txid_idx')
+        ]
+
+    def __str__(self):
+        return f"{self.layer} {self.feature_id} supprimé"
@@ -0,0 +1,91 @@
+#  - Pagination par clé (keyset) pour les listes GeoJSON
+#
+# Les pages sont délimitées par la clé primaire (fid / id) : "WHERE pk > curseur
+# ORDER BY pk LIMIT n" reste servi par l'index quelle que soit la profondeur,
+# contrairement à OFFSET qui relit toutes les lignes précédentes.
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class GeoJsonKeysetPagination(BasePagination):
+    """
+    ?page_size=N et/ou ?cursor=<dernier pk reçu>.
+    Sans l'un de ces paramètres la liste complète est renvoyée, comme avant,
+    pour ne pas tronquer les clients existants.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        default = api_settings.PAGE_SIZE or 500
+        max_page_size = getattr(settings, 'KEYSET_MAX_PAGE_SIZE', 5000)
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            page_size = default
+        return max(1, min(page_size, max_page_size))
+
+    def get_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor in (None, ''):
+            return None
+        try:
+            return int(cursor)
+        except (TypeError, ValueError):
+            raise ValidationError({'cursor': 'Curseur invalide (entier attendu)'})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        pk_name = queryset.model._meta.pk.name
+
+        queryset = queryset.order_by(pk_name)
+        cursor = self.get_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(**{f"{pk_name}__gt": cursor})
+
+        # Une ligne de plus que la page pour savoir s'il reste des données
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_cursor = getattr(page[-1], pk_name) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        # GeoFeatureModelSerializer(many=True) renvoie déjà une FeatureCollection
+        features = data['features'] if isinstance(data, dict) else data
+        return Response({
+            'type': 'FeatureCollection',
+            'features': features,
+            'page_size': self.page_size,
+            'next_cursor': self.next_cursor,
+            'next': self.get_next_link(),
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'type': {'type': 'string'},
+                'features': schema,
+                'page_size': {'type': 'integer'},
+                'next_cursor': {'type': 'integer', 'nullable': True},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            },
+        }
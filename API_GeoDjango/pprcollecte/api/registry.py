@@ -0,0 +1,145 @@
+#  - Registre des types d'infrastructures
+#
+# Une entrée par type : modèle, sérialiseurs, colonnes (identifiant, commune,
+# dates), rendu cartographique et présentation. Partagé par les vues liste
+# génériques (/api/<type>/), /api/collectes/ et les tuiles, l'analyse
+# temporelle et /api/types/.
+#
+# Clés :
+#   type, model, serializer (+ write_serializer si différent en écriture)
+#   kind               'point' ou 'line' (rendu /api/collectes/)
+#   id_field           clé primaire exposée (défaut 'fid')
+#   commune_field      champ commune (défaut 'commune_id')
+#   id_prefix          préfixe des identifiants de features (défaut : type)
+#   generalized        géométries généralisées servies selon le zoom
+#   default_level      niveau de généralisation sans zoom (None = géométrie d'origine)
+#   collectes          inclus dans /api/collectes/ et les tuiles
+#   temporal           inclus dans l'analyse temporelle (date_field, is_varchar_date)
+#   updated_field      date de modification, updated_is_varchar si stockée en texte
+#   extra_filters      {paramètre de requête: champ} propres au type
+#   upsert_fields      clé de l'écriture idempotente (ON CONFLICT), index unique
+#                      en base (défaut : login_id + device_id + sqlite_id, migration 0009)
+#   parents            types à insérer avant celui-ci lors d'une synchronisation
+#                      (en plus de ceux déduits des clés étrangères)
+#   label, icon, color présentation (/api/types/)
+
+from .models import (
+    ServicesSantes, AutresInfrastructures, Bacs, BatimentsAdministratifs,
+    Buses, Dalots, Ecoles, InfrastructuresHydrauliques, Localites,
+    Marches, PassagesSubmersibles, Ponts, Piste, Chaussees, PointsCoupures, PointsCritiques
+)
+from .serializers import (
+    ServicesSantesSerializer, AutresInfrastructuresSerializer, BacsSerializer,
+    BatimentsAdministratifsSerializer, BusesSerializer, DalotsSerializer,
+    EcolesSerializer, InfrastructuresHydrauliquesSerializer, LocalitesSerializer,
+    MarchesSerializer, PassagesSubmersiblesSerializer, PontsSerializer,
+    PisteReadSerializer, PisteWriteSerializer, ChausseesSerializer,
+    PointsCoupuresSerializer, PointsCritiquesSerializer
+)
+
+
+def _collecte(type_name, model, serializer, label, icon, color, **options):
+    """Type collecté par le mobile, servi par /api/collectes/ (ponctuel par défaut)"""
+    return {
+        'type': type_name, 'model': model, 'serializer': serializer, 'kind': 'point',
+        'collectes': True, 'temporal': True, 'date_field': 'created_at', 'is_varchar_date': True,
+        'updated_field': 'updated_at', 'updated_is_varchar': True,
+        'label': label, 'icon': icon, 'color': color, **options,
+    }
+
+
+# Ordre = ordre des features de /api/collectes/ (points puis linéaires)
+INFRASTRUCTURE_TYPES = [
+    _collecte('services_santes', ServicesSantes, ServicesSantesSerializer,
+           'Services de santé', 'hospital', '#E74C3C'),
+    _collecte('ponts', Ponts, PontsSerializer, 'Ponts', 'bridge', '#9B59B6'),
+    _collecte('buses', Buses, BusesSerializer, 'Buses', 'bus', '#E74C3C'),
+    _collecte('dalots', Dalots, DalotsSerializer, 'Dalots', 'water', '#3498DB'),
+    _collecte('ecoles', Ecoles, EcolesSerializer, 'Écoles', 'graduation-cap', '#27AE60'),
+    _collecte('marches', Marches, MarchesSerializer, 'Marchés', 'shopping-cart', '#F1C40F'),
+    _collecte('batiments_administratifs', BatimentsAdministratifs, BatimentsAdministratifsSerializer,
+           'Bâtiments administratifs', 'building', '#34495E'),
+    _collecte('infrastructures_hydrauliques', InfrastructuresHydrauliques, InfrastructuresHydrauliquesSerializer,
+           'Infrastructures hydrauliques', 'tint', '#3498DB'),
+    _collecte('localites', Localites, LocalitesSerializer, 'Localités', 'home', '#E67E22'),
+    _collecte('autres_infrastructures', AutresInfrastructures, AutresInfrastructuresSerializer,
+           'Autres infrastructures', 'map-pin', '#95A5A6'),
+    _collecte('bacs', Bacs, BacsSerializer, 'Bacs', 'ship', '#F39C12',
+           kind='line', id_prefix='bac', generalized=True, default_level=0),
+    {
+        'type': 'pistes', 'model': Piste, 'serializer': PisteReadSerializer,
+        'write_serializer': PisteWriteSerializer, 'kind': 'line',
+        'id_field': 'id', 'commune_field': 'communes_rurales_id', 'id_prefix': 'piste',
+        'generalized': True, 'default_level': 1,
+        'collectes': True, 'temporal': True, 'date_field': 'created_at', 'is_varchar_date': False,
+        'updated_field': 'updated_at', 'updated_is_varchar': False, 'upsert_fields': ['code_piste'],
+        'label': 'Pistes', 'icon': 'road', 'color': '#2C3E50',
+    },
+    _collecte('passages_submersibles', PassagesSubmersibles, PassagesSubmersiblesSerializer,
+           'Passages submersibles', 'water', '#1ABC9C', kind='line', generalized=True),
+    {
+        'type': 'chaussees', 'model': Chaussees, 'serializer': ChausseesSerializer, 'kind': 'line',
+        'commune_field': 'communes_rurales_id', 'upsert_fields': ['login_id', 'device_id', 'id'],
+        'updated_field': 'updated_at', 'updated_is_varchar': True,
+        'extra_filters': {'code_piste': 'code_piste_id'},
+        'label': 'Chaussées', 'icon': 'road', 'color': '#8e44ad',
+    },
+    {
+        'type': 'points_coupures', 'model': PointsCoupures, 'serializer': PointsCoupuresSerializer,
+        'kind': 'point', 'updated_field': 'updated_at', 'updated_is_varchar': True,
+        'extra_filters': {'chaussee_id': 'chaussee_id'}, 'parents': ['chaussees'],
+    },
+    {
+        'type': 'points_critiques', 'model': PointsCritiques, 'serializer': PointsCritiquesSerializer,
+        'kind': 'point', 'updated_field': 'updated_at', 'updated_is_varchar': True,
+        'extra_filters': {'chaussee_id': 'chaussee_id'}, 'parents': ['chaussees'],
+    },
+]
+
+INFRASTRUCTURES = {entry['type']: entry for entry in INFRASTRUCTURE_TYPES}
+
+
+def get_infrastructure(type_name):
+    return INFRASTRUCTURES[type_name]
+
+
+def upsert_fields(entry):
+    """Clé de l'écriture idempotente : id SQLite unique par utilisateur et installation"""
+    return entry.get('upsert_fields', ['login_id', 'device_id', 'sqlite_id'])
+
+
+def collectes_types():
+    return [entry for entry in INFRASTRUCTURE_TYPES if entry.get('collectes')]
+
+
+def temporal_types():
+    return [entry for entry in INFRASTRUCTURE_TYPES if entry.get('temporal')]
+
+
+def presented_types():
+    """Types affichés dans les légendes et filtres du tableau de bord"""
+    return [entry for entry in INFRASTRUCTURE_TYPES if entry.get('label')]
+
+
+def _parent_types(entry):
+    models = {other['model']: other['type'] for other in INFRASTRUCTURE_TYPES}
+    parents = set(entry.get('parents', []))
+    for field in entry['model']._meta.concrete_fields:
+        if field.many_to_one and field.related_model in models and field.related_model is not entry['model']:
+            parents.add(models[field.related_model])
+    return parents
+
+
+def sync_order():
+    """Types triés parents d'abord (Piste avant Chaussees et les éléments liés par code_piste)"""
+    remaining = list(INFRASTRUCTURE_TYPES)
+    ordered, placed = [], set()
+    while remaining:
+        ready = [entry for entry in remaining if _parent_types(entry) <= placed]
+        if not ready:
+            raise ValueError(f"Dépendances circulaires: {[entry['type'] for entry in remaining]}")
+        for entry in ready:
+            ordered.append(entry)
+            placed.add(entry['type'])
+            remaining.remove(entry)
+    return ordered
@@ -0,0 +1,25 @@
+#  - Renderers DRF additionnels
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from .geobuf import encode_geojson, CONTENT_TYPE
+
+
+class GeobufRenderer(BaseRenderer):
+    """
+    GeoJSON compact (Geobuf) : ?format=geobuf ou Accept: application/x-protobuf
+    Mêmes features et propriétés que la sortie JSON.
+    """
+    media_type = CONTENT_TYPE
+    format = 'geobuf'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return encode_geojson(data)
+
+
+# Vues dont la réponse est une FeatureCollection : renderers par défaut + Geobuf
+GEOJSON_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [GeobufRenderer]
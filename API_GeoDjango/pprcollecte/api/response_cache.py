@@ -0,0 +1,81 @@
+#  - Cache des réponses /api/collectes/ (octets déjà encodés)
+#
+# Clé = jeu de filtres normalisé + versions des tables (toute écriture, y compris
+# SQL direct ou autre processus, change la clé). Chaque entrée mémorise aussi les
+# couches et les communes qu'elle couvre : les signaux libèrent tôt les entrées
+# périmées de ce processus (optimisation mémoire, pas condition d'exactitude).
+# Cache propre au processus, borné en octets, éviction LRU.
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class CollectesResponseCache:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # clé -> (body, types, communes ou None)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(region_id=None, prefecture_id=None, commune_id=None, types=None, **options):
+        """Filtres normalisés : valeurs nettoyées, types triés, options (bbox, zoom...) ordonnées"""
+        def clean(value):
+            return str(value).strip() if value not in (None, '') else None
+
+        return (
+            clean(region_id), clean(prefecture_id), clean(commune_id),
+            tuple(sorted(set(types or []))),
+            tuple(sorted((name, value) for name, value in options.items() if value is not None)),
+        )
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, body, layer_types, commune_ids):
+        if len(body) > self.max_bytes:
+            return
+        communes = frozenset(commune_ids) if commune_ids is not None else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (body, frozenset(layer_types), communes)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate(self, layer_type, commune_id=None):
+        """
+        Supprime les entrées contenant la couche et la commune données.
+        commune_id None = élément sans commune : toutes les entrées de la couche.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                _, layer_types, communes = self._entries[key]
+                if layer_type not in layer_types:
+                    continue
+                if commune_id is None or communes is None or commune_id in communes:
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+
+collectes_cache = CollectesResponseCache(
+    getattr(settings, 'COLLECTES_RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+)
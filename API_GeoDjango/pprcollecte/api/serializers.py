@@ -1,5 +1,8 @@
 from rest_framework import serializers
 from rest_framework_gis.serializers import GeoFeatureModelSerializer
+from django.conf import settings
+from .geometry_encoding import CompactGeometryMixin
+from .spatial_index import commune_locator
 from .models import Login
 from .models import Piste
 from .models import (
@@ -12,19 +15,48 @@ from rest_framework_gis.fields import GeometryField
 from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.gis.geos import LineString, MultiLineString
 
-class RegionSerializer(GeoFeatureModelSerializer):
+class CommuneAssignmentMixin:
+    """
+    Renseigne la commune à partir de la géométrie (index de localisation en mémoire).
+    Une commune absente ou différente de celle qui contient la géométrie est remplacée ;
+    hors de toute commune, la valeur envoyée est conservée.
+    """
+    commune_field = 'commune_id'
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        geom = attrs.get('geom')
+        if geom is None or not getattr(settings, 'AUTO_ASSIGN_COMMUNE', True):
+            return attrs
+
+        try:
+            location = commune_locator.locate_geometry(geom)
+        except Exception as e:
+            print(f"⚠️ Attribution automatique de commune impossible: {e}")
+            return attrs
+
+        if location is not None:
+            current = attrs.get(self.commune_field)
+            if getattr(current, 'pk', current) != location['commune_id']:
+                attrs[self.commune_field] = CommuneRurale(
+                    id=location['commune_id'], nom=location['commune_nom']
+                )
+        return attrs
+
+
+class RegionSerializer(CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Region
         geo_field = "geom"
         fields = '__all__'
 
-class PrefectureSerializer(GeoFeatureModelSerializer):
+class PrefectureSerializer(CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Prefecture
         geo_field = "geom"
         fields = '__all__'
 
-class CommuneRuraleSerializer(GeoFeatureModelSerializer):
+class CommuneRuraleSerializer(CompactGeometryMixin, GeoFeatureModelSerializer):
     # Ajouter ces lignes pour afficher les infos hiérarchiques
     prefecture_nom = serializers.CharField(source='prefectures_id.nom', read_only=True)
     prefecture_id = serializers.IntegerField(source='prefectures_id.id', read_only=True)
@@ -43,7 +75,7 @@ class CommuneRuraleSerializer(GeoFeatureModelSerializer):
         region = obj.prefectures_id.regions_id.nom if obj.prefectures_id and obj.prefectures_id.regions_id else "N/A"
         return f"{obj.nom}, {prefecture}, {region}"
     
-class PointsCoupuresSerializer(GeoFeatureModelSerializer):
+class PointsCoupuresSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = PointsCoupures
         geo_field = "geom"
@@ -65,7 +97,7 @@ class PointsCoupuresSerializer(GeoFeatureModelSerializer):
         return super().to_internal_value(data)
 
 
-class PointsCritiquesSerializer(GeoFeatureModelSerializer):
+class PointsCritiquesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = PointsCritiques
         geo_field = "geom"
@@ -88,7 +120,7 @@ class PointsCritiquesSerializer(GeoFeatureModelSerializer):
 
 
 
-class ServicesSantesSerializer(GeoFeatureModelSerializer):
+class ServicesSantesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = ServicesSantes
         geo_field = "geom"
@@ -106,7 +138,7 @@ class ServicesSantesSerializer(GeoFeatureModelSerializer):
             data['geom'] = Point(x, y, srid=4326)
         return super().to_internal_value(data)
 
-class AutresInfrastructuresSerializer(GeoFeatureModelSerializer):
+class AutresInfrastructuresSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = AutresInfrastructures
         geo_field = "geom"
@@ -123,7 +155,9 @@ class AutresInfrastructuresSerializer(GeoFeatureModelSerializer):
             data['geom'] = Point(x, y, srid=4326)
         return super().to_internal_value(data)
 
-class BacsSerializer(GeoFeatureModelSerializer):
+class BacsSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
+    polyline_encoding = True
+
     class Meta:
         model = Bacs
         geo_field = "geom"
@@ -149,7 +183,7 @@ class BacsSerializer(GeoFeatureModelSerializer):
             
         return super().to_internal_value(data)
 
-class BatimentsAdministratifsSerializer(GeoFeatureModelSerializer):
+class BatimentsAdministratifsSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = BatimentsAdministratifs
         geo_field = "geom"
@@ -166,7 +200,7 @@ class BatimentsAdministratifsSerializer(GeoFeatureModelSerializer):
             data['geom'] = Point(x, y, srid=4326)
         return super().to_internal_value(data)
 
-class BusesSerializer(GeoFeatureModelSerializer):
+class BusesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Buses
         geo_field = "geom"
@@ -183,7 +217,7 @@ class BusesSerializer(GeoFeatureModelSerializer):
             data['geom'] = Point(x, y, srid=4326)
         return super().to_internal_value(data)
 
-class DalotsSerializer(GeoFeatureModelSerializer):
+class DalotsSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Dalots
         geo_field = "geom"
@@ -200,7 +234,7 @@ class DalotsSerializer(GeoFeatureModelSerializer):
             data['geom'] = Point(x, y, srid=4326)
         return super().to_internal_value(data)
 
-class EcolesSerializer(GeoFeatureModelSerializer):
+class EcolesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Ecoles
         geo_field = "geom"
@@ -217,7 +251,7 @@ class EcolesSerializer(GeoFeatureModelSerializer):
             data['geom'] = Point(x, y, srid=4326)
         return super().to_internal_value(data)
 
-class InfrastructuresHydrauliquesSerializer(GeoFeatureModelSerializer):
+class InfrastructuresHydrauliquesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = InfrastructuresHydrauliques
         geo_field = "geom"
@@ -234,7 +268,7 @@ class InfrastructuresHydrauliquesSerializer(GeoFeatureModelSerializer):
             data['geom'] = Point(x, y, srid=4326)
         return super().to_internal_value(data)
 
-class LocalitesSerializer(GeoFeatureModelSerializer):
+class LocalitesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Localites
         geo_field = "geom"
@@ -254,7 +288,7 @@ class LocalitesSerializer(GeoFeatureModelSerializer):
         
         return super().to_internal_value(data)
 
-class MarchesSerializer(GeoFeatureModelSerializer):
+class MarchesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Marches
         geo_field = "geom"
@@ -271,7 +305,9 @@ class MarchesSerializer(GeoFeatureModelSerializer):
             data['geom'] = Point(x, y, srid=4326)
         return super().to_internal_value(data)
 
-class PassagesSubmersiblesSerializer(GeoFeatureModelSerializer):
+class PassagesSubmersiblesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
+    polyline_encoding = True
+
     class Meta:
         model = PassagesSubmersibles
         geo_field = "geom"
@@ -297,7 +333,7 @@ class PassagesSubmersiblesSerializer(GeoFeatureModelSerializer):
     
     
 
-class PontsSerializer(GeoFeatureModelSerializer):
+class PontsSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Ponts
         geo_field = "geom"
@@ -335,7 +371,10 @@ class LoginSerializer(serializers.ModelSerializer):
 
 
 
-class PisteWriteSerializer(GeoFeatureModelSerializer):
+class PisteWriteSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
+    commune_field = 'communes_rurales_id'
+    polyline_encoding = True
+
     class Meta:
         model = Piste
         geo_field = "geom"
@@ -348,7 +387,10 @@ class PisteWriteSerializer(GeoFeatureModelSerializer):
             data['geom'] = geom
         return super().to_internal_value(data)
 
-class ChausseesSerializer(GeoFeatureModelSerializer):
+class ChausseesSerializer(CommuneAssignmentMixin, CompactGeometryMixin, GeoFeatureModelSerializer):
+    commune_field = 'communes_rurales_id'
+    polyline_encoding = True
+
     class Meta:
         model = Chaussees
         geo_field = "geom"
@@ -375,7 +417,9 @@ class ChausseesSerializer(GeoFeatureModelSerializer):
         return super().to_internal_value(data)
 
 # LECTURE : expose l'annotation 'geom_4326' comme géométrie principale
-class PisteReadSerializer(GeoFeatureModelSerializer):
+class PisteReadSerializer(CompactGeometryMixin, GeoFeatureModelSerializer):
+    polyline_encoding = True
+
     class Meta:
         model = Piste
         geo_field = "geom"      # on expose directement geom (4326)
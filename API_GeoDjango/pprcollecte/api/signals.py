@@ -0,0 +1,54 @@
+#  - Signaux : maintenance des données dérivées lors des écritures
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .admin_closure import commune_closure
+from .models import Region, Prefecture, CommuneRurale
+from .response_cache import collectes_cache
+from .spatial_index import commune_locator
+from .spatial_sql import COLLECTES_LAYERS
+
+
+def _collectes_layer(sender):
+    for layer in COLLECTES_LAYERS:
+        if sender is layer['model']:
+            return layer
+    return None
+
+
+def _commune_attname(layer):
+    return layer['model']._meta.get_field(layer.get('commune_field', 'commune_id')).attname
+
+
+@receiver(pre_save)
+def remember_previous_commune(sender, instance, **kwargs):
+    """Une modification peut changer la commune : l'ancienne doit aussi être invalidée"""
+    layer = _collectes_layer(sender)
+    if layer is None or instance.pk is None:
+        return
+    attname = _commune_attname(layer)
+    instance._previous_commune_id = (
+        sender.objects.filter(pk=instance.pk).values_list(attname, flat=True).first()
+    )
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_collectes_cache(sender, instance, **kwargs):
+    layer = _collectes_layer(sender)
+    if layer is None:
+        return
+    commune_ids = {getattr(instance, _commune_attname(layer))}
+    if hasattr(instance, '_previous_commune_id'):
+        commune_ids.add(instance._previous_commune_id)
+    for commune_id in commune_ids:
+        collectes_cache.invalidate(layer['type'], commune_id)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def refresh_commune_closure(sender, instance, **kwargs):
+    """Découpage administratif modifié : fermeture et index de localisation relisent leur version"""
+    if sender in (Region, Prefecture, CommuneRurale):
+        commune_closure.invalidate()
+        commune_locator.invalidate()
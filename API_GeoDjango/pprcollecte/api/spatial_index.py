@@ -0,0 +1,127 @@
+#  - Index spatial en mémoire pour la localisation de points (géocodage inverse)
+#
+# STRtree (Sort-Tile-Recursive) sur les emprises des communes, puis test exact
+# sur les géométries GEOS préparées. Construit à la première demande à partir
+# des limites communales, reconstruit quand le découpage administratif change.
+
+import math
+
+from django.contrib.gis.geos import Point
+from django.conf import settings
+from .admin_closure import HierarchySnapshot
+from .models import CommuneRurale
+
+
+class STRtree:
+    """
+    R-tree statique construit par Sort-Tile-Recursive.
+    items : liste de (emprise (minx, miny, maxx, maxy), valeur)
+    """
+
+    def __init__(self, items, node_capacity=10):
+        self.node_capacity = node_capacity
+        self.root = self._build([(bbox, value, None) for bbox, value in items]) if items else None
+
+    @staticmethod
+    def _union(entries):
+        return (
+            min(e[0][0] for e in entries), min(e[0][1] for e in entries),
+            max(e[0][2] for e in entries), max(e[0][3] for e in entries),
+        )
+
+    def _build(self, entries):
+        """Entrées (emprise, valeur, enfants) regroupées niveau par niveau jusqu'à la racine"""
+        capacity = self.node_capacity
+        while len(entries) > capacity:
+            node_count = math.ceil(len(entries) / capacity)
+            slice_count = math.ceil(math.sqrt(node_count))
+            slice_size = slice_count * capacity
+
+            entries.sort(key=lambda e: e[0][0] + e[0][2])
+            parents = []
+            for start in range(0, len(entries), slice_size):
+                vertical_slice = sorted(entries[start:start + slice_size], key=lambda e: e[0][1] + e[0][3])
+                for node_start in range(0, len(vertical_slice), capacity):
+                    children = vertical_slice[node_start:node_start + capacity]
+                    parents.append((self._union(children), None, children))
+            entries = parents
+        return (self._union(entries), None, entries)
+
+    def query_point(self, x, y):
+        """Valeurs dont l'emprise contient le point (x, y)"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            bbox, value, children = stack.pop()
+            if not (bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]):
+                continue
+            if children is None:
+                found.append(value)
+            else:
+                stack.extend(children)
+        return found
+
+
+class CommuneLocator(HierarchySnapshot):
+    """Commune / préfecture / région contenant un point WGS84"""
+
+    def __init__(self, check_interval):
+        super().__init__(check_interval)
+        self._tree = STRtree([])
+
+    def _load(self):
+        items = []
+        rows = CommuneRurale.objects.filter(geom__isnull=False).values_list(
+            'id', 'nom', 'geom',
+            'prefectures_id_id', 'prefectures_id__nom',
+            'prefectures_id__regions_id_id', 'prefectures_id__regions_id__nom',
+        ).order_by('id')
+        for commune_id, nom, geom, prefecture_id, prefecture_nom, region_id, region_nom in rows:
+            if geom.empty:
+                continue
+            if geom.srid and geom.srid != 4326:
+                geom.transform(4326)
+            location = {
+                'commune_id': commune_id,
+                'commune_nom': nom,
+                'prefecture_id': prefecture_id,
+                'prefecture_nom': prefecture_nom,
+                'region_id': region_id,
+                'region_nom': region_nom,
+            }
+            # La géométrie est gardée avec sa version préparée (qui la référence)
+            items.append((geom.extent, (commune_id, geom, geom.prepared, location)))
+
+        self._tree = STRtree(items)
+        print(f"🧭 Index de localisation construit: {len(items)} communes")
+
+    def locate(self, x, y):
+        """Dictionnaire de localisation, ou None si le point n'est dans aucune commune"""
+        self._ensure_fresh()
+        candidates = self._tree.query_point(x, y)
+        if not candidates:
+            return None
+        point = Point(x, y, srid=4326)
+        # Ordre des identifiants : résultat stable pour un point sur une limite commune
+        for _, _, prepared, location in sorted(candidates, key=lambda c: c[0]):
+            if prepared.covers(point):
+                return location
+        return None
+
+    def locate_geometry(self, geom):
+        """Localisation d'une géométrie quelconque par son point intérieur (ST_PointOnSurface)"""
+        if geom is None or geom.empty:
+            return None
+        if geom.srid and geom.srid != 4326:
+            geom = geom.transform(4326, clone=True)
+        point = geom if geom.geom_type == 'Point' else geom.point_on_surface
+        return self.locate(point.x, point.y)
+
+    def locate_many(self, points):
+        self._ensure_fresh()
+        return [self.locate(x, y) for x, y in points]
+
+
+commune_locator = CommuneLocator(getattr(settings, 'ADMIN_CLOSURE_CHECK_INTERVAL', 5))
@@ -0,0 +1,484 @@
+#  - Construction des FeatureCollection GeoJSON directement dans PostGIS
+#
+# Chaque couche est décrite une seule fois (table, colonne commune, préfixe
+# d'identifiant, généralisation) et traduite en un SELECT qui produit les
+# features avec ST_AsGeoJSON / json_build_object. Les couches sont réunies en
+# un seul UNION ALL agrégé par json_agg : Python ne fait que recopier les
+# octets renvoyés par la base, sans jamais décoder les géométries.
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from .models import GeometriesGeneralisees
+from .registry import collectes_types
+from .generalization import level_for_zoom, level_tolerance
+from .geometry_encoding import default_precision, polyline_precision
+from .geobuf import read_wkb
+
+
+# Couches du registre des infrastructures, dans l'ordre des features de la réponse
+COLLECTES_LAYERS = collectes_types()
+
+
+def get_collectes_layers(types_filter=None):
+    """Couches à inclure selon le filtre 'types' (toutes si vide)"""
+    if not types_filter:
+        return list(COLLECTES_LAYERS)
+    return [layer for layer in COLLECTES_LAYERS if layer['type'] in types_filter]
+
+
+def collectes_version_tables():
+    """Tables dont dépend le contenu de /api/collectes/ et des tuiles"""
+    return [layer['model']._meta.db_table for layer in COLLECTES_LAYERS] + [
+        GeometriesGeneralisees._meta.db_table, 'communes_rurales', 'prefectures'
+    ]
+
+
+def _column(model, field_name):
+    return model._meta.get_field(field_name).column
+
+
+def _generalized_level(layer, filters=None):
+    """Niveau de géométrie généralisée à servir (None = géométrie d'origine)"""
+    if not layer.get('generalized'):
+        return None
+    zoom = (filters or {}).get('zoom')
+    if zoom is not None:
+        return level_for_zoom(zoom)
+    return layer.get('default_level')
+
+
+def _geometry_sql(layer, filters=None):
+    """Expression SQL de la géométrie restituée pour une couche"""
+    level = _generalized_level(layer, filters)
+    if level is None:
+        return 't.geom'
+    _, _, id_column, _ = _layer_columns(layer)
+    # Géométrie précalculée ; repli sur une simplification à la volée si le
+    # niveau n'a pas encore été construit pour cet élément
+    return f"""COALESCE(
+            (SELECT gg.geom FROM {GeometriesGeneralisees._meta.db_table} gg
+             WHERE gg.layer = '{layer['type']}' AND gg.feature_id = t.{id_column} AND gg.level = {int(level)}),
+            ST_SimplifyPreserveTopology(t.geom, {float(level_tolerance(level))})
+        )"""
+
+
+def _layer_columns(layer):
+    """(table, champ identifiant, colonne identifiant, colonne commune) d'une couche"""
+    model = layer['model']
+    id_field = layer.get('id_field', 'fid')
+    return (
+        model._meta.db_table,
+        id_field,
+        _column(model, id_field),
+        _column(model, layer.get('commune_field', 'commune_id')),
+    )
+
+
+def _layer_filters(layer, filters=None):
+    """
+    Clauses WHERE communes à toutes les sorties d'une couche : (clauses, params)
+    filters : {'commune_ids': None ou liste, 'bbox': (minx, miny, maxx, maxy) ou None}
+    (les autres clés - zoom, precision, geometry_encoding, cluster - concernent le rendu)
+    """
+    filters = filters or {}
+    _, _, _, commune_column = _layer_columns(layer)
+    target_commune_ids = filters.get('commune_ids')
+    where = ['t.geom IS NOT NULL']
+    params = []
+
+    if layer['kind'] == 'line':
+        where.append("GeometryType(t.geom) IN ('POINT', 'LINESTRING', 'MULTILINESTRING')")
+
+    if target_commune_ids is not None:
+        where.append(f't.{commune_column} = ANY(%s)')
+        # Listes de la fermeture administrative transmises telles quelles (tableau PostgreSQL)
+        params.append(target_commune_ids if isinstance(target_commune_ids, list) else list(target_commune_ids))
+
+    bbox = filters.get('bbox')
+    if bbox:
+        # Opérateur && : filtre d'emprise servi par l'index GiST sur geom
+        where.append('t.geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)')
+        params.extend(bbox)
+
+    return where, params
+
+
+def _precision(filters=None):
+    return int((filters or {}).get('precision', default_precision()))
+
+
+def _geometry_json_sql(layer, filters=None):
+    """
+    Expressions SQL des clés 'geometry' et 'polyline' (None si absente) d'une feature.
+    Coordonnées limitées à 'precision' décimales par ST_AsGeoJSON ; en mode
+    geometry_encoding='polyline', les linéaires sont encodés par ST_AsEncodedPolyline
+    (une chaîne par LineString) et 'geometry' vaut null.
+    """
+    filters = filters or {}
+    precision = _precision(filters)
+    geometry = f"ST_AsGeoJSON(g.geom, {precision})::json"
+    if layer['kind'] != 'line' or filters.get('geometry_encoding') != 'polyline':
+        return geometry, None
+
+    is_line = "GeometryType(g.geom) IN ('LINESTRING', 'MULTILINESTRING')"
+    encoded_precision = polyline_precision(precision)
+    polyline = f"""CASE WHEN {is_line} THEN json_build_object(
+                       'precision', {encoded_precision},
+                       'lines', (SELECT json_agg(ST_AsEncodedPolyline(d.geom, {encoded_precision}) ORDER BY d.path)
+                                 FROM ST_Dump(g.geom) d)
+                   ) END"""
+    return f"CASE WHEN {is_line} THEN NULL ELSE {geometry} END", polyline
+
+
+def build_layer_sql(layer, filters=None, ordinal=0):
+    """
+    SELECT produisant une ligne (ord, feature json) par élément de la couche.
+    Retourne (sql, params).
+    """
+    table, id_field, id_column, commune_column = _layer_columns(layer)
+    id_prefix = layer.get('id_prefix', layer['type'])
+
+    where, filter_params = _layer_filters(layer, filters)
+    where += ['g.geom IS NOT NULL', 'NOT ST_IsEmpty(g.geom)']
+    params = [f"{id_prefix}_", id_field, layer['type']] + filter_params
+    geometry_sql, polyline_sql = _geometry_json_sql(layer, filters)
+    polyline_key = f",\n                   'polyline', {polyline_sql}" if polyline_sql else ''
+
+    sql = f"""
+        SELECT {int(ordinal)} AS ord,
+               json_build_object(
+                   'type', 'Feature',
+                   'id', %s::text || t.{id_column},
+                   'geometry', {geometry_sql},
+                   'properties', json_build_object(
+                       %s::text, t.{id_column},
+                       'type', %s::text,
+                       'commune_id', t.{commune_column}
+                   ){polyline_key}
+               ) AS feature
+        FROM {table} t
+        CROSS JOIN LATERAL (SELECT {_geometry_sql(layer, filters)} AS geom) g
+        WHERE {' AND '.join(where)}
+    """
+    return sql, params
+
+
+def count_features_by_commune(layers, commune_ids=None):
+    """
+    {commune_id: nombre de features} toutes couches confondues.
+    Un seul statement ; chaque couche est comptée sur son index commune.
+    """
+    if not layers:
+        return {}
+
+    selects = []
+    params = []
+    for layer in layers:
+        table, _, _, commune_column = _layer_columns(layer)
+        where, filter_params = _layer_filters(layer, {'commune_ids': commune_ids})
+        selects.append(
+            f"SELECT t.{commune_column} AS commune_id, count(*) AS n FROM {table} t "
+            f"WHERE {' AND '.join(where)} GROUP BY 1"
+        )
+        params += filter_params
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT c.commune_id, sum(c.n)::bigint FROM ({' UNION ALL '.join(selects)}) c "
+            f"WHERE c.commune_id IS NOT NULL GROUP BY 1",
+            params
+        )
+        return dict(cursor.fetchall())
+
+
+def cluster_grid_size(zoom, radius_px):
+    """Côté de la cellule de regroupement (degrés) : radius_px pixels au zoom donné"""
+    return radius_px * 360.0 / (256 * 2 ** zoom)
+
+
+def build_cluster_sql(layers, filters, ordinal=0):
+    """
+    Regroupement des couches ponctuelles sur une grille (ST_SnapToGrid).
+    Une feature par cellule : centroïde des points, effectif total et
+    effectif par type. Retourne (sql, params) au même format que build_layer_sql.
+    """
+    points = []
+    params = []
+    for layer in layers:
+        table = layer['model']._meta.db_table
+        where, filter_params = _layer_filters(layer, filters)
+        points.append(f"SELECT %s::text AS type, t.geom FROM {table} t WHERE {' AND '.join(where)}")
+        params += [layer['type']] + filter_params
+
+    grid_size = float(filters['cluster_grid_size'])
+    sql = f"""
+        SELECT {int(ordinal)} AS ord,
+               json_build_object(
+                   'type', 'Feature',
+                   'id', 'cluster_' || row_number() OVER (),
+                   'geometry', ST_AsGeoJSON(ST_MakePoint(sum(c.sx) / sum(c.n), sum(c.sy) / sum(c.n)), {_precision(filters)})::json,
+                   'properties', json_build_object(
+                       'cluster', true,
+                       'count', sum(c.n),
+                       'types', json_object_agg(c.type, c.n)
+                   )
+               ) AS feature
+        FROM (
+            SELECT ST_SnapToGrid(p.geom, {grid_size}) AS cell, p.type,
+                   count(*) AS n, sum(ST_X(p.geom)) AS sx, sum(ST_Y(p.geom)) AS sy
+            FROM ({' UNION ALL '.join(points)}) p
+            GROUP BY 1, 2
+        ) c
+        GROUP BY c.cell
+    """
+    return sql, params
+
+
+def build_feature_selects(layers, filters=None):
+    """Liste des SELECT (sql, params) produisant les features, dans l'ordre de la réponse"""
+    filters = filters or {}
+    selects = []
+
+    if filters.get('cluster'):
+        # Mode regroupement : les points deviennent des agrégats, les linéaires restent détaillés
+        point_layers = [layer for layer in layers if layer['kind'] == 'point']
+        layers = [layer for layer in layers if layer['kind'] != 'point']
+        if point_layers:
+            selects.append(build_cluster_sql(point_layers, filters))
+
+    for ordinal, layer in enumerate(layers, start=len(selects)):
+        selects.append(build_layer_sql(layer, filters, ordinal))
+    return selects
+
+
+def build_feature_collection_sql(layers, filters=None):
+    """Un seul statement UNION ALL : retourne (nombre de features, tableau JSON texte)"""
+    selects = build_feature_selects(layers, filters)
+    params = [param for _, select_params in selects for param in select_params]
+
+    sql = f"""
+        SELECT count(*), COALESCE(json_agg(f.feature ORDER BY f.ord), '[]'::json)::text
+        FROM ({' UNION ALL '.join(sql for sql, _ in selects)}) f
+    """
+    return sql, params
+
+
+def fetch_feature_collection(layers, filters=None, workers=1):
+    """
+    Exécute la requête agrégée. Retourne (total, octets du tableau 'features')
+    workers > 1 : une requête par couche, exécutées en parallèle (voir fetch_layers_parallel),
+    au plus MAX_QUERY_WORKERS connexions supplémentaires par processus
+    """
+    if not layers:
+        return 0, b'[]'
+
+    workers = min(workers, MAX_QUERY_WORKERS)
+    if workers > 1:
+        selects = build_feature_selects(layers, filters)
+        if len(selects) > 1:
+            return fetch_layers_parallel(selects, workers)
+
+    sql, params = build_feature_collection_sql(layers, filters)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        total, features = cursor.fetchone()
+    return total, features.encode('utf-8')
+
+
+# Plafond du pool : chaque worker garde sa connexion PostgreSQL ouverte
+MAX_QUERY_WORKERS = 8
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    """Pool de threads partagé par le processus, recréé si le nombre de workers change"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='collectes')
+            _executor_workers = workers
+        return _executor
+
+
+def _fetch_select(sql, params):
+    """
+    Exécutée dans un thread du pool : connexion propre au thread (Django les isole
+    par thread), gardée d'une requête à l'autre, donc au plus MAX_QUERY_WORKERS
+    connexions par processus. Une connexion rompue (erreur) est remplacée.
+    """
+    if connection.errors_occurred and not connection.is_usable():
+        connection.close()
+    connection.errors_occurred = False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*), COALESCE(json_agg(f.feature), '[]'::json)::text FROM ({sql}) f",
+            params
+        )
+        return cursor.fetchone()
+
+
+def fetch_layers_parallel(selects, workers):
+    """
+    Une requête par couche sur le pool de threads. Les tableaux JSON sont
+    fusionnés dans l'ordre des couches, quel que soit l'ordre d'arrivée.
+    """
+    executor = _get_executor(workers)
+    futures = [executor.submit(_fetch_select, sql, params) for sql, params in selects]
+    results = [future.result() for future in futures]
+
+    total = sum(count for count, _ in results)
+    # json_agg renvoie '[...]' : on ne garde que le contenu de chaque tableau non vide
+    parts = [features[1:-1] for count, features in results if count]
+    return total, ('[' + ','.join(parts) + ']').encode('utf-8')
+
+
+def iter_feature_batches(layers, filters=None, chunk_size=2000):
+    """
+    Features encodées par PostGIS, lues par lots via un curseur serveur :
+    chaque lot (liste d'octets) est disponible dès sa lecture, sans attendre
+    les couches suivantes.
+    """
+    for sql, params in build_feature_selects(layers, filters):
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(f"SELECT f.feature::text FROM ({sql}) f", params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [row[0].encode('utf-8') for row in rows]
+
+
+def build_layer_rows_sql(layer, filters=None):
+    """
+    Variante de build_layer_sql sans sérialisation JSON, pour les encodeurs
+    binaires (Geobuf) : (id, géométrie WKB, identifiant, commune) par élément.
+    Retourne (sql, params).
+    """
+    table, _, id_column, commune_column = _layer_columns(layer)
+    id_prefix = layer.get('id_prefix', layer['type'])
+
+    where, filter_params = _layer_filters(layer, filters)
+    where += ['g.geom IS NOT NULL', 'NOT ST_IsEmpty(g.geom)']
+    sql = f"""
+        SELECT %s::text || t.{id_column}, ST_AsBinary(ST_Force2D(g.geom)), t.{id_column}, t.{commune_column}
+        FROM {table} t
+        CROSS JOIN LATERAL (SELECT {_geometry_sql(layer, filters)} AS geom) g
+        WHERE {' AND '.join(where)}
+    """
+    return sql, [f"{id_prefix}_"] + filter_params
+
+
+def _iter_rows(sql, params, chunk_size):
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def iter_feature_rows(layers, filters=None, chunk_size=2000):
+    """
+    Features non sérialisées, dans l'ordre de build_feature_selects : dicts
+    {'id', 'geometry', 'properties'} construits au fil du curseur serveur à
+    partir du WKB et des colonnes, sans GeoJSON intermédiaire.
+    Les agrégats (?cluster=1, une ligne par cellule) restent lus en JSON.
+    """
+    filters = filters or {}
+    if filters.get('cluster'):
+        point_layers = [layer for layer in layers if layer['kind'] == 'point']
+        layers = [layer for layer in layers if layer['kind'] != 'point']
+        if point_layers:
+            sql, params = build_cluster_sql(point_layers, filters)
+            for (feature,) in _iter_rows(f"SELECT f.feature::text FROM ({sql}) f", params, chunk_size):
+                yield json.loads(feature)
+
+    for layer in layers:
+        id_field = layer.get('id_field', 'fid')
+        sql, params = build_layer_rows_sql(layer, filters)
+        for feature_id, wkb, id_value, commune_id in _iter_rows(sql, params, chunk_size):
+            yield {
+                'id': feature_id,
+                'geometry': read_wkb(wkb),
+                'properties': {id_field: id_value, 'type': layer['type'], 'commune_id': commune_id},
+            }
+
+
+def render_feature_collection(features_json, extra=None):
+    """
+    Assemble l'enveloppe FeatureCollection autour du tableau 'features' déjà
+    encodé par PostGIS, sans le redécoder.
+    """
+    body = b'{"type":"FeatureCollection","features":' + features_json
+    if extra:
+        body += b',' + json.dumps(extra, ensure_ascii=False).encode('utf-8')[1:]
+    else:
+        body += b'}'
+    return body
+
+
+# Grille des tuiles MVT et tampon de découpe (en unités de la grille)
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+
+def build_layer_mvt_sql(layer, z, x, y, target_commune_ids=None):
+    """
+    Expression SQL (bytea) de la couche MVT d'une tuile z/x/y.
+    ST_AsMVTGeom quantifie les géométries sur la grille de la tuile, ce qui
+    tient lieu de simplification pour les linéaires.
+    """
+    table, id_field, id_column, commune_column = _layer_columns(layer)
+
+    where, filter_params = _layer_filters(layer, {'commune_ids': target_commune_ids})
+    # Filtre d'emprise exprimé en 4326 pour profiter de l'index GiST de la table,
+    # élargi du tampon de ST_AsMVTGeom : symboles et extrémités de lignes proches
+    # du bord restent dessinés sur la tuile voisine
+    where.append('t.geom && ST_Transform(ST_TileEnvelope(%s, %s, %s, margin => %s), 4326)')
+
+    sql = f"""
+        COALESCE((
+            SELECT ST_AsMVT(mvt.*, %s, {MVT_EXTENT}, 'geom')
+            FROM (
+                SELECT ST_AsMVTGeom(
+                           ST_Transform(t.geom, 3857),
+                           ST_TileEnvelope(%s, %s, %s), {MVT_EXTENT}, {MVT_BUFFER}, true
+                       ) AS geom,
+                       t.{id_column} AS {id_field},
+                       %s::text AS type,
+                       t.{commune_column} AS commune_id
+                FROM {table} t
+                WHERE {' AND '.join(where)}
+            ) mvt
+            WHERE mvt.geom IS NOT NULL
+        ), ''::bytea)
+    """
+    params = [layer['type'], z, x, y, layer['type']] + filter_params + [z, x, y, MVT_BUFFER / MVT_EXTENT]
+    return sql, params
+
+
+def fetch_mvt_tile(layers, z, x, y, target_commune_ids=None):
+    """Tuile Mapbox Vector Tile : une couche MVT par type, concaténées en un seul statement"""
+    if not layers:
+        return b''
+
+    expressions = []
+    params = []
+    for layer in layers:
+        sql, layer_params = build_layer_mvt_sql(layer, z, x, y, target_commune_ids)
+        expressions.append(sql)
+        params.extend(layer_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {' || '.join(expressions)}", params)
+        tile = cursor.fetchone()[0]
+    return bytes(tile)
@@ -3,6 +3,7 @@
 from django.urls import path
 from .spatial_views import (
     CollectesGeoAPIView,
+    VectorTilesAPIView,
     CommunesSearchAPIView,
     TypesInfrastructuresAPIView
 )
@@ -12,6 +13,9 @@ urlpatterns = [
     # API principale pour récupérer les collectes avec filtrage spatial
     path('api/collectes/', CollectesGeoAPIView.as_view(), name='api-collectes-geo'),
     
+    # Tuiles vectorielles (MVT) par couche ou 'all'
+    path('api/tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt', VectorTilesAPIView.as_view(), name='api-tiles-mvt'),
+    
     # API de recherche communes
     path('api/communes/search/', CommunesSearchAPIView.as_view(), name='api-communes-search'),
     
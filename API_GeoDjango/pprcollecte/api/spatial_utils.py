@@ -3,6 +3,7 @@
 from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.gis.db.models.functions import Transform
 from .models import CommuneRurale, Prefecture, Region
+from .admin_closure import commune_closure
 
 class GeoQueryHelper:
     """Classe utilitaire pour les requêtes géospatiales"""
@@ -16,6 +17,33 @@ class GeoQueryHelper:
         except CommuneRurale.DoesNotExist:
             return None
     
+    @staticmethod
+    def get_target_communes(region_id, prefecture_id, commune_id):
+        """
+        Calcule la liste des communes à inclure selon les filtres hiérarchiques
+        Retourne None pour "toutes les communes" ou une liste d'IDs (partagée, lecture seule)
+        """
+        try:
+            if commune_id:
+                # Filtre par commune spécifique
+                return [int(commune_id)]
+            
+            elif prefecture_id:
+                # Filtre par préfecture - toutes ses communes (fermeture en mémoire)
+                return commune_closure.communes_of_prefecture(prefecture_id)
+            
+            elif region_id:
+                # Filtre par région - toutes les communes de ses préfectures
+                return commune_closure.communes_of_region(region_id)
+            
+            else:
+                # Aucun filtre géographique - toutes les communes
+                return None
+                
+        except (ValueError, TypeError) as e:
+            print(f"❌ Erreur calcul communes cibles: {e}")
+            return []
+    
     @staticmethod
     def transform_geometry(geom, target_srid=4326):
         """Transformer une géométrie vers un SRID cible"""
@@ -86,4 +114,25 @@ def validate_coordinates(x, y):
             
         return True, None
     except (ValueError, TypeError):
-        return False, "Coordonnées invalides"
\ No newline at end of file
+        return False, "Coordonnées invalides"
+
+def parse_bbox(value):
+    """
+    Lire un paramètre bbox=minx,miny,maxx,maxy (WGS84)
+    Retourne (bbox, erreur)
+    """
+    try:
+        bbox = tuple(float(v) for v in value.split(','))
+    except (ValueError, AttributeError):
+        return None, "bbox invalide (attendu: minx,miny,maxx,maxy)"
+    
+    if len(bbox) != 4:
+        return None, "bbox invalide (attendu: minx,miny,maxx,maxy)"
+    
+    minx, miny, maxx, maxy = bbox
+    if minx > maxx or miny > maxy:
+        return None, "bbox invalide (min supérieur à max)"
+    if not (-180 <= minx <= 180 and -180 <= maxx <= 180 and -90 <= miny <= 90 and -90 <= maxy <= 90):
+        return None, "bbox hors des limites WGS84"
+    
+    return bbox, None
@@ -5,15 +5,39 @@ from rest_framework import status
 from django.utils import timezone
 from django.views.decorators.gzip import gzip_page
 from django.utils.decorators import method_decorator
+from django.http import HttpResponse
+from django.conf import settings
+import json
 import time
 from .models import *
+from .spatial_utils import GeoQueryHelper, parse_bbox
+from .geometry_encoding import parse_geometry_options
+from .registry import presented_types
+from .spatial_sql import (
+    COLLECTES_LAYERS, get_collectes_layers, fetch_feature_collection,
+    render_feature_collection, fetch_mvt_tile, cluster_grid_size, iter_feature_batches, iter_feature_rows,
+    collectes_version_tables
+)
+from .streaming import wants_stream, stream_chunk_size, feature_collection_streaming_response
+from .tile_cache import tile_cache
+from .response_cache import collectes_cache
+from .geobuf import GeobufEncoder, CONTENT_TYPE as GEOBUF_CONTENT_TYPE
+from .versioning import ConditionalGetMixin, versions_key
+from .renderers import GEOJSON_RENDERER_CLASSES
 
 @method_decorator(gzip_page, name='dispatch')
-class CollectesGeoAPIView(APIView):
+class CollectesGeoAPIView(ConditionalGetMixin, APIView):
     """
     API améliorée - Retourne les données avec filtrage géographique hiérarchique
     """
     
+    renderer_classes = GEOJSON_RENDERER_CLASSES
+    # Le corps porte timestamp et processing_time : mêmes données, octets différents
+    weak_etag = True
+    
+    def get_version_tables(self):
+        return collectes_version_tables()
+    
     def get(self, request):
         """Retourne les infrastructures en GeoJSON avec filtres géographiques"""
         
@@ -25,6 +49,31 @@ class CollectesGeoAPIView(APIView):
         commune_id = request.GET.get('commune_id')
         types = request.GET.getlist('types', [])
         
+        # ✅ FILTRES DE VUE : emprise visible et niveau de zoom
+        bbox = None
+        if request.GET.get('bbox'):
+            bbox, bbox_error = parse_bbox(request.GET.get('bbox'))
+            if bbox_error:
+                return Response({'error': bbox_error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        zoom = None
+        if request.GET.get('zoom'):
+            try:
+                zoom = int(request.GET.get('zoom'))
+            except ValueError:
+                return Response({'error': 'zoom invalide'}, status=status.HTTP_400_BAD_REQUEST)
+            if not 0 <= zoom <= 22:
+                return Response({'error': 'zoom hors limites (0-22)'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # ✅ PRÉCISION DES COORDONNÉES et encodage polyline des linéaires
+        geometry_options, geometry_error = parse_geometry_options(request.GET)
+        if geometry_error:
+            return Response({'error': geometry_error}, status=status.HTTP_400_BAD_REQUEST)
+        precision, geometry_encoding = geometry_options
+        
+        # ✅ MODE REGROUPEMENT : agrégats de points calculés par PostGIS
+        cluster = request.GET.get('cluster', '').lower() in ('1', 'true', 'yes')
+        
         print(f"🌍 [CollectesGeoAPI] Filtres reçus - Region: {region_id}, Prefecture: {prefecture_id}, Commune: {commune_id}, Types: {types}")
         
         results = {
@@ -35,11 +84,33 @@ class CollectesGeoAPIView(APIView):
                 'region_id': region_id,
                 'prefecture_id': prefecture_id,
                 'commune_id': commune_id,
-                'types': types
+                'types': types,
+                'bbox': bbox,
+                'zoom': zoom,
+                'cluster': cluster,
+                'precision': precision,
+                'geometry_encoding': geometry_encoding
             },
             'timestamp': timezone.now().isoformat()
         }
         
+        # ✅ CACHE : réponse déjà encodée pour ce jeu de filtres
+        output_format = 'geobuf' if request.accepted_renderer.format == 'geobuf' else 'json'
+        stream = wants_stream(request) and output_format == 'json'
+        cache_key = None
+        if not stream:
+            cache_key = collectes_cache.make_key(
+                region_id, prefecture_id, commune_id, types,
+                bbox=bbox, zoom=zoom, cluster=cluster, format=output_format,
+                precision=precision, geometry_encoding=geometry_encoding,
+                # Versions des tables : une écriture hors de ce processus invalide aussi l'entrée
+                versions=versions_key(collectes_version_tables())
+            )
+            cached = collectes_cache.get(cache_key)
+            if cached is not None:
+                print("⚡ Réponse servie depuis le cache")
+                return self._encoded_response(cached, output_format, 'HIT')
+        
         try:
             # ✅ CALCULER LES COMMUNES À INCLURE selon la hiérarchie
             target_commune_ids = self._get_target_communes(region_id, prefecture_id, commune_id)
@@ -51,17 +122,41 @@ class CollectesGeoAPIView(APIView):
             
             print(f"🎯 Communes ciblées: {len(target_commune_ids) if target_commune_ids else 'toutes'}")
             
-            # Chargement des infrastructures avec filtrage
-            self._load_point_infrastructures(results, target_commune_ids, types)
-            self._load_linear_infrastructures(results, target_commune_ids, types)
+            # Chargement des infrastructures : une seule requête PostGIS pour toutes les couches
+            layers = get_collectes_layers(types)
+            filters = {
+                'commune_ids': target_commune_ids, 'bbox': bbox, 'zoom': zoom,
+                'precision': precision, 'geometry_encoding': geometry_encoding
+            }
+            if cluster:
+                cluster_zoom = zoom if zoom is not None else settings.COLLECTES_CLUSTER_DEFAULT_ZOOM
+                filters['cluster'] = True
+                filters['cluster_grid_size'] = cluster_grid_size(
+                    cluster_zoom, settings.COLLECTES_CLUSTER_RADIUS_PX
+                )
+            
+            if stream:
+                return self._stream_response(layers, filters, results, start_time)
+            
+            if output_format == 'geobuf':
+                body = self._geobuf_body(layers, filters, results, start_time)
+                collectes_cache.set(cache_key, body, [l['type'] for l in layers], target_commune_ids)
+                return self._encoded_response(body, output_format, 'MISS')
+            
+            total, features_json = fetch_feature_collection(
+                layers, filters, workers=settings.COLLECTES_QUERY_WORKERS
+            )
             
             processing_time = time.time() - start_time
-            results['total'] = len(results['features'])
+            results.pop('features')  # remplacé par le tableau encodé par PostGIS
+            results['total'] = total
             results['processing_time'] = f"{processing_time:.2f}s"
             
-            print(f"✅ {results['total']} features retournées en {processing_time:.2f}s")
+            print(f"✅ {total} features retournées en {processing_time:.2f}s")
             
-            return Response(results)
+            body = render_feature_collection(features_json, results)
+            collectes_cache.set(cache_key, body, [l['type'] for l in layers], target_commune_ids)
+            return self._encoded_response(body, output_format, 'MISS')
             
         except Exception as e:
             print(f"❌ Erreur dans CollectesGeoAPIView: {e}")
@@ -73,238 +168,107 @@ class CollectesGeoAPIView(APIView):
                 'details': 'Erreur lors de la récupération des données spatiales'
             }, status=500)
 
-    def _get_target_communes(self, region_id, prefecture_id, commune_id):
+    def _encoded_response(self, body, output_format, cache_status):
+        content_type = GEOBUF_CONTENT_TYPE if output_format == 'geobuf' else 'application/json'
+        response = HttpResponse(body, content_type=content_type)
+        response['X-Cache'] = cache_status
+        return response
+
+    def _geobuf_body(self, layers, filters, results, start_time):
         """
-        Calcule la liste des communes à inclure selon les filtres hiérarchiques
-        Retourne None pour "toutes les communes" ou une liste d'IDs
+        Geobuf : features construites à partir des colonnes et du WKB lus sur le
+        curseur serveur, encodées au fil de la lecture (jamais toutes en mémoire)
         """
-        try:
-            if commune_id:
-                # Filtre par commune spécifique
-                return [int(commune_id)]
-            
-            elif prefecture_id:
-                # Filtre par préfecture - toutes ses communes
-                communes = CommuneRurale.objects.filter(prefectures_id_id=int(prefecture_id))
-                return list(communes.values_list('id', flat=True))
-            
-            elif region_id:
-                # Filtre par région - toutes les communes de ses préfectures
-                communes = CommuneRurale.objects.filter(
-                    prefectures_id__regions_id_id=int(region_id)
-                )
-                return list(communes.values_list('id', flat=True))
-            
-            else:
-                # Aucun filtre géographique - toutes les communes
-                return None
-                
-        except (ValueError, TypeError) as e:
-            print(f"❌ Erreur calcul communes cibles: {e}")
-            return []
+        results.pop('features')
+        counter = {'total': 0}
 
-    def _should_include_type(self, type_name, types_filter):
-        """Vérifie si ce type doit être inclus selon les filtres"""
-        if not types_filter:
-            return True
-        return type_name in types_filter
+        def features():
+            for feature in iter_feature_rows(layers, filters, stream_chunk_size()):
+                counter['total'] += 1
+                yield feature
 
-    def _load_point_infrastructures(self, results, target_commune_ids, types_filter):
-        point_models = {
-            'services_santes': ServicesSantes,
-            'ponts': Ponts,
-            'buses': Buses,
-            'dalots': Dalots,
-            'ecoles': Ecoles,
-            'marches': Marches,
-            'batiments_administratifs': BatimentsAdministratifs,
-            'infrastructures_hydrauliques': InfrastructuresHydrauliques,
-            'localites': Localites,
-            'autres_infrastructures': AutresInfrastructures,
-        }
+        def trailer():
+            results['total'] = counter['total']
+            results['processing_time'] = f"{time.time() - start_time:.2f}s"
+            print(f"✅ {counter['total']} features encodées en Geobuf")
+            return results
+
+        return GeobufEncoder().encode(features(), trailer)
+
+    def _stream_response(self, layers, filters, results, start_time):
+        """Mode flux : les features partent sur la socket pendant la lecture des couches"""
+        results.pop('features')
         
-        for type_name, model_class in point_models.items():
-            if not self._should_include_type(type_name, types_filter):
-                continue
-                
-            try:
-                queryset = model_class.objects.filter(geom__isnull=False)
-                
-                if target_commune_ids is not None:
-                    queryset = queryset.filter(commune_id__in=target_commune_ids)
-                
-                for item in queryset:
-                    try:
-                        if item.geom:
-                            commune_id = item.commune_id.id if item.commune_id else None
-                            
-                            feature = {
-                                'type': 'Feature',
-                                'id': f"{type_name}_{item.fid}",
-                                'geometry': {
-                                    'type': 'Point',
-                                    'coordinates': [float(item.geom.x), float(item.geom.y)]
-                                },
-                                'properties': {
-                                    'fid': int(item.fid),
-                                    'type': type_name,  
-                                    'commune_id': commune_id
-                                    
-                                }
-                            }
-                            results['features'].append(feature)
-                    except Exception as e:
-                        continue
-                        
-            except Exception as e:
-                print(f"Erreur chargement {type_name}: {e}")
-                continue
-                        
-            except Exception as e:
-                print(f"Erreur chargement {type_name}: {e}")
-                continue
+        def trailer(total):
+            processing_time = time.time() - start_time
+            print(f"✅ {total} features envoyées en flux en {processing_time:.2f}s")
+            return {**results, 'total': total, 'processing_time': f"{processing_time:.2f}s"}
+        
+        return feature_collection_streaming_response(
+            iter_feature_batches(layers, filters, stream_chunk_size()), trailer
+        )
+
+    def _get_target_communes(self, region_id, prefecture_id, commune_id):
+        """Délègue à GeoQueryHelper (partagé avec les tuiles vectorielles)"""
+        return GeoQueryHelper.get_target_communes(region_id, prefecture_id, commune_id)
+
 
-    def _load_linear_infrastructures(self, results, target_commune_ids, types_filter):
-        """Charge les infrastructures linéaires avec filtrage géographique"""
+@method_decorator(gzip_page, name='dispatch')
+class VectorTilesAPIView(APIView):
+    """
+    Tuiles vectorielles Mapbox (MVT) construites par PostGIS (ST_AsMVT)
+    /api/tiles/{layer}/{z}/{x}/{y}.mvt - layer = type d'infrastructure ou 'all'
+    Mêmes filtres que /api/collectes/ : region_id, prefecture_id, commune_id, types
+    """
+    
+    MAX_ZOOM = 22
+    
+    def get(self, request, layer, z, x, y):
+        if z > self.MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            return Response({'error': 'Coordonnées de tuile invalides'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # CHARGEMENT DES BACS
-        if self._should_include_type('bacs', types_filter):
-            try:
-                bacs_queryset = Bacs.objects.filter(geom__isnull=False)
-                
-                if target_commune_ids is not None:
-                    bacs_queryset = bacs_queryset.filter(commune_id__in=target_commune_ids)
-                    print(f"  Filtrage bacs: {bacs_queryset.count()} éléments dans les communes {target_commune_ids}")
-                
-                for bac in bacs_queryset:
-                    try:
-                        if bac.geom:
-                            geom_type = bac.geom.geom_type
-                            coordinates = None
-                            
-                            if geom_type == 'Point':
-                                coordinates = [float(bac.geom.x), float(bac.geom.y)]
-                            elif geom_type == 'LineString':
-                                simplified_geom = bac.geom.simplify(0.01)
-                                coordinates = list(simplified_geom.coords)
-                            elif geom_type == 'MultiLineString':
-                                simplified_geom = bac.geom.simplify(0.01)
-                                coordinates = [list(line.coords) for line in simplified_geom]
-                            
-                            if coordinates:
-                                feature = {
-                                    'type': 'Feature', 
-                                    'id': f"bac_{bac.fid}",
-                                    'geometry': {
-                                        'type': geom_type,
-                                        'coordinates': coordinates
-                                    },
-                                    'properties': {
-                                        'fid': int(bac.fid),
-                                        'type': 'bacs',
-                                        'commune_id': bac.commune_id.id if bac.commune_id else None,
-                                        
-                                    }
-                                }
-                                results['features'].append(feature)
-                    except Exception as e:
-                        print(f"Erreur processing bac {bac.fid}: {e}")
-                        continue
-                        
-            except Exception as e:
-                print(f"Erreur chargement bacs: {e}")
+        layer_types = [l['type'] for l in COLLECTES_LAYERS]
+        if layer != 'all' and layer not in layer_types:
+            return Response({
+                'error': f"Couche inconnue: {layer}",
+                'layers': ['all'] + layer_types
+            }, status=status.HTTP_404_NOT_FOUND)
         
-        # CHARGEMENT DES PISTES
-        if self._should_include_type('pistes', types_filter):
-            try:
-                piste_queryset = Piste.objects.filter(geom__isnull=False)
-                
-                if target_commune_ids is not None:
-                    piste_queryset = piste_queryset.filter(communes_rurales_id__in=target_commune_ids)
-                    print(f"  Filtrage pistes: {piste_queryset.count()} éléments dans les communes {target_commune_ids}")
-                
-                for piste in piste_queryset:
-                    try:
-                        if piste.geom:
-                            simplified_geom = piste.geom.simplify(0.001)
-                            
-                            if simplified_geom.empty:
-                                continue
-                            
-                            geom_4326 = simplified_geom.transform(4326, clone=True)
-                            
-                            coordinates = None
-                            if geom_4326.geom_type == 'LineString':
-                                coordinates = list(geom_4326.coords)
-                            elif geom_4326.geom_type == 'MultiLineString':
-                                coordinates = []
-                                for line in geom_4326:
-                                    coordinates.append(list(line.coords))
-                            
-                            if coordinates:
-                                feature = {
-                                    'type': 'Feature',
-                                    'id': f"piste_{piste.id}",
-                                    'geometry': {
-                                        'type': geom_4326.geom_type,
-                                        'coordinates': coordinates
-                                    },
-                                    'properties': {
-                                        'id': int(piste.id),
-                                        'type': 'pistes',
-                                        'commune_id': piste.communes_rurales_id.id if piste.communes_rurales_id else None,
-                                        
-                                    }
-                                }
-                                results['features'].append(feature)
-                    except Exception as e:
-                        print(f"Erreur processing piste {piste.id}: {e}")
-                        continue
-                
-            except Exception as e:
-                print(f"Erreur chargement pistes: {e}")
-        # ✅ AJOUTER : PASSAGES_SUBMERSIBLES comme LineString
-        if self._should_include_type('passages_submersibles', types_filter):
+        region_id = request.GET.get('region_id')
+        prefecture_id = request.GET.get('prefecture_id')
+        commune_id = request.GET.get('commune_id')
+        types = request.GET.getlist('types', [])
+        
+        layers = get_collectes_layers(types)
+        if layer != 'all':
+            layers = [l for l in layers if l['type'] == layer]
+        
+        # Les versions des tables font partie de la clé : toute écriture invalide les tuiles
+        key = tile_cache.make_key(
+            [l['type'] for l in layers], z, x, y, region_id, prefecture_id, commune_id,
+            versions_key(collectes_version_tables())
+        )
+        tile = tile_cache.get(z, key)
+        
+        if tile is None:
             try:
-                queryset = PassagesSubmersibles.objects.filter(geom__isnull=False)
-                
-                if target_commune_ids is not None:
-                    queryset = queryset.filter(commune_id__in=target_commune_ids)
-                
-                for passage in queryset:
-                    try:
-                        if passage.geom:
-                            # Vérifier si c'est déjà en WGS84 (SRID 4326)
-                            if passage.geom.srid == 4326:
-                                geom_4326 = passage.geom
-                            else:
-                                geom_4326 = passage.geom.transform(4326, clone=True)
-                            
-                            # Extraire les coordonnées LineString
-                            coordinates = list(geom_4326.coords)
-                            
-                            feature = {
-                                'type': 'Feature',
-                                'id': f"passages_submersibles_{passage.fid}",
-                                'geometry': {
-                                    'type': 'LineString',
-                                    'coordinates': coordinates
-                                },
-                                'properties': {
-                                    'fid': int(passage.fid),
-                                    'type': 'passages_submersibles',
-                                    'commune_id': passage.commune_id.id if passage.commune_id else None,
-                                    
-                                }
-                            }
-                            results['features'].append(feature)
-                            
-                    except Exception as e:
-                        print(f"Erreur processing passage {passage.fid}: {e}")
-                        continue
-                        
+                target_commune_ids = GeoQueryHelper.get_target_communes(region_id, prefecture_id, commune_id)
+                if target_commune_ids is not None and len(target_commune_ids) == 0:
+                    tile = b''
+                else:
+                    tile = fetch_mvt_tile(layers, z, x, y, target_commune_ids)
             except Exception as e:
-                print(f"Erreur chargement passages_submersibles: {e}")
+                print(f"❌ Erreur tuile {layer}/{z}/{x}/{y}: {e}")
+                return Response({
+                    'error': str(e),
+                    'type': type(e).__name__,
+                    'details': 'Erreur lors de la génération de la tuile'
+                }, status=500)
+            tile_cache.set(z, key, tile)
+        
+        response = HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
+        response['Cache-Control'] = f"public, max-age={tile_cache.ttl}"
+        return response
 
 
 # Classes existantes inchangées
@@ -354,20 +318,8 @@ class TypesInfrastructuresAPIView(APIView):
     
     def get(self, request):
         types_config = {
-            'pistes': {'label': 'Pistes', 'icon': 'road', 'color': '#2C3E50'},
-            'chaussees': {'label': 'Chaussées', 'icon': 'road', 'color': '#8e44ad'},
-            'ponts': {'label': 'Ponts', 'icon': 'bridge', 'color': '#9B59B6'},
-            'buses': {'label': 'Buses', 'icon': 'bus', 'color': '#E74C3C'},
-            'dalots': {'label': 'Dalots', 'icon': 'water', 'color': '#3498DB'},
-            'bacs': {'label': 'Bacs', 'icon': 'ship', 'color': '#F39C12'},
-            'passages_submersibles': {'label': 'Passages submersibles', 'icon': 'water', 'color': '#1ABC9C'},
-            'localites': {'label': 'Localités', 'icon': 'home', 'color': '#E67E22'},
-            'ecoles': {'label': 'Écoles', 'icon': 'graduation-cap', 'color': '#27AE60'},
-            'services_santes': {'label': 'Services de santé', 'icon': 'hospital', 'color': '#E74C3C'},
-            'marches': {'label': 'Marchés', 'icon': 'shopping-cart', 'color': '#F1C40F'},
-            'batiments_administratifs': {'label': 'Bâtiments administratifs', 'icon': 'building', 'color': '#34495E'},
-            'infrastructures_hydrauliques': {'label': 'Infrastructures hydrauliques', 'icon': 'tint', 'color': '#3498DB'},
-            'autres_infrastructures': {'label': 'Autres infrastructures', 'icon': 'map-pin', 'color': '#95A5A6'}
+            entry['type']: {'label': entry['label'], 'icon': entry['icon'], 'color': entry['color']}
+            for entry in presented_types()
         }
         
         return Response({
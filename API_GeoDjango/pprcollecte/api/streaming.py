@@ -0,0 +1,101 @@
+#  - Réponses FeatureCollection en flux (StreamingHttpResponse)
+#
+# Les features sont écrites sur la socket au fur et à mesure de leur lecture
+# (curseurs serveur), la mémoire ne dépend plus de la taille du jeu de données.
+# GZipMiddleware / gzip_page compressent aussi les réponses en flux.
+
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def wants_stream(request):
+    return request.GET.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_chunk_size():
+    return getattr(settings, 'STREAMING_CHUNK_SIZE', 2000)
+
+
+def feature_bytes(feature):
+    """
+    Feature JSON encodée ; une géométrie déjà texte (ST_AsGeoJSON, contexte
+    raw_geometry du sérialiseur) est recopiée sans être relue
+    """
+    geometry = feature.get('geometry')
+    if not isinstance(geometry, str):
+        return json.dumps(feature, cls=JSONEncoder, ensure_ascii=False).encode('utf-8')
+    rest = json.dumps(
+        {key: value for key, value in feature.items() if key != 'geometry'},
+        cls=JSONEncoder, ensure_ascii=False
+    ).encode('utf-8')
+    return b'{"geometry":' + geometry.encode('utf-8') + b',' + rest[1:]
+
+
+def stream_feature_collection(batches, trailer=None):
+    """
+    Générateur d'octets d'une FeatureCollection.
+    batches : itérable de lots (listes d'octets, une feature JSON encodée par élément)
+    trailer : callable(total) -> dict de clés ajoutées après 'features'
+    """
+    yield b'{"type":"FeatureCollection","features":['
+    total = 0
+    for batch in batches:
+        if not batch:
+            continue
+        yield (b',' if total else b'') + b','.join(batch)
+        total += len(batch)
+
+    extra = trailer(total) if trailer else {}
+    if extra:
+        yield b'],' + json.dumps(extra, cls=JSONEncoder, ensure_ascii=False).encode('utf-8')[1:]
+    else:
+        yield b']}'
+
+
+def feature_collection_streaming_response(batches, trailer=None):
+    return StreamingHttpResponse(
+        stream_feature_collection(batches, trailer),
+        content_type='application/json'
+    )
+
+
+class StreamingListMixin:
+    """
+    Pour les ListCreateAPIView à sérialiseur GeoFeatureModelSerializer :
+    ?stream=1 renvoie la FeatureCollection en flux, les objets étant lus
+    par lots avec queryset.iterator(chunk_size=...).
+    """
+
+    @method_decorator(gzip_page)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        # Geobuf n'est pas encodable en flux (longueurs préfixées) : réponse normale
+        if not wants_stream(request) or request.accepted_renderer.format == 'geobuf':
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        serializer.context['raw_geometry'] = True
+        # Options de géométrie validées avant l'envoi du premier octet (400 sinon)
+        getattr(serializer, 'geometry_options', None)
+        chunk_size = stream_chunk_size()
+
+        def batches():
+            batch = []
+            for obj in queryset.iterator(chunk_size=chunk_size):
+                batch.append(feature_bytes(serializer.to_representation(obj)))
+                if len(batch) >= chunk_size:
+                    yield batch
+                    batch = []
+            yield batch
+
+        return feature_collection_streaming_response(
+            batches(), trailer=lambda total: {'total': total}
+        )
@@ -0,0 +1,80 @@
+#  - Curseur de synchronisation et journal des suppressions
+#
+# Chaque écriture sur une couche synchronisée horodate la ligne avec l'identifiant
+# de sa transaction (sync_txid), chaque suppression laisse un tombstone portant le
+# même identifiant (migration 0010). Un changement de commune laisse aussi un
+# tombstone pour l'ancienne commune : un client filtré par commune retire la ligne.
+#
+# Curseur rendu au client : xmin de l'instantané, lu AVANT la requête de données.
+# Les transactions d'identifiant inférieur sont toutes terminées et visibles ; une
+# écriture encore en cours aura un identifiant >= curseur et sera renvoyée au
+# prochain appel (quelques lignes peuvent être reçues deux fois, jamais perdues).
+#
+# Ligne sortie puis revenue dans la commune pendant une même fenêtre : elle figure
+# à la fois dans les tombstones et dans les lignes modifiées. Règle : un tombstone
+# n'est renvoyé que si la ligne est absente, au moment de l'appel, des communes
+# demandées (de toute la table sans filtre) ; le client applique les suppressions
+# d'une fenêtre AVANT les lignes modifiées de la même fenêtre.
+
+from django.db import connection
+from django.db.models import BigIntegerField
+from django.db.models.expressions import RawSQL
+from .models import Suppression
+from .registry import INFRASTRUCTURES
+
+
+def current_cursor():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return cursor.fetchone()[0]
+
+
+def parse_cursor(value):
+    """Curseur entier envoyé par le client, None si la valeur n'en est pas un"""
+    value = (value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def changed_since(queryset, cursor):
+    """
+    Lignes écrites depuis le curseur (index sur sync_txid). La colonne, tenue par
+    trigger, n'est pas un champ des modèles : alias non sélectionné, filtré en ORM.
+    """
+    table = queryset.model._meta.db_table
+    sync_txid = RawSQL(f'"{table}"."sync_txid"', [], output_field=BigIntegerField())
+    return queryset.alias(sync_txid=sync_txid).filter(sync_txid__gte=cursor)
+
+
+def _present_features(layer, feature_ids, commune_ids=None):
+    """Identifiants encore présents dans la couche (dans les communes données)"""
+    entry = INFRASTRUCTURES[layer]
+    queryset = entry['model'].objects.filter(pk__in=feature_ids)
+    if commune_ids is not None:
+        queryset = queryset.filter(**{f"{entry.get('commune_field', 'commune_id')}__in": commune_ids})
+    return set(queryset.values_list('pk', flat=True))
+
+
+def deletions_since(layers, cursor, commune_ids=None):
+    """
+    {couche: [{'fid', 'sqlite_id'}]} des lignes supprimées depuis le curseur,
+    sans celles présentes dans les communes demandées (revenues entre-temps)
+    """
+    queryset = Suppression.objects.filter(layer__in=layers, sync_txid__gte=cursor)
+    if commune_ids is not None:
+        queryset = queryset.filter(commune_id__in=commune_ids)
+    tombstones = {layer: [] for layer in layers}
+    for layer, feature_id, sqlite_id in queryset.order_by('sync_txid', 'id').values_list(
+            'layer', 'feature_id', 'sqlite_id'):
+        tombstones[layer].append({'fid': feature_id, 'sqlite_id': sqlite_id})
+
+    deletions = {}
+    for layer, items in tombstones.items():
+        present = _present_features(layer, {item['fid'] for item in items}, commune_ids) if items else set()
+        seen = set()
+        deletions[layer] = []
+        for item in items:
+            # Une seule entrée par ligne : plusieurs sorties de commune dans la fenêtre
+            if item['fid'] not in present and item['fid'] not in seen:
+                seen.add(item['fid'])
+                deletions[layer].append(item)
+    return deletions
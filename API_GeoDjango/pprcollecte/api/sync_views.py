@@ -0,0 +1,281 @@
+#  - Synchronisation mobile : envoi de toutes les couches en un seul appel
+#
+# POST /api/sync/upload/ (corps éventuellement gzip, Content-Encoding: gzip)
+#   {"pistes": [...], "chaussees": [...], "ponts": [...], ...}
+# Les types sont insérés parents d'abord (registre.sync_order), dans une seule
+# transaction avec un point de sauvegarde par type : l'échec d'une couche
+# n'annule pas les autres. Réponse : résultats par couche et correspondances
+# sqlite_id -> fid.
+# ?upsert=1 : écriture idempotente (ON CONFLICT sur login_id + device_id +
+# sqlite_id), une synchronisation rejouée après une coupure ne duplique rien.
+# Chaque élément doit alors porter login_id, device_id (identifiant d'installation)
+# et sqlite_id : un élément sans clé complète est rejeté, jamais inséré en double.
+
+import json
+import os
+import re
+import zlib
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from .admin_closure import commune_closure
+from .bulk import bulk_create, bulk_max_items
+from .commune_package import get_package
+from .models import CommuneRurale
+from .registry import INFRASTRUCTURES, sync_order
+from .sync_log import current_cursor, deletions_since, parse_cursor
+
+
+def _decompress(stream, max_bytes, chunk_size=64 * 1024):
+    """
+    Corps gzip décompressé au fil de la lecture du flux, None au-delà de max_bytes
+    (protection contre les bombes gzip). Le corps compressé n'est jamais chargé
+    d'un bloc : request.body serait limité par DATA_UPLOAD_MAX_MEMORY_SIZE.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    parts = []
+    size = 0
+    while not decompressor.eof:
+        chunk = stream.read(chunk_size) if stream is not None else b''
+        if not chunk:
+            break
+        while chunk:
+            data = decompressor.decompress(chunk, max_bytes + 1 - size)
+            size += len(data)
+            if size > max_bytes:
+                return None
+            parts.append(data)
+            chunk = decompressor.unconsumed_tail
+    if not decompressor.eof:
+        raise zlib.error('flux gzip tronqué')
+    return b''.join(parts)
+
+
+class SyncUploadAPIView(APIView):
+    """Envoi groupé des collectes en attente, toutes couches confondues"""
+
+    def _read_document(self, request):
+        """(document, erreur)"""
+        if request.META.get('HTTP_CONTENT_ENCODING', '').lower() != 'gzip':
+            return request.data, None
+        max_bytes = getattr(settings, 'SYNC_UPLOAD_MAX_BYTES', 50 * 1024 * 1024)
+        try:
+            raw = _decompress(request.stream, max_bytes)
+        except zlib.error:
+            return None, 'Corps gzip invalide'
+        if raw is None:
+            return None, f"Document décompressé trop volumineux (max {max_bytes} octets)"
+        try:
+            return json.loads(raw), None
+        except ValueError:
+            return None, 'JSON invalide'
+
+    def post(self, request):
+        document, error = self._read_document(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(document, dict):
+            return Response({'error': 'Objet JSON attendu : {type: [éléments], ...}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        unknown = sorted(set(document) - set(INFRASTRUCTURES))
+        if unknown:
+            return Response({'error': f"Types inconnus: {', '.join(unknown)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        for type_name, items in document.items():
+            if not isinstance(items, list):
+                return Response({'error': f"{type_name}: tableau attendu"}, status=status.HTTP_400_BAD_REQUEST)
+            if len(items) > bulk_max_items():
+                return Response({'error': f"{type_name}: au plus {bulk_max_items()} éléments par envoi"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        print(f"🔄 Synchronisation: {', '.join(f'{t}={len(i)}' for t, i in document.items())}")
+        upsert = request.query_params.get('upsert') in ('1', 'true')
+        context = {'request': request, 'view': self}
+        layers = {}
+        mappings = {}
+        with transaction.atomic():
+            for entry in sync_order():
+                items = document.get(entry['type'])
+                if not items:
+                    continue
+                try:
+                    # Point de sauvegarde par couche : une erreur SQL n'annule que celle-ci
+                    with transaction.atomic():
+                        results = bulk_create(entry, items, context, upsert=upsert)
+                except DatabaseError as e:
+                    print(f"❌ Synchronisation {entry['type']} annulée: {e}")
+                    layers[entry['type']] = {'created': 0, 'rejected': len(items), 'error': str(e)}
+                    continue
+
+                created = [result for result in results if 'fid' in result]
+                layers[entry['type']] = {
+                    'created': len(created),
+                    'rejected': len(results) - len(created),
+                    'errors': [result for result in results if 'errors' in result],
+                }
+                mappings[entry['type']] = {
+                    str(result['sqlite_id']): result['fid']
+                    for result in created if 'sqlite_id' in result
+                }
+
+        total = sum(len(items) for items in document.values())
+        created_total = sum(layer['created'] for layer in layers.values())
+        if created_total == total:
+            response_status = status.HTTP_201_CREATED
+        elif created_total:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'layers': layers, 'mappings': mappings}, status=response_status)
+
+
+class SyncDeletionsAPIView(APIView):
+    """
+    Suppressions depuis un curseur (tombstones), pendant des listes /api/<type>/?updated_since=
+    GET /api/sync/deletions/?updated_since=<curseur>&types=ponts,buses&commune_id=12
+    (ou prefecture_id / region_id). Sans types : toutes les couches.
+    Réponse : {'cursor': curseur suivant, 'deletions': {type: [{'fid', 'sqlite_id'}]}}
+    Les lignes présentes dans les communes demandées au moment de l'appel sont
+    omises (sorties puis revenues) ; le client applique ces suppressions avant
+    les lignes modifiées reçues pour la même fenêtre de curseur.
+    """
+
+    def get(self, request):
+        since = parse_cursor(request.GET.get('updated_since', '0'))
+        if since is None:
+            return Response({'error': 'updated_since doit être un curseur entier'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        types_param = request.GET.get('types', '')
+        layers = [t for t in types_param.split(',') if t] if types_param else list(INFRASTRUCTURES)
+        unknown = sorted(set(layers) - set(INFRASTRUCTURES))
+        if unknown:
+            return Response({'error': f"Types inconnus: {', '.join(unknown)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        commune_ids = None
+        try:
+            if request.GET.get('commune_id'):
+                commune_ids = [int(request.GET['commune_id'])]
+            elif request.GET.get('prefecture_id'):
+                commune_ids = commune_closure.communes_of_prefecture(request.GET['prefecture_id'])
+            elif request.GET.get('region_id'):
+                commune_ids = commune_closure.communes_of_region(request.GET['region_id'])
+        except ValueError:
+            return Response({'error': 'Identifiant de commune, préfecture ou région invalide'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        cursor = current_cursor()
+        deletions = deletions_since(layers, since, commune_ids)
+        return Response({'cursor': cursor, 'deletions': deletions})
+
+
+GPKG_CONTENT_TYPE = 'application/geopackage+sqlite3'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Plage unique 'bytes=debut-fin' -> (début, fin incluse).
+    None : en-tête ignoré (absent, multi-plages) ; False : plage hors du fichier (416)
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffixe : les N derniers octets
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _file_range(f, start, length, block_size=64 * 1024):
+    with f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _open_package(commune_id):
+    """(fichier ouvert, version) ; le fichier peut être remplacé entre la recherche et l'ouverture"""
+    for _ in range(2):
+        package = get_package(commune_id)
+        if package is None:
+            return None
+        path, version = package
+        try:
+            return open(path, 'rb'), version
+        except FileNotFoundError:
+            continue
+    return None
+
+
+class CommunePackageAPIView(APIView):
+    """
+    Paquet hors ligne d'une commune (GeoPackage) : toutes les couches, pistes,
+    chaussées et limite communale. Mis en cache disque, reconstruit hors requête
+    quand les données de la commune changent (le paquet précédent reste servi
+    entre-temps) ; 202 + Retry-After tant que le premier paquet n'est pas prêt.
+    ETag / If-None-Match, reprise par Range / If-Range.
+    """
+
+    def get(self, request, commune_id):
+        if not CommuneRurale.objects.filter(id=commune_id).exists():
+            return Response({'error': 'Commune non trouvée'}, status=status.HTTP_404_NOT_FOUND)
+
+        package = _open_package(commune_id)
+        if package is None:
+            response = Response({'status': 'construction en cours'}, status=status.HTTP_202_ACCEPTED)
+            response['Retry-After'] = str(getattr(settings, 'COMMUNE_PACKAGE_RETRY_AFTER', 10))
+            return response
+
+        f, version = package
+        etag = f'"{version}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            f.close()
+            return not_modified
+
+        size = os.fstat(f.fileno()).st_size
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        # If-Range : la reprise n'est valable que pour le même paquet, sinon fichier complet
+        if request.META.get('HTTP_RANGE') and (not if_range or if_range == etag):
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        if byte_range is False:
+            f.close()
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _file_range(f, start, end - start + 1),
+                status=status.HTTP_206_PARTIAL_CONTENT, content_type=GPKG_CONTENT_TYPE
+            )
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = FileResponse(f, content_type=GPKG_CONTENT_TYPE)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Content-Disposition'] = f'attachment; filename="commune_{commune_id}.gpkg"'
+        return response
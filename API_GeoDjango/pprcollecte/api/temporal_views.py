@@ -5,7 +5,7 @@ from rest_framework.response import Response
 from datetime import datetime, timedelta, date
 from django.utils import timezone
 from django.db import connection
-from .models import *
+from .registry import temporal_types
 import re
 
 class TemporalAnalysisAPIView(APIView):
@@ -262,86 +262,15 @@ class TemporalAnalysisAPIView(APIView):
         return results, debug_info
     
     def _get_models_config(self):
-        """Configuration corrigée avec types réels des champs"""
+        """Configuration issue du registre des infrastructures (types réels des champs date)"""
         return {
-            'pistes': {
-                'model': Piste,
-                'date_field': 'created_at',
-                'id_field': 'id',
-                'is_varchar_date': False  # timestamp without time zone
-            },
-            'services_santes': {
-                'model': ServicesSantes,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'ponts': {
-                'model': Ponts,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'buses': {
-                'model': Buses,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'dalots': {
-                'model': Dalots,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'ecoles': {
-                'model': Ecoles,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'localites': {
-                'model': Localites,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'marches': {
-                'model': Marches,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'batiments_administratifs': {
-                'model': BatimentsAdministratifs,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'infrastructures_hydrauliques': {
-                'model': InfrastructuresHydrauliques,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'bacs': {
-                'model': Bacs,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'passages_submersibles': {
-                'model': PassagesSubmersibles,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
-            },
-            'autres_infrastructures': {
-                'model': AutresInfrastructures,
-                'date_field': 'created_at',
-                'id_field': 'fid',
-                'is_varchar_date': True   # character varying(24)
+            entry['type']: {
+                'model': entry['model'],
+                'date_field': entry['date_field'],
+                'id_field': entry.get('id_field', 'fid'),
+                'is_varchar_date': entry['is_varchar_date']
             }
+            for entry in temporal_types()
         }
     
     def _map_frontend_types(self, frontend_types):
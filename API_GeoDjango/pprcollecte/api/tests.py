@@ -1,3 +1,439 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import struct
+import zlib
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .bulk import _upsert_key, reject_batch_duplicates, reject_incomplete_keys
+from .commune_package import mobile_column
+from .geobuf import GeobufEncoder, encode_geojson, read_wkb
+from .geometry_encoding import encode_polyline, geometry_polyline, parse_geometry_options
+from .management.commands import assign_communes, build_generalized_geometries, list_sync_duplicates
+from .models import Piste
+from .pagination import GeoJsonKeysetPagination
+from .registry import get_infrastructure, upsert_fields
+from .spatial_sql import MVT_BUFFER, MVT_EXTENT, build_layer_mvt_sql, get_collectes_layers
+from .streaming import feature_bytes
+from .sync_log import parse_cursor
+from .sync_views import _decompress, parse_range
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def _pb_fields(data):
+    """Champs protobuf d'un message : [(numéro, valeur)] (entier, octets ou double)"""
+    fields = []
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            value = struct.unpack_from('<d', data, pos)[0]
+            pos += 8
+        else:
+            length, pos = _read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        fields.append((field, value))
+    return fields
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _packed(data, signed=False):
+    values = []
+    pos = 0
+    while pos < len(data):
+        value, pos = _read_varint(data, pos)
+        values.append(_unzigzag(value) if signed else value)
+    return values
+
+
+def _geobuf_value(data):
+    field, value = _pb_fields(data)[0]
+    if field == 1:
+        return value.decode('utf-8')
+    if field == 3:
+        return value
+    if field == 4:
+        return -value
+    if field == 5:
+        return bool(value)
+    return value
+
+
+def decode_geobuf(data):
+    """Décodeur minimal (points et lignes) : {'keys', 'precision', 'features', 'custom'}"""
+    result = {'keys': [], 'features': [], 'custom': {}}
+    collection = b''
+    for field, value in _pb_fields(data):
+        if field == 1:
+            result['keys'].append(value.decode('utf-8'))
+        elif field == 3:
+            result['precision'] = value
+        elif field == 4:
+            collection = value
+    factor = 10 ** result.get('precision', 6)
+
+    def properties(values, indexes):
+        return {result['keys'][indexes[i]]: values[indexes[i + 1]] for i in range(0, len(indexes), 2)}
+
+    values = []
+    for field, value in _pb_fields(collection):
+        if field == 1:
+            feature = {}
+            feature_values = []
+            for feature_field, feature_value in _pb_fields(value):
+                if feature_field == 1:
+                    geometry = dict(_pb_fields(feature_value))
+                    coords = _packed(geometry.get(3, b''), signed=True)
+                    points = []
+                    x = y = 0
+                    for i in range(0, len(coords), 2):
+                        x += coords[i]
+                        y += coords[i + 1]
+                        points.append([x / factor, y / factor])
+                    feature['geometry'] = points[0] if geometry[1] == 0 else points
+                elif feature_field == 11:
+                    feature['id'] = feature_value.decode('utf-8')
+                elif feature_field == 12:
+                    feature['id'] = _unzigzag(feature_value)
+                elif feature_field == 13:
+                    feature_values.append(_geobuf_value(feature_value))
+                elif feature_field == 14:
+                    feature['properties'] = properties(feature_values, _packed(feature_value))
+            result['features'].append(feature)
+        elif field == 13:
+            values.append(_geobuf_value(value))
+        elif field == 15:
+            result['custom'] = properties(values, _packed(value))
+    return result
+
+
+class GeobufTests(SimpleTestCase):
+
+    def test_feature_collection_round_trip(self):
+        data = {
+            'type': 'FeatureCollection',
+            'features': [
+                {'type': 'Feature', 'id': 'pont_3', 'geometry': {'type': 'Point', 'coordinates': [-13.712345, 9.537891]},
+                 'properties': {'type': 'ponts', 'commune_id': 7}},
+                {'type': 'Feature', 'id': 12, 'geometry': {
+                    'type': 'LineString', 'coordinates': [[-13.5, 9.5], [-13.499999, 9.500001], [-13.4, 9.45]]},
+                 'properties': {'type': 'pistes', 'commune_id': -1}},
+            ],
+            'total': 2,
+        }
+        decoded = decode_geobuf(encode_geojson(data))
+
+        self.assertEqual(decoded['precision'], 6)
+        self.assertEqual(decoded['custom'], {'total': 2})
+        point, line = decoded['features']
+        self.assertEqual(point['id'], 'pont_3')
+        self.assertEqual(point['properties'], {'type': 'ponts', 'commune_id': 7})
+        self.assertEqual(line['id'], 12)
+        self.assertEqual(line['properties'], {'type': 'pistes', 'commune_id': -1})
+        self.assertEqual([round(c, 6) for c in point['geometry']], [-13.712345, 9.537891])
+        for expected, actual in zip(data['features'][1]['geometry']['coordinates'], line['geometry']):
+            self.assertEqual([round(c, 6) for c in actual], expected)
+
+    def test_property_keys_are_shared(self):
+        features = [
+            {'type': 'Feature', 'geometry': None, 'properties': {'type': 'ponts', 'nom': f"Pont {i}"}}
+            for i in range(3)
+        ]
+        decoded = decode_geobuf(GeobufEncoder().encode(features))
+        self.assertEqual(decoded['keys'], ['type', 'nom'])
+        self.assertEqual([f['properties']['nom'] for f in decoded['features']], ['Pont 0', 'Pont 1', 'Pont 2'])
+
+
+def decode_polyline(encoded, precision=5):
+    """Décodage Encoded Polyline -> [(x, y)]"""
+    points = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lng / 10 ** precision, lat / 10 ** precision))
+    return points
+
+
+class PolylineTests(SimpleTestCase):
+
+    def test_reference_example(self):
+        # Exemple de la documentation Google (ordre lat/lng dans la chaîne)
+        points = [(-120.2, 38.5), (-120.95, 40.7), (-126.453, 43.252)]
+        self.assertEqual(encode_polyline(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+    def test_round_trip(self):
+        points = [(-13.712345, 9.537891), (-13.712001, 9.538), (-13.7, 9.6), (-13.700001, 9.599999)]
+        for precision in (5, 6, 7):
+            decoded = decode_polyline(encode_polyline(points, precision), precision)
+            for (x, y), (dx, dy) in zip(points, decoded):
+                self.assertAlmostEqual(x, dx, places=precision)
+                self.assertAlmostEqual(y, dy, places=precision)
+
+    def test_geometry_polyline_caps_precision(self):
+        geometry = {'type': 'MultiLineString', 'coordinates': [[[0, 0], [1, 1]], [[2, 2], [3, 3]]]}
+        polyline = geometry_polyline(geometry, 15)
+        self.assertEqual(polyline['precision'], 7)
+        self.assertEqual(len(polyline['lines']), 2)
+        self.assertIsNone(geometry_polyline({'type': 'Point', 'coordinates': [0, 0]}, 6))
+
+    def test_parse_geometry_options(self):
+        self.assertEqual(parse_geometry_options({'precision': '4', 'geometry_encoding': 'polyline'}),
+                         ((4, 'polyline'), None))
+        self.assertIsNone(parse_geometry_options({'precision': 'x'})[0])
+        self.assertIsNone(parse_geometry_options({'precision': '16'})[0])
+        self.assertIsNone(parse_geometry_options({'geometry_encoding': 'wkt'})[0])
+
+
+class KeysetPaginationTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.paginator = GeoJsonKeysetPagination()
+
+    def request(self, path='/api/ponts/', **params):
+        return Request(self.factory.get(path, params))
+
+    def test_cursor_and_page_size(self):
+        request = self.request(cursor='10', page_size='2')
+        self.assertEqual(self.paginator.get_cursor(request), 10)
+        self.assertEqual(self.paginator.get_page_size(request), 2)
+        self.assertIsNone(self.paginator.get_cursor(self.request()))
+
+    @override_settings(KEYSET_MAX_PAGE_SIZE=100)
+    def test_page_size_bounds(self):
+        self.assertEqual(self.paginator.get_page_size(self.request(page_size='100000')), 100)
+        self.assertEqual(self.paginator.get_page_size(self.request(page_size='0')), 1)
+
+    def test_next_link_round_trip(self):
+        self.paginator.request = self.request(commune_id='5', page_size='2')
+        self.paginator.page_size = 2
+        self.paginator.next_cursor = 42
+        link = self.paginator.get_next_link()
+        query = parse_qs(urlparse(link).query)
+        self.assertEqual(query['commune_id'], ['5'])
+        self.assertEqual(self.paginator.get_cursor(Request(self.factory.get(link))), 42)
+
+        self.paginator.next_cursor = None
+        self.assertIsNone(self.paginator.get_next_link())
+
+    def test_malformed_cursor(self):
+        with self.assertRaises(ValidationError):
+            self.paginator.get_cursor(self.request(cursor='abc'))
+
+
+class UpsertKeyTests(SimpleTestCase):
+
+    def test_key_fields(self):
+        self.assertEqual(upsert_fields(get_infrastructure('ponts')), ['login_id', 'device_id', 'sqlite_id'])
+        self.assertEqual(upsert_fields(get_infrastructure('chaussees')), ['login_id', 'device_id', 'id'])
+        self.assertEqual(upsert_fields(get_infrastructure('pistes')), ['code_piste'])
+
+    def test_upsert_key(self):
+        keys = ['login_id', 'device_id', 'sqlite_id']
+        data = {'login_id': SimpleNamespace(pk=3), 'device_id': 'a1b2', 'sqlite_id': 12, 'nom': 'Pont'}
+        self.assertEqual(_upsert_key(data, keys), (3, 'a1b2', 12))
+        self.assertIsNone(_upsert_key(dict(data, device_id=None), keys))
+        self.assertIsNone(_upsert_key({'login_id': 3, 'sqlite_id': 12}, keys))
+
+
+class SyncCursorTests(SimpleTestCase):
+
+    def test_parse_cursor(self):
+        self.assertEqual(parse_cursor('123'), 123)
+        self.assertEqual(parse_cursor(' 42 '), 42)
+        for value in ('', None, '-5', '2024-01-01', '12.5'):
+            self.assertIsNone(parse_cursor(value))
+
+
+class RangeTests(SimpleTestCase):
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes=500-5000', 1000), (500, 999))
+
+    def test_unsatisfiable(self):
+        self.assertIs(parse_range('bytes=1000-', 1000), False)
+        self.assertIs(parse_range('bytes=-0', 1000), False)
+        self.assertIs(parse_range('bytes=10-5', 1000), False)
+
+    def test_ignored(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-10'):
+            self.assertIsNone(parse_range(header, 1000))
+
+
+# Commandes à argument 'layers' facultatif (nargs='*')
+COMMANDS = [assign_communes, build_generalized_geometries, list_sync_duplicates]
+
+
+class CommandArgumentsTests(SimpleTestCase):
+
+    def parse(self, command, *args):
+        return vars(command.Command().create_parser('manage.py', command.__name__.rsplit('.', 1)[-1]).parse_args(args))
+
+    def test_layers_are_optional(self):
+        for command in COMMANDS:
+            self.assertEqual(self.parse(command)['layers'], [])
+            self.assertEqual(self.parse(command, 'ponts', 'bacs')['layers'], ['ponts', 'bacs'])
+
+    def test_unknown_layer(self):
+        for command in COMMANDS:
+            with self.assertRaises(CommandError):
+                call_command(command.__name__.rsplit('.', 1)[-1], 'inconnue')
+
+
+class MvtSqlTests(SimpleTestCase):
+
+    def test_prefilter_margin(self):
+        layer = get_collectes_layers(['ponts'])[0]
+        sql, params = build_layer_mvt_sql(layer, 12, 1950, 1880, target_commune_ids=[4, 5])
+        self.assertIn('margin => %s', sql)
+        self.assertEqual(params[-1], MVT_BUFFER / MVT_EXTENT)
+        self.assertEqual(sql.count('%s'), len(params))
+
+
+class BatchDuplicatesTests(SimpleTestCase):
+
+    def test_first_occurrence_kept(self):
+        validated = {0: {'code_piste': 'P1'}, 1: {'code_piste': 'P2'}, 2: {'code_piste': 'P1'}, 3: {'code_piste': None}}
+        errors = {}
+        reject_batch_duplicates(Piste, validated, errors)
+        self.assertEqual(sorted(validated), [0, 1, 3])
+        self.assertEqual(list(errors), [2])
+        self.assertIn('code_piste', errors[2])
+
+    def test_excluded_fields(self):
+        validated = {0: {'code_piste': 'P1'}, 1: {'code_piste': 'P1'}}
+        errors = {}
+        reject_batch_duplicates(Piste, validated, errors, exclude=['code_piste'])
+        self.assertEqual(sorted(validated), [0, 1])
+        self.assertEqual(errors, {})
+
+
+class GzipUploadTests(SimpleTestCase):
+
+    def test_decompress_in_chunks(self):
+        body = b'{"ponts": []}' * 5000
+        self.assertEqual(_decompress(io.BytesIO(gzip.compress(body)), len(body), chunk_size=16), body)
+
+    def test_size_limit(self):
+        body = b'0' * 100000
+        self.assertIsNone(_decompress(io.BytesIO(gzip.compress(body)), 1000))
+
+    def test_truncated_stream(self):
+        compressed = gzip.compress(b'{"ponts": []}' * 100)
+        with self.assertRaises(zlib.error):
+            _decompress(io.BytesIO(compressed[:len(compressed) // 2]), 10 ** 6)
+
+
+class WkbTests(SimpleTestCase):
+
+    def test_point_and_line(self):
+        point = struct.pack('<BIdd', 1, 1, -13.5, 9.25)
+        self.assertEqual(read_wkb(point), {'type': 'Point', 'coordinates': [-13.5, 9.25]})
+        line = struct.pack('>BII4d', 0, 2, 2, 0.0, 1.0, 2.0, 3.0)
+        self.assertEqual(read_wkb(line), {'type': 'LineString', 'coordinates': [[0.0, 1.0], [2.0, 3.0]]})
+
+    def test_multi_geometry(self):
+        members = struct.pack('<BII4d', 1, 2, 2, 0.0, 0.0, 1.0, 1.0) + struct.pack('<BII2d', 1, 2, 1, 5.0, 5.0)
+        multi = struct.pack('<BII', 1, 5, 2) + members
+        self.assertEqual(read_wkb(multi), {
+            'type': 'MultiLineString', 'coordinates': [[[0.0, 0.0], [1.0, 1.0]], [[5.0, 5.0]]],
+        })
+
+    def test_trailer_after_features(self):
+        count = []
+
+        def features():
+            for i in range(3):
+                count.append(i)
+                yield {'type': 'Feature', 'geometry': read_wkb(struct.pack('<BIdd', 1, 1, i, i)), 'properties': {}}
+
+        decoded = decode_geobuf(GeobufEncoder().encode(features(), lambda: {'total': len(count)}))
+        self.assertEqual(decoded['custom'], {'total': 3})
+        self.assertEqual([f['geometry'] for f in decoded['features']], [[0, 0], [1, 1], [2, 2]])
+
+
+class IncompleteKeysTests(SimpleTestCase):
+
+    def test_items_without_full_key_rejected(self):
+        keys = ['login_id', 'device_id', 'sqlite_id']
+        validated = {
+            0: {'login_id': 1, 'device_id': 'a', 'sqlite_id': 5},
+            1: {'login_id': 1, 'device_id': None, 'sqlite_id': 6},
+            2: {'login_id': 1, 'sqlite_id': None},
+        }
+        errors = {}
+        reject_incomplete_keys(validated, errors, keys)
+        self.assertEqual(list(validated), [0])
+        self.assertEqual(list(errors[1]), ['device_id'])
+        self.assertEqual(sorted(errors[2]), ['device_id', 'sqlite_id'])
+
+
+class MobileColumnsTests(SimpleTestCase):
+
+    def test_mobile_names(self):
+        self.assertEqual(mobile_column(get_infrastructure('localites'), 'sqlite_id'), 'api_id')
+        self.assertEqual(mobile_column(get_infrastructure('localites'), 'created_at'), 'date_creation')
+        self.assertEqual(mobile_column(get_infrastructure('points_coupures'), 'cause_coup'), 'causes_coupures')
+        self.assertEqual(mobile_column(get_infrastructure('bacs'), 'x_debut_tr'), 'x_debut_traversee_bac')
+        self.assertEqual(mobile_column(get_infrastructure('ponts'), 'situation'), 'situation_pont')
+        self.assertEqual(mobile_column(get_infrastructure('dalots'), 'situation'), 'situation_dalot')
+        self.assertEqual(mobile_column(get_infrastructure('pistes'), 'id'), 'api_id')
+        self.assertEqual(mobile_column(get_infrastructure('pistes'), 'created_at'), 'created_at')
+        self.assertEqual(mobile_column(get_infrastructure('chaussees'), 'y_fin_chau'), 'y_fin_chaussee')
+        self.assertEqual(mobile_column(get_infrastructure('ponts'), 'code_piste'), 'code_piste')
+
+
+class StreamedFeatureTests(SimpleTestCase):
+
+    def test_geojson_text_copied(self):
+        feature = {'id': 3, 'type': 'Feature', 'geometry': '{"type":"Point","coordinates":[-13.5,9.25]}',
+                   'properties': {'nom': 'Pont "Nord"'}}
+        self.assertEqual(json.loads(feature_bytes(feature)), {
+            'id': 3, 'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [-13.5, 9.25]},
+            'properties': {'nom': 'Pont "Nord"'},
+        })
+
+    def test_geometry_dict_or_null(self):
+        for geometry in (None, {'type': 'Point', 'coordinates': [1, 2]}):
+            feature = {'type': 'Feature', 'geometry': geometry, 'properties': {}}
+            self.assertEqual(json.loads(feature_bytes(feature)), feature)
@@ -0,0 +1,106 @@
+#  - Cache disque borné pour les tuiles vectorielles (MVT)
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+class TileCache:
+    """
+    Cache de tuiles sur disque, borné en taille.
+    Les fichiers sont rangés par niveau de zoom ; au-delà de la taille maximale,
+    les tuiles les plus anciennes (mtime) sont supprimées.
+    """
+
+    def __init__(self, directory, max_bytes, ttl):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._size = None  # taille courante, calculée au premier besoin
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def _path(self, z, key):
+        return self.directory / str(z) / f"{key}.mvt"
+
+    def get(self, z, key):
+        path = self._path(z, key)
+        try:
+            if self.ttl and time.time() - path.stat().st_mtime > self.ttl:
+                return None
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def set(self, z, key, data):
+        path = self._path(z, key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Écriture atomique : un lecteur concurrent ne voit jamais de tuile tronquée
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Écriture cache tuile impossible: {e}")
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        if not self.directory.exists():
+            return []
+        return [p for p in self.directory.glob('*/*.mvt') if p.is_file()]
+
+    def _scan_size(self):
+        total = 0
+        for path in self._files():
+            try:
+                total += path.stat().st_size
+            except OSError:
+                continue
+        return total
+
+    def _evict(self):
+        """Supprime les tuiles les plus anciennes jusqu'à 90% de la taille maximale"""
+        entries = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        size = sum(entry[1] for entry in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, file_size, path in entries:
+            if size <= target:
+                break
+            try:
+                path.unlink()
+                size -= file_size
+            except OSError:
+                continue
+        self._size = size
+
+
+tile_cache = TileCache(
+    getattr(settings, 'MVT_TILE_CACHE_DIR', settings.BASE_DIR / 'cache' / 'tiles'),
+    getattr(settings, 'MVT_TILE_CACHE_MAX_BYTES', 256 * 1024 * 1024),
+    getattr(settings, 'MVT_TILE_CACHE_TTL', 300),
+)
@@ -0,0 +1,142 @@
+#  - Versions de tables et requêtes conditionnelles (ETag / Last-Modified)
+#
+# Les versions sont tenues à jour par trigger (migrations 0005, 0012) dans un
+# journal en insertion seule. Une seule requête sur le journal suffit pour
+# répondre 304 sans exécuter les requêtes de features quand rien n'a changé.
+
+import hashlib
+
+from django.db import connection
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.exceptions import NotAcceptable
+from .models import JournalVersions
+
+
+# Au-delà de ce nombre de lignes pour une table, le journal est compacté
+JOURNAL_COMPACT_ROWS = 200
+
+
+def get_table_versions(tables):
+    """{table: (version, updated_at)} - (0, None) pour une table jamais versionnée"""
+    tables = sorted(set(tables))
+    versions = {table: (0, None) for table in tables}
+    journal = JournalVersions._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT table_name, sum(weight), max(updated_at), count(*) FROM {journal} "
+            f"WHERE table_name = ANY(%s) GROUP BY table_name",
+            [tables]
+        )
+        crowded = []
+        for table_name, version, updated_at, rows in cursor.fetchall():
+            versions[table_name] = (int(version), updated_at)
+            if rows > JOURNAL_COMPACT_ROWS:
+                crowded.append(table_name)
+    if crowded and not connection.in_atomic_block:
+        compact_journal(crowded)
+    return versions
+
+
+def compact_journal(tables):
+    """
+    Regroupe les lignes des transactions terminées (txid < xmin de l'instantané)
+    en une ligne par table, de poids égal à leur somme : la version est inchangée.
+    Instruction unique en autocommit, verrous limités aux lignes regroupées.
+    """
+    journal = JournalVersions._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH removed AS (
+                DELETE FROM {journal}
+                WHERE table_name = ANY(%s) AND txid < txid_snapshot_xmin(txid_current_snapshot())
+                RETURNING table_name, txid, weight, updated_at
+            )
+            INSERT INTO {journal} (table_name, txid, weight, updated_at)
+            SELECT table_name, max(txid), sum(weight), max(updated_at) FROM removed GROUP BY table_name
+            ON CONFLICT (table_name, txid) DO UPDATE SET weight = {journal}.weight + EXCLUDED.weight
+            """,
+            [sorted(tables)]
+        )
+
+
+def versions_key(tables):
+    """Empreinte courte des versions des tables (clés de cache)"""
+    versions = get_table_versions(tables)
+    return ','.join(f"{table}:{version}" for table, (version, _) in versions.items())
+
+
+def compute_validators(tables, variant=''):
+    """
+    (etag, last_modified) pour un ensemble de tables.
+    variant distingue les représentations d'une même ressource (ex: query string).
+    """
+    versions = get_table_versions(tables)
+    digest = hashlib.sha1(repr((sorted(versions.items(), key=lambda item: item[0]), variant))
+                          .encode('utf-8')).hexdigest()
+    dates = [updated_at for _, updated_at in versions.values() if updated_at]
+    last_modified = int(max(dates).timestamp()) if dates else None
+    return f'"{digest}"', last_modified
+
+
+class ConditionalGetMixin:
+    """
+    GET conditionnel pour les vues de lecture.
+    version_tables : tables dont dépend la réponse (par défaut, celle du modèle du queryset).
+    weak_etag : ETag faible (W/"...") pour les corps non identiques octet pour octet
+    d'une réponse à l'autre (horodatage, durée de traitement).
+    """
+    version_tables = None
+    weak_etag = False
+
+    def get_version_tables(self):
+        if self.version_tables is not None:
+            return self.version_tables
+        # Avant l'initialisation DRF : on ne passe pas par get_queryset (query_params)
+        if getattr(self, 'queryset', None) is not None:
+            model = self.queryset.model
+        else:
+            model = self.get_serializer_class().Meta.model
+        return [model._meta.db_table]
+
+    def negotiated_media_type(self, request, **kwargs):
+        """
+        Type de média retenu par la négociation DRF (Accept, ?format=), calculé avant
+        le dispatch : JSON et Geobuf d'une même URL n'ont pas le même ETag.
+        """
+        drf_request = self.initialize_request(request, **kwargs)
+        try:
+            _, media_type = self.get_content_negotiator().select_renderer(
+                drf_request, self.get_renderers(), self.get_format_suffix(**kwargs)
+            )
+        except NotAcceptable:
+            return ''
+        return media_type
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        try:
+            variant = (request.get_full_path(), self.negotiated_media_type(request, **kwargs))
+            etag, last_modified = compute_validators(self.get_version_tables(), variant)
+            if self.weak_etag:
+                etag = f"W/{etag}"
+        except Exception as e:
+            print(f"⚠️ Versions de tables indisponibles: {e}")
+            return super().dispatch(request, *args, **kwargs)
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            patch_vary_headers(not_modified, ('Accept',))
+            return not_modified
+
+        response = super().dispatch(request, *args, **kwargs)
+        # La représentation dépend d'Accept : les caches intermédiaires doivent le savoir
+        patch_vary_headers(response, ('Accept',))
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -1,37 +1,47 @@
 from django.shortcuts import render
 
 # Create your views here.
+from datetime import datetime
+from django.contrib.gis.geos import Polygon
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
 #from django.contrib.gis.db.models.functions import Transform
 from .models import Login
-from .serializers import LoginSerializer, PisteReadSerializer, PisteWriteSerializer
-from .models import Piste
-from .models import (
-    ServicesSantes, AutresInfrastructures, Bacs, BatimentsAdministratifs,
-    Buses, Dalots, Ecoles, InfrastructuresHydrauliques, Localites,
-    Marches, PassagesSubmersibles, Ponts, CommuneRurale, Prefecture, Region, Chaussees,PointsCritiques,PointsCoupures
-)
+from .serializers import LoginSerializer
+from .streaming import StreamingListMixin
+from .fieldsets import SparseFieldsetMixin
+from .versioning import ConditionalGetMixin
+from .renderers import GEOJSON_RENDERER_CLASSES
+from .admin_closure import HIERARCHY_TABLES, commune_closure
+from .registry import get_infrastructure
+from .bulk import bulk_create, bulk_max_items
+from .sync_log import changed_since, current_cursor, parse_cursor
+from .spatial_utils import parse_bbox
+from .models import CommuneRurale, Prefecture, Region
 from .serializers import (
-    ServicesSantesSerializer, AutresInfrastructuresSerializer, BacsSerializer,
-    BatimentsAdministratifsSerializer, BusesSerializer, DalotsSerializer,
-    EcolesSerializer, InfrastructuresHydrauliquesSerializer, LocalitesSerializer,
-    MarchesSerializer, PassagesSubmersiblesSerializer, PontsSerializer, CommuneRuraleSerializer,
-      PrefectureSerializer, RegionSerializer,UserCreateSerializer, UserUpdateSerializer, ChausseesSerializer, PointsCoupuresSerializer,PointsCritiquesSerializer
+    CommuneRuraleSerializer, PrefectureSerializer, RegionSerializer,
+    UserCreateSerializer, UserUpdateSerializer
 )
 
-class RegionsListCreateAPIView(generics.ListCreateAPIView):
+class RegionsListCreateAPIView(SparseFieldsetMixin, StreamingListMixin, ConditionalGetMixin, generics.ListCreateAPIView):
     queryset = Region.objects.all()
     serializer_class = RegionSerializer
+    renderer_classes = GEOJSON_RENDERER_CLASSES
 
-class PrefecturesListCreateAPIView(generics.ListCreateAPIView):
+class PrefecturesListCreateAPIView(SparseFieldsetMixin, StreamingListMixin, ConditionalGetMixin, generics.ListCreateAPIView):
     queryset = Prefecture.objects.all()
     serializer_class = PrefectureSerializer
+    renderer_classes = GEOJSON_RENDERER_CLASSES
 
-class CommunesRuralesListCreateAPIView(generics.ListCreateAPIView):
+class CommunesRuralesListCreateAPIView(SparseFieldsetMixin, StreamingListMixin, ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = CommuneRuraleSerializer
+    renderer_classes = GEOJSON_RENDERER_CLASSES
+    version_tables = ['communes_rurales', 'prefectures', 'regions']
     
     def get_queryset(self):
         queryset = CommuneRurale.objects.select_related(
@@ -46,184 +56,154 @@ class CommunesRuralesListCreateAPIView(generics.ListCreateAPIView):
         
         return queryset.order_by('nom')
 
-# Modifiez toutes vos vues pour qu'elles ressemblent à ceci :
-class ChausseesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = ChausseesSerializer
-
-    def get_queryset(self):
-        qs = Chaussees.objects.all()
-
-        # filtre par commune
-        commune_id = self.request.query_params.get('communes_rurales_id')
-        if commune_id:
-            qs = qs.filter(communes_rurales_id=commune_id)
-
-        # filtre par code_piste (string)
-        code_piste = self.request.query_params.get('code_piste')
-        if code_piste:
-            qs = qs.filter(code_piste_id=code_piste)
-
-        return qs
-
-
-class PointsCoupuresListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = PointsCoupuresSerializer
-
-    def get_queryset(self):
-        qs = PointsCoupures.objects.all()
-
-        # filtre par commune
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            qs = qs.filter(commune_id=commune_id)
-
-        # filtre par chaussée
-        chaussee_id = self.request.query_params.get('chaussee_id')
-        if chaussee_id:
-            qs = qs.filter(chaussee_id=chaussee_id)
-
-        return qs
-
-
-class PointsCritiquesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = PointsCritiquesSerializer
-
-    def get_queryset(self):
-        qs = PointsCritiques.objects.all()
-
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            qs = qs.filter(commune_id=commune_id)
-
-        chaussee_id = self.request.query_params.get('chaussee_id')
-        if chaussee_id:
-            qs = qs.filter(chaussee_id=chaussee_id)
-
-        return qs
-
-
-
-class ServicesSantesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = ServicesSantesSerializer
-    
-    def get_queryset(self):
-        queryset = ServicesSantes.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
+def _project(queryset):
+    """
+    Les clés étrangères vers un champ non clé (code_piste) sont rendues par
+    SlugRelatedField, qui lit l'objet lié : une requête par ligne, géométrie
+    de la piste comprise. Jointure limitée à la seule colonne exposée.
+    """
+    model = queryset.model
+    related = [
+        field for field in model._meta.concrete_fields
+        if field.many_to_one and field.target_field != field.related_model._meta.pk
+    ]
+    if not related:
         return queryset
-
-class AutresInfrastructuresListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = AutresInfrastructuresSerializer
+    return queryset.select_related(*[field.name for field in related]).only(
+        *[field.name for field in model._meta.concrete_fields],
+        *[f"{field.name}__{field.target_field.name}" for field in related]
+    )
+
+
+class InfrastructureListCreateAPIView(SparseFieldsetMixin, StreamingListMixin, ConditionalGetMixin, generics.ListCreateAPIView):
+    """
+    Liste / création générique pour un type du registre des infrastructures
+    (une route /api/<type>/ par type, voir urls.py).
+    POST d'un tableau JSON : création en lot, résultat {fid | errors} par élément
+    (?upsert=1 : écriture idempotente, un envoi rejoué ne crée pas de doublons).
+    Filtres communs à tous les types :
+      commune_id (ou communes_rurales_id), prefecture_id, region_id,
+      bbox=minx,miny,maxx,maxy,
+      updated_since=<curseur> (en-tête X-Sync-Cursor de l'appel précédent ; suppressions
+      via /api/sync/deletions/) ou updated_since=AAAA-MM-JJ[THH:MM:SS]
+    plus les filtres propres au type (extra_filters du registre).
+    ?fields= / ?geometry=none|point|bbox|simplified : voir fieldsets.
+    """
+    infrastructure = None  # type du registre, fixé par as_view()
+    renderer_classes = GEOJSON_RENDERER_CLASSES
     
-    def get_queryset(self):
-        queryset = AutresInfrastructures.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
-
-class BacsListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = BacsSerializer
+    @property
+    def entry(self):
+        return get_infrastructure(self.infrastructure)
     
-    def get_queryset(self):
-        queryset = Bacs.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
-
-class BatimentsAdministratifsListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = BatimentsAdministratifsSerializer
+    def get_version_tables(self):
+        tables = [self.entry['model']._meta.db_table]
+        if 'prefecture_id' in self.request.GET or 'region_id' in self.request.GET:
+            tables += HIERARCHY_TABLES
+        return tables
     
-    def get_queryset(self):
-        queryset = BatimentsAdministratifs.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
-
-class BusesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = BusesSerializer
-    
-    def get_queryset(self):
-        queryset = Buses.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
-
-class DalotsListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = DalotsSerializer
-    
-    def get_queryset(self):
-        queryset = Dalots.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
-
-class EcolesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = EcolesSerializer
-    
-    def get_queryset(self):
-        queryset = Ecoles.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
-
-class InfrastructuresHydrauliquesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = InfrastructuresHydrauliquesSerializer
-    
-    def get_queryset(self):
-        queryset = InfrastructuresHydrauliques.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
-
-class LocalitesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = LocalitesSerializer
-    
-    def get_queryset(self):
-        queryset = Localites.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
+    def get_serializer_class(self):
+        if self.request.method != 'GET' and self.entry.get('write_serializer'):
+            return self.entry['write_serializer']
+        return self.entry['serializer']
+
+    def create(self, request, *args, **kwargs):
+        """
+        Un objet : création classique. Un tableau : création en lot (résultat par élément).
+        ?upsert=1 : écriture idempotente sur (login_id, device_id, sqlite_id), champs alors
+        obligatoires ; un objet seul est traité comme un tableau d'un élément.
+        """
+        upsert = request.query_params.get('upsert') in ('1', 'true')
+        if not isinstance(request.data, list) and not upsert:
+            return super().create(request, *args, **kwargs)
+
+        items = request.data if isinstance(request.data, list) else [request.data]
+        if len(items) > bulk_max_items():
+            return Response(
+                {'error': f"Au plus {bulk_max_items()} éléments par envoi ({len(items)} reçus)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        results = bulk_create(self.entry, items, self.get_serializer_context(), upsert=upsert)
+        created = sum(1 for result in results if 'fid' in result)
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {'created': created, 'rejected': len(results) - created, 'results': results},
+            status=response_status
+        )
 
-class MarchesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = MarchesSerializer
-    
-    def get_queryset(self):
-        queryset = Marches.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        # Lu avant la requête de données : rien d'écrit entre-temps n'est perdu
+        cursor = current_cursor()
+        response = super().list(request, *args, **kwargs)
+        response['X-Sync-Cursor'] = str(cursor)
+        return response
 
-class PassagesSubmersiblesListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = PassagesSubmersiblesSerializer
-    
     def get_queryset(self):
-        queryset = PassagesSubmersibles.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
+        entry = self.entry
+        model = entry['model']
+        params = self.request.query_params
+        commune_field = entry.get('commune_field', 'commune_id')
+        # Ordre par clé primaire : pages (keyset) et flux stables
+        queryset = _project(model.objects.order_by(model._meta.pk.name))
+        
+        commune_id = params.get('commune_id') or params.get('communes_rurales_id')
+        prefecture_id = params.get('prefecture_id')
+        region_id = params.get('region_id')
+        try:
+            if commune_id:
+                queryset = queryset.filter(**{commune_field: int(commune_id)})
+            elif prefecture_id:
+                queryset = queryset.filter(**{f"{commune_field}__in": commune_closure.communes_of_prefecture(prefecture_id)})
+            elif region_id:
+                queryset = queryset.filter(**{f"{commune_field}__in": commune_closure.communes_of_region(region_id)})
+        except ValueError:
+            raise ValidationError({'detail': 'Identifiant de commune, préfecture ou région invalide'})
+        
+        if params.get('bbox'):
+            bbox, bbox_error = parse_bbox(params.get('bbox'))
+            if bbox_error:
+                raise ValidationError({'detail': bbox_error})
+            # Opérateur && servi par l'index GiST sur geom
+            queryset = queryset.filter(geom__bboverlaps=Polygon.from_bbox(bbox))
+        
+        if params.get('updated_since'):
+            cursor = parse_cursor(params.get('updated_since'))
+            if cursor is not None:
+                # Curseur X-Sync-Cursor d'un appel précédent : index sur sync_txid
+                queryset = changed_since(queryset, cursor)
+            elif entry.get('updated_field'):
+                queryset = queryset.filter(**{
+                    f"{entry['updated_field']}__gte": self._parse_updated_since(params.get('updated_since'))
+                })
+        
+        for param, field in entry.get('extra_filters', {}).items():
+            if params.get(param):
+                queryset = queryset.filter(**{field: params.get(param)})
+        
         return queryset
-
-class PontsListCreateAPIView(generics.ListCreateAPIView):
-    serializer_class = PontsSerializer
     
-    def get_queryset(self):
-        queryset = Ponts.objects.all()
-        commune_id = self.request.query_params.get('commune_id')
-        if commune_id:
-            queryset = queryset.filter(commune_id=commune_id)
-        return queryset
-
-
+    def _parse_updated_since(self, value):
+        """Valeur comparable au champ de modification (texte 'AAAA-MM-JJ HH:MM:SS' ou datetime)"""
+        try:
+            moment = parse_datetime(value.replace(' ', 'T'))
+            if moment is None:
+                day = parse_date(value)
+                moment = datetime.combine(day, datetime.min.time()) if day else None
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({'detail': 'updated_since invalide (AAAA-MM-JJ ou AAAA-MM-JJTHH:MM:SS)'})
+        if self.entry.get('updated_is_varchar'):
+            # Dates stockées en texte au format du mobile : l'ordre lexical suit l'ordre chronologique
+            return moment.strftime('%Y-%m-%d %H:%M:%S')
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
 
 
 class LoginAPIView(APIView):
@@ -253,28 +233,6 @@ class LoginAPIView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class PisteListCreateAPIView(generics.ListCreateAPIView):
-
-    def get_queryset(self):
-        qs = Piste.objects.all()
-
-        commune_id = self.request.query_params.get('communes_rurales_id')
-        if commune_id:
-            qs = qs.filter(communes_rurales_id=commune_id)
-
-        
-        return qs
-
-    def get_serializer_class(self):
-        # GET => serializer lecture (expose geom_4326)
-        if self.request.method == 'GET':
-            return PisteReadSerializer
-        
-        return PisteWriteSerializer
-
-    def perform_create(self, serializer):
-        serializer.save()
-
 class UserManagementAPIView(APIView):
     """API dédiée à la gestion des utilisateurs par le super_admin"""
     
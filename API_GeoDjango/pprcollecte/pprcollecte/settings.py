@@ -128,6 +128,71 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Geobuf (api.renderers.GeobufRenderer) : uniquement sur les vues GeoJSON,
+    # via GEOJSON_RENDERER_CLASSES
+    # Pagination par clé, activée quand le client envoie page_size ou cursor
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.GeoJsonKeysetPagination',
+    'PAGE_SIZE': 500,
+}
+KEYSET_MAX_PAGE_SIZE = 5000
+
+# Tuiles vectorielles (MVT) : cache disque borné
+MVT_TILE_CACHE_DIR = BASE_DIR / 'cache' / 'tiles'
+MVT_TILE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+MVT_TILE_CACHE_TTL = 300  # secondes (les écritures invalident via les versions de tables)
+
+# /api/collectes/?cluster=1 : rayon de regroupement des points (pixels) et
+# zoom utilisé lorsque le client n'en fournit pas
+COLLECTES_CLUSTER_RADIUS_PX = 60
+COLLECTES_CLUSTER_DEFAULT_ZOOM = 6
+
+# /api/collectes/ : nombre de requêtes de couches exécutées en parallèle
+# (1 = une seule requête UNION ALL, défaut). Au-delà, chaque worker garde sa propre
+# connexion PostgreSQL : max_connections à dimensionner pour processus x workers.
+COLLECTES_QUERY_WORKERS = 1
+
+# Cache en mémoire des réponses /api/collectes/ (par processus, borné en octets)
+COLLECTES_RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Fermeture région/préfecture -> communes en mémoire : intervalle de vérification de version (s)
+ADMIN_CLOSURE_CHECK_INTERVAL = 5
+
+# /api/geography/hierarchy/ : durée de cache client (s), revalidation par ETag ensuite
+GEOGRAPHY_HIERARCHY_MAX_AGE = 24 * 3600
+
+# /api/geography/nodes/ : durée de cache client (s), les comptages évoluent avec les collectes
+GEOGRAPHY_NODES_MAX_AGE = 300
+
+# /api/geography/locate/ : nombre maximal de points par appel
+LOCATE_MAX_POINTS = 10000
+
+# Ingestion : commune déduite de la géométrie (index de localisation en mémoire)
+AUTO_ASSIGN_COMMUNE = True
+
+# Création en lot (POST d'un tableau sur /api/<type>/) : taille maximale et lots d'INSERT
+BULK_CREATE_MAX_ITEMS = 5000
+BULK_CREATE_BATCH_SIZE = 500
+
+# /api/sync/upload/ : taille maximale du document décompressé (octets)
+SYNC_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+
+# /api/communes/<id>/package/ : paquets hors ligne (GeoPackage), un fichier par commune
+# reconstruit en arrière-plan quand les données de la commune changent
+COMMUNE_PACKAGE_DIR = BASE_DIR / 'cache' / 'packages'
+# Délai (s) conseillé au client (Retry-After) pendant la construction du premier paquet
+COMMUNE_PACKAGE_RETRY_AFTER = 10
+
+# Nombre de décimales des coordonnées GeoJSON par défaut (?precision= pour changer)
+GEOJSON_COORD_PRECISION = 6
+
+# Réponses en flux (?stream=1) : nombre de lignes lues par lot sur le curseur serveur
+STREAMING_CHUNK_SIZE = 2000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 